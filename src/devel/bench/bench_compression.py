@@ -0,0 +1,60 @@
+# Per-file compression benchmark
+# Run from src/: python devel/bench/bench_compression.py
+import os, sys
+import time
+import random
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualfs import File, Blob, COMPRESSION_CODECS, decompressed_cache
+
+FILES = 100
+LINES = 2000
+
+
+def make_log(seed):
+    rng = random.Random(seed)
+    levels = ["INFO", "DEBUG", "WARN", "ERROR"]
+    lines = []
+    for i in range(LINES):
+        lines.append(f"[2024-05-09 12:{i % 60:02d}:{rng.randrange(60):02d}] {rng.choice(levels)} "
+                     f"pid={rng.randrange(100, 999)} request {rng.randrange(10**6)} served in {rng.random():.4f}s")
+    return "\n".join(lines)
+
+
+def run(codec, contents):
+    decompressed_cache.clear()
+    start = time.perf_counter()
+    files = [File(f"log{i}", content, compression=codec) for i, content in enumerate(contents)]
+    write_time = time.perf_counter() - start
+
+    stored = sum(file.blob.stored_size() for file in files)
+
+    # Cold reads: nothing cached
+    decompressed_cache.clear()
+    start = time.perf_counter()
+    for file in files:
+        file.read()
+    cold_time = time.perf_counter() - start
+
+    # Hot reads: the same few files over and over, after one warming pass
+    for file in files[:8]:
+        file.read()
+    start = time.perf_counter()
+    for _ in range(50):
+        for file in files[:8]:
+            file.read()
+    hot_time = time.perf_counter() - start
+
+    return stored, write_time, cold_time, hot_time
+
+
+if __name__ == "__main__":
+    contents = [make_log(i) for i in range(FILES)]
+    total = sum(len(content) for content in contents)
+    print(f"{FILES} files, {total / 1024 / 1024:.1f} MiB of log text, threshold {Blob.compression_threshold} chars\n")
+    print(f"{'codec':<6} {'stored MiB':>10} {'ratio':>6} {'write ms':>9} {'cold read ms':>13} {'hot read us':>12}")
+    for codec in [None] + list(COMPRESSION_CODECS):
+        stored, write_time, cold_time, hot_time = run(codec, contents)
+        print(f"{codec or 'none':<6} {stored / 1024 / 1024:>10.2f} {total / stored:>6.1f} "
+              f"{write_time * 1000:>9.1f} {cold_time * 1000:>13.1f} {hot_time / 400 * 1e6:>12.2f}")
@@ -0,0 +1,102 @@
+# Concurrency stress test and benchmark for the VFS reader-writer lock
+# Run from src/: python devel/bench/bench_concurrency.py
+#
+# N threads run a mixed workload (reads, listings, creates, appends,
+# renames, removes) against one VirtualFileSystem. Afterwards the tree is
+# checked: fsck must be clean and every directory's sorted name index must
+# agree with its entries.
+import os, sys
+import time
+import random
+import threading
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualfs import VirtualFileSystem, Directory
+from vsystem.virtualfsck import FileSystemChecker
+
+OPERATIONS_PER_THREAD = 4000
+THREAD_COUNTS = (1, 2, 4, 8)
+DIRECTORIES = 16
+WRITE_RATIO = 0.2
+
+
+def worker(fs, seed, counts, errors):
+    rng = random.Random(seed)
+    for index in range(OPERATIONS_PER_THREAD):
+        directory = f"/stress/d{rng.randrange(DIRECTORIES)}"
+        path = f"{directory}/f{rng.randrange(50)}"
+        try:
+            if rng.random() < WRITE_RATIO:
+                operation = rng.randrange(4)
+                if operation == 0:
+                    fs.update_file(path, f"{seed}:{index}\n")
+                elif operation == 1:
+                    fs.write_file(path, f"{seed}:{index}\n")
+                elif operation == 2:
+                    fs.rename_file(path, f"{directory}/f{rng.randrange(50)}")
+                else:
+                    fs.remove_file(path)
+                counts["writes"] += 1
+            else:
+                if rng.random() < 0.5:
+                    fs.read_file(path)
+                else:
+                    with fs.lock.reading():
+                        fs.find_directory(fs.root, directory).list_entries(0, 20)
+                counts["reads"] += 1
+        except (FileNotFoundError, FileExistsError):
+            # Another thread got there first, expected under contention
+            counts["misses"] += 1
+        except Exception as e:
+            errors.append(repr(e))
+
+
+def check_invariants(fs):
+    problems = []
+    stack = [fs.root]
+    while stack:
+        directory = stack.pop()
+        for table in (directory.files, directory.subdirectories):
+            if list(table.names) != sorted(table):
+                problems.append(f"{directory.get_full_path()}: name index out of sync")
+        for file in directory.files.values():
+            if file.parent is not directory and getattr(file, "nlink", 1) == 1:
+                problems.append(f"{directory.get_full_path()}/{file.name}: bad parent")
+        stack.extend(directory.subdirectories.values())
+    report = FileSystemChecker(fs).check("/")
+    problems += [f"{path}: {message}" for path, message in report.errors]
+    return problems
+
+
+def run(thread_count):
+    fs = VirtualFileSystem()
+    for index in range(DIRECTORIES):
+        fs.create_directory(f"/stress/d{index}")
+    counts = {"reads": 0, "writes": 0, "misses": 0}
+    errors = []
+    threads = [threading.Thread(target=worker, args=(fs, seed, counts, errors)) for seed in range(thread_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    problems = errors + check_invariants(fs)
+    operations = thread_count * OPERATIONS_PER_THREAD
+    print(f"{thread_count:>2} thread(s): {operations / elapsed:10.0f} ops/s  "
+          f"({counts['reads']} reads, {counts['writes']} writes, {counts['misses']} misses)  "
+          f"{'OK' if not problems else f'{len(problems)} problem(s)'}")
+    for problem in problems[:10]:
+        print("   ", problem)
+    return not problems
+
+
+def main():
+    # Counters in run() are shared unlocked; they are approximate under contention
+    results = [run(thread_count) for thread_count in THREAD_COUNTS]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
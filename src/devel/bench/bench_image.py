@@ -0,0 +1,80 @@
+# File system image benchmark: legacy JSON+gzip against the binary image
+# Run from src/: python devel/bench/bench_image.py
+import os, sys
+import io
+import gzip
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualfs import VirtualFileSystem, Directory, File
+from vsystem.virtualimage import ImageReader, ImageWriter
+
+DIRECTORIES = 200
+FILES_PER_DIRECTORY = 50
+FILE_SIZE = 2048
+
+
+def build_tree():
+    rng = random.Random(0)
+    words = ["kernel", "vfs", "process", "dmesg", "qshell", "blob", "inode", "user", "home", "bin"]
+    root = Directory("")
+    for d in range(DIRECTORIES):
+        directory = Directory(f"dir{d}")
+        root.add_directory(directory)
+        for f in range(FILES_PER_DIRECTORY):
+            text = " ".join(rng.choice(words) for _ in range(FILE_SIZE // 6))[:FILE_SIZE]
+            directory.add_file(File(f"file{f}", text))
+    return root
+
+
+def measure(func):
+    # Timed and traced separately, tracemalloc slows down allocation-heavy code
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def save_json(fs, path):
+    with gzip.open(path, 'wb') as file:
+        file.write(json.dumps(fs._encode_directory(fs.root)).encode('utf-8'))
+
+
+def load_json(fs, path):
+    with gzip.open(path, 'rb') as file:
+        return fs._decode_directory(json.loads(file.read().decode('utf-8')))
+
+
+def save_binary(fs, path):
+    with gzip.open(path, 'wb', compresslevel=6) as file:
+        with io.BufferedWriter(file, buffer_size=256 * 1024) as stream:
+            ImageWriter(stream).write(fs.root)
+
+
+def load_binary(fs, path):
+    with gzip.open(path, 'rb') as file:
+        return ImageReader(file).read()
+
+
+if __name__ == "__main__":
+    fs = VirtualFileSystem()
+    fs.root = build_tree()
+    content = DIRECTORIES * FILES_PER_DIRECTORY * FILE_SIZE
+    print(f"{DIRECTORIES * FILES_PER_DIRECTORY} files, {content / 1024 / 1024:.1f} MiB of content\n")
+    print(f"{'format':<8} {'size KiB':>9} {'save ms':>8} {'save peak MiB':>14} {'load ms':>8} {'load peak MiB':>14}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, save, load in [("json", save_json, load_json), ("binary", save_binary, load_binary)]:
+            path = os.path.join(temp_dir, name)
+            save_time, save_peak = measure(lambda: save(fs, path))
+            load_time, load_peak = measure(lambda: load(fs, path))
+            print(f"{name:<8} {os.path.getsize(path) / 1024:>9.0f} {save_time * 1000:>8.0f} {save_peak / 1024 / 1024:>14.1f} "
+                  f"{load_time * 1000:>8.0f} {load_peak / 1024 / 1024:>14.1f}")
@@ -0,0 +1,137 @@
+# IPC benchmark: producer/consumer throughput of pipes, queues and rings
+# Run from src/: python devel/bench/bench_ipc.py
+#
+# Streams TOTAL bytes through a 64 KiB Pipe between two threads and between
+# two scheduled processes, MESSAGES messages through a bounded MessageQueue,
+# and TOTAL bytes through a SharedRing from a process pool worker. Every
+# transfer must arrive complete.
+import os, sys
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualipc import Pipe, MessageQueue, SharedRing
+from vsystem.virtualsched import VirtualScheduler
+
+TOTAL = 64 * 1024 * 1024
+CHUNK = 16 * 1024
+MESSAGES = 200_000
+
+
+def report(name, start, amount, unit):
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {amount / elapsed:>12,.0f} {unit}/s  ({elapsed:.2f}s)")
+
+
+def pipe_threads():
+    pipe = Pipe()
+    received = [0]
+
+    def consume():
+        while True:
+            data = pipe.read(CHUNK)
+            if not data:
+                break
+            received[0] += len(data)
+
+    consumer = threading.Thread(target=consume)
+    start = time.perf_counter()
+    consumer.start()
+    chunk = b"x" * CHUNK
+    for _ in range(TOTAL // CHUNK):
+        pipe.write(chunk)
+    pipe.close()
+    consumer.join()
+    report("pipe, threads", start, TOTAL / 2 ** 20, "MiB")
+    return received[0] == TOTAL
+
+
+def pipe_scheduled():
+    scheduler = VirtualScheduler().start()
+    pipe = Pipe()
+    chunk = b"x" * CHUNK
+
+    async def produce(process):
+        for _ in range(TOTAL // CHUNK):
+            await process.wait(pipe.write_async(chunk))
+        pipe.close()
+
+    async def consume(process):
+        received = 0
+        while True:
+            data = await process.wait(pipe.read_async(CHUNK))
+            if not data:
+                return received
+            received += len(data)
+
+    start = time.perf_counter()
+    producer = scheduler.spawn(1, "producer", produce)
+    consumer = scheduler.spawn(2, "consumer", consume)
+    producer.future.result()
+    received = consumer.future.result()
+    report("pipe, scheduled", start, TOTAL / 2 ** 20, "MiB")
+    scheduler.stop()
+    return received == TOTAL
+
+
+def queue_threads():
+    queue = MessageQueue()
+    received = [0]
+
+    def consume():
+        try:
+            while True:
+                received[0] += queue.receive()
+        except EOFError:
+            pass
+
+    consumer = threading.Thread(target=consume)
+    start = time.perf_counter()
+    consumer.start()
+    for _ in range(MESSAGES):
+        queue.send(1)
+    queue.close()
+    consumer.join()
+    report("queue, threads", start, MESSAGES, "msg")
+    return received[0] == MESSAGES
+
+
+def ring_producer(ring, total):
+    chunk = memoryview(b"x" * CHUNK)
+    sent = 0
+    while sent < total:
+        written = ring.write(chunk[:total - sent])
+        if not written:
+            time.sleep(0)
+        sent += written
+    return sent
+
+
+def ring_worker():
+    ring = SharedRing(None, 1024 * 1024)
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        executor.submit(pow, 2, 2).result()  # Worker startup is not measured
+        start = time.perf_counter()
+        future = executor.submit(ring_producer, ring, TOTAL)
+        received = 0
+        while received < TOTAL:
+            data = ring.read()
+            if not data:
+                time.sleep(0)
+            received += len(data)
+        future.result()
+        report("ring, process worker", start, TOTAL / 2 ** 20, "MiB")
+    ring.close()
+    return received == TOTAL
+
+
+def main():
+    results = [pipe_threads(), pipe_scheduled(), queue_threads(), ring_worker()]
+    print("OK" if all(results) else "FAILED")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+# Directory listing benchmark: paging through a spool-sized directory
+# Run from src/: python devel/bench/bench_listing.py
+import os, sys
+import time
+import random
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualfs import Directory, File
+
+ENTRIES = 100000
+PAGE_SIZE = 100
+
+
+def timed(label, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<40} {elapsed * 1000:10.3f} ms")
+    return result
+
+
+def main():
+    rng = random.Random(0)
+    names = [f"spool-{rng.getrandbits(40):012x}.log" for _ in range(ENTRIES)]
+    spool = Directory("spool")
+
+    def fill():
+        for name in names:
+            spool.add_file(File(name, "x"))
+
+    timed(f"insert {ENTRIES} entries", fill)
+    timed("sort all names per call (old ls)", lambda: sorted(spool.files), repeat=10)
+    timed("full sorted listing", lambda: spool.list_entries(), repeat=10)
+    timed(f"page of {PAGE_SIZE} at offset 0", lambda: spool.list_entries(0, PAGE_SIZE), repeat=1000)
+    timed(f"page of {PAGE_SIZE} at offset {ENTRIES // 2}", lambda: spool.list_entries(ENTRIES // 2, PAGE_SIZE), repeat=1000)
+    timed("prefix 'spool-fff'", lambda: spool.list_entries(prefix="spool-fff"), repeat=1000)
+    timed("range ['spool-8', 'spool-9')", lambda: spool.list_entries(start="spool-8", stop="spool-9"), repeat=100)
+    timed(f"remove {ENTRIES // 10} entries", lambda: [spool.remove_file(name) for name in names[:ENTRIES // 10]])
+
+    # The index must agree with the dict after all of the above
+    assert list(spool.files.names) == sorted(spool.files)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Process table benchmark: spawn and kill 10^5 virtual processes
+# Run from src/: python devel/bench/bench_procs.py
+#
+# Spawns PROCESSES processes through VirtualKernel.create_process, half of
+# them children of a shell process, looks every program name up in the
+# name index, then kills them all and spawns them again to exercise PID
+# reuse. The table must end up empty apart from the parent.
+import os, sys
+import time
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualkernel import VirtualKernel, VirtualProcess, ProcessList, KernelMessage
+from vsystem.virtuallog import kernel_log, WARNING
+
+PROCESSES = 100_000
+PROGRAMS = 50
+
+
+def spawn(kernel, parent):
+    return [kernel.create_process(f"job{index % PROGRAMS}", True, None, parent if index % 2 else 0)
+            for index in range(PROCESSES)]
+
+
+def main():
+    # Keep the benchmark out of the real dmesg
+    kernel_log(KernelMessage.dmesg_file).level = WARNING
+    kernel = VirtualKernel.__new__(VirtualKernel)
+    shell = kernel.create_process("bench-shell", True)
+
+    for round_number in (1, 2):
+        start = time.perf_counter()
+        pids = spawn(kernel, shell)
+        spawned = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = sum(len(ProcessList.find_by_name(f"job{index}")) for index in range(PROGRAMS))
+        lookups = time.perf_counter() - start
+
+        children = len(ProcessList.get_children(shell))
+        start = time.perf_counter()
+        for pid in pids:
+            VirtualProcess.kill_process(kernel, pid)
+        killed = time.perf_counter() - start
+
+        ok = (found == PROCESSES and children == PROCESSES // 2 and len(set(pids)) == PROCESSES
+              and list(ProcessList.running_processes) == [shell] and not ProcessList.get_children(shell))
+        print(f"round {round_number}: spawn {PROCESSES / spawned:9.0f}/s  kill {PROCESSES / killed:9.0f}/s  "
+              f"name lookups {lookups * 1000:.2f} ms  pids {min(pids)}-{max(pids)}  {'OK' if ok else 'FAILED'}")
+        if not ok:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
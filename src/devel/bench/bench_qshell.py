@@ -0,0 +1,79 @@
+# QShell benchmark: a loop-heavy script
+# Run from src/: python devel/bench/bench_qshell.py
+#
+# Compiles SCRIPT cold and from the cache, then runs it RUNS times as qscript
+# would (cache lookup and execution). Checks the script's result against the
+# same computation in Python and reports how much of a run the cache saves.
+import os, sys
+import time
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualqshell import QShellInterpreter, Compiler, compile_script, parse
+
+ITERATIONS = 20_000
+RUNS = 5
+
+SCRIPT = """
+# Sum with branches, then a for loop over a range
+set total = 0
+set i = 0
+while $i < %d
+    if $i %% 3 == 0
+        set total = $total + $i
+    elif $i %% 5 == 0 and $i != 10
+        set total = $total - 1
+    else
+        set total = $total + 1
+    end
+    set i = $i + 1
+end
+set names = ""
+for j in 1..1000
+    if $j %% 100 != 0; continue; end
+    set names = "$names $j"
+end
+echo $total $names
+""" % ITERATIONS
+
+
+def expected():
+    total = 0
+    for i in range(ITERATIONS):
+        if i % 3 == 0:
+            total += i
+        elif i % 5 == 0 and i != 10:
+            total -= 1
+        else:
+            total += 1
+    # The unquoted $names is split into words again
+    return " ".join([str(total)] + [str(j) for j in range(100, 1001, 100)])
+
+
+def main():
+    start = time.perf_counter()
+    code = Compiler().compile(parse(SCRIPT))
+    cold = time.perf_counter() - start
+    compile_script(SCRIPT)
+    start = time.perf_counter()
+    for _ in range(1000):
+        compile_script(SCRIPT)
+    cached = (time.perf_counter() - start) / 1000
+    print(f"compile {cold * 1e6:.0f} us cold, {cached * 1e6:.1f} us cached, "
+          f"{len(code.instructions)} instructions")
+
+    output = []
+    interpreter = QShellInterpreter()
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        interpreter.execute_script(SCRIPT, None, output.append)
+    run = (time.perf_counter() - start) / RUNS
+    print(f"run     {run * 1e3:.1f} ms/run, {run / ITERATIONS * 1e6:.2f} us/iteration")
+
+    ok = all(line == expected() for line in output) and len(output) == RUNS
+    print("OK" if ok else f"FAILED: {output[0]!r} != {expected()!r}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
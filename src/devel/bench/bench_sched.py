@@ -0,0 +1,107 @@
+# Scheduler benchmark: context switches per second and fairness
+# Run from src/: python devel/bench/bench_sched.py
+#
+# 1. PROCESSES processes each yield YIELDS times with a zero time slice, so
+#    every yield is a context switch.
+# 2. Three CPU-bound processes at nice -5, 0 and 5 spin for a while; their
+#    CPU shares should follow the priority weights.
+# 3. An interactive process wakes every 10 ms while BACKGROUND busy jobs
+#    run; its wakeup latency should stay around one time slice.
+import os, sys
+import time
+import asyncio
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualsched import VirtualScheduler, nice_weight, INTERACTIVE
+
+PROCESSES = 10_000
+YIELDS = 20
+BACKGROUND = 200
+
+
+def wait_all(processes):
+    for process in processes:
+        process.future.result()
+
+
+def context_switches():
+    scheduler = VirtualScheduler(time_slice=0).start()
+
+    async def job(process):
+        for _ in range(YIELDS):
+            await process.yield_now()
+
+    start = time.perf_counter()
+    processes = [scheduler.spawn(pid, "yield", job) for pid in range(PROCESSES)]
+    wait_all(processes)
+    elapsed = time.perf_counter() - start
+    print(f"{PROCESSES} processes x {YIELDS} yields: {scheduler.switches / elapsed:10.0f} switches/s "
+          f"({scheduler.switches} switches in {elapsed:.2f}s)")
+    scheduler.stop()
+    return scheduler.switches >= PROCESSES * YIELDS
+
+
+def fairness(duration=1.5):
+    scheduler = VirtualScheduler(time_slice=0.002).start()
+    deadline = time.perf_counter() + duration
+
+    async def spin(process):
+        while time.perf_counter() < deadline:
+            await process.yield_now()
+
+    processes = [scheduler.spawn(pid, f"nice{nice}", spin, nice) for pid, nice in enumerate((-5, 0, 5))]
+    wait_all(processes)
+    total_cpu = sum(process.cpu_time for process in processes)
+    total_weight = sum(process.weight for process in processes)
+    ok = True
+    for process in processes:
+        share = process.cpu_time / total_cpu
+        expected = process.weight / total_weight
+        ok = ok and abs(share - expected) < 0.05
+        print(f"  nice {process.priority:>3}: {share:6.1%} of CPU (weight share {expected:6.1%})")
+    scheduler.stop()
+    return ok
+
+
+def interactive_latency(rounds=50):
+    scheduler = VirtualScheduler().start()
+    stop = []
+
+    async def busy(process):
+        while not stop:
+            sum(range(2000))
+            await process.yield_now()
+
+    latencies = []
+
+    async def shell(process):
+        for _ in range(rounds):
+            wanted = time.perf_counter() + 0.01
+            await process.sleep(0.01)
+            latencies.append(time.perf_counter() - wanted)
+
+    background = [scheduler.spawn(pid, "busy", busy, 5) for pid in range(BACKGROUND)]
+    scheduler.spawn(BACKGROUND, "shell", shell, INTERACTIVE).future.result()
+    stop.append(True)
+    wait_all(background)
+    latencies.sort()
+    median, worst = latencies[len(latencies) // 2], latencies[-1]
+    print(f"  shell wakeup latency with {BACKGROUND} busy jobs: median {median * 1000:.1f} ms, "
+          f"max {worst * 1000:.1f} ms (time slice {scheduler.time_slice * 1000:.0f} ms)")
+    scheduler.stop()
+    return median < 3 * scheduler.time_slice
+
+
+def main():
+    results = [context_switches()]
+    print("fairness:")
+    results.append(fairness())
+    print("interactive:")
+    results.append(interactive_latency())
+    print("OK" if all(results) else "FAILED")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Shared-memory VFS view benchmark: grep and hashing fanned out to a process pool
+# Run from src/: python devel/bench/bench_shared.py
+import os, sys
+import re
+import time
+import pickle
+import hashlib
+import random
+from multiprocessing import Pool
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualfs import VirtualFileSystem
+from vsystem.virtualshm import SharedTree, SharedTreeReader
+
+DIRECTORIES = 50
+FILES_PER_DIRECTORY = 100
+FILE_SIZE = 8192
+PATTERN = re.compile(b"needle")
+
+reader = None
+
+
+def attach(name):
+    global reader
+    reader = SharedTreeReader(name)
+
+
+def scan(indexes):
+    # Works on the shared block in place: no file content is pickled
+    matches = 0
+    digest = hashlib.sha256()
+    for index in indexes:
+        with reader.content(index) as view:
+            matches += len(PATTERN.findall(view))
+            digest.update(view)
+    return matches, digest.hexdigest()
+
+
+def build(fs):
+    rng = random.Random(0)
+    words = ["kernel", "vfs", "process", "dmesg", "qshell", "blob", "inode", "needle"]
+    for d in range(DIRECTORIES):
+        fs.create_directory(f"/bench/d{d}")
+        for f in range(FILES_PER_DIRECTORY):
+            text = " ".join(rng.choice(words) for _ in range(FILE_SIZE // 6))[:FILE_SIZE]
+            fs.create_file(f"/bench/d{d}/f{f}", text)
+
+
+def main():
+    fs = VirtualFileSystem()
+    build(fs)
+    # A detached copy, the live directory's parent pointer would drag in the whole tree
+    directory = fs.read_snapshot("/bench")
+
+    start = time.perf_counter()
+    pickled = pickle.dumps(directory, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"pickle whole tree:       {len(pickled) / 1e6:8.2f} MB in {time.perf_counter() - start:.3f} s (per worker)")
+
+    start = time.perf_counter()
+    tree = SharedTree(fs, "/bench")
+    print(f"export to shared memory: {tree.size / 1e6:8.2f} MB in {time.perf_counter() - start:.3f} s (once)")
+
+    try:
+        attach(tree.name)
+        indexes = [index for _, index in reader.files("/")]
+        start = time.perf_counter()
+        expected = scan(indexes)[0]
+        print(f"single process scan:     {time.perf_counter() - start:.3f} s, {expected} matches")
+
+        workers = os.cpu_count() or 1
+        chunks = [indexes[offset::workers] for offset in range(workers)]
+        with Pool(workers, initializer=attach, initargs=(tree.name,)) as pool:
+            start = time.perf_counter()
+            results = pool.map(scan, chunks)
+            elapsed = time.perf_counter() - start
+        total = sum(matches for matches, _ in results)
+        print(f"pool scan ({workers} workers):   {elapsed:.3f} s, {total} matches")
+        assert total == expected
+        reader.close()
+    finally:
+        tree.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Timer wheel benchmark: 10^5 pending timers
+# Run from src/: python devel/bench/bench_timers.py
+#
+# Arms TIMERS timers spread over a day, cancels half of them, then idles for
+# IDLE seconds while a handful of short timers fire. Reports the cost of
+# insert and cancel, how late the short timers fired and the CPU time the
+# process used while idle.
+import os, sys
+import time
+import random
+
+sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-3]))
+
+from vsystem.virtualtimer import TimerWheel
+
+TIMERS = 100_000
+IDLE = 5.0
+SHORT = [0.05, 0.5, 1.0, 2.0, 3.0, 4.5]
+
+
+def main():
+    wheel = TimerWheel().start()
+    start = time.perf_counter()
+    timers = [wheel.call_later(random.uniform(60, 86400), lambda: None) for _ in range(TIMERS)]
+    insert = time.perf_counter() - start
+    start = time.perf_counter()
+    for timer in timers[::2]:
+        wheel.cancel(timer)
+    cancel = time.perf_counter() - start
+    print(f"insert  {insert / TIMERS * 1e6:.2f} us/timer, cancel {cancel / (TIMERS // 2) * 1e6:.2f} us/timer, "
+          f"{len(wheel)} pending")
+
+    late = []
+    origin = time.monotonic()
+    for delay in SHORT:
+        wheel.call_later(delay, lambda delay=delay: late.append(time.monotonic() - origin - delay))
+    cpu_start = time.process_time()
+    time.sleep(IDLE)
+    cpu = time.process_time() - cpu_start
+    wheel.stop()
+    print(f"fired   {len(late)}/{len(SHORT)}, latest {max(late, default=0) * 1000:.1f} ms late")
+    print(f"idle    {cpu * 1000:.1f} ms CPU in {IDLE:.0f}s ({cpu / IDLE * 100:.2f}%)")
+    ok = len(late) == len(SHORT) and len(wheel) == TIMERS // 2 and cpu / IDLE < 0.01
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ sys.path.insert(1, "/".join(os.path.realpath(__file__).split("/")[0:-2]))
 from vsystem.virtualfs import File
 from vsystem.virtualfs import Directory
 from vsystem.virtualfs import VirtualFileSystem
+from vsystem.virtualfsck import Scrubber
 
 from vsystem.virtualkernel import VirtualKernel
 from vsystem.virtualkernel import QShellInterpreter
@@ -53,7 +54,7 @@ def establish_directory(dir):
     return Directory(dir)
 
 def qshell_instance_sys():
-    return qshell_instance
+    return QShellInterpreter()
 
 def vm_instance():
     return VirtualMachine()
@@ -67,17 +68,20 @@ def vm_wallet_instance():
 def vcommands_instance():
     return VCommands()
 
+def scrubber_instance(fs):
+    scrubber_instance = Scrubber(fs)
+    scrubber_instance.start()
+    return scrubber_instance
+
 ## VirtualAPI Functions
 
 def get_active_user():
-    try:
-        fs_instance = VirtualFileSystem()
-        passwordtools_instance = PasswordFile("passwd")
-        active_user = passwordtools_instance.check_passwd_file(fs_instance)[0]
-        return active_user
-    except:
-        active_user = passwordtools_instance.check_passwd_file(fs_instance)[0]
-        return active_user
+    # The logged in user, else the first account; passwd is already in memory
+    passwordtools_instance = PasswordFile("passwd")
+    active_user = passwordtools_instance.online_user()
+    if active_user is None:
+        active_user = passwordtools_instance.check_passwd_file(None)[0]
+    return active_user
 
 def home_fs_init(active_user):
     user_dir = "/home/" + active_user
@@ -108,14 +112,6 @@ def home_fs_init(active_user):
     except Exception as e:
         kernel.log_command(f"Error during kernel boot: {str(e)}")
 
-    def su_check(self, command):
-            if not self.su:
-                print(f"{command} requires su permission")
-                self.kernel.log_command(f"[!!]su_check: {self.active_user} invalid permissions for {command}")
-                return False
-            else:
-                return True
-
 
 # Import the api to gain access to vOS components
 #
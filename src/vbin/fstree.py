@@ -6,6 +6,7 @@ from textual.widgets import Tree, Header, Footer
 from textual.screen import Screen
 from textual.command import Hit, Hits, Provider
 from textual.color import Color
+from vsystem.virtualimage import ImageReader, is_image, MAGIC
 
 class FSTreeCommands(Provider):
 
@@ -48,7 +49,12 @@ class VirtualFSTree(Screen[bool]):
        if os.path.exists(file_path):
             try:
                 with gzip.open(file_path, 'rb') as file:
-                    data = json.loads(file.read().decode('utf-8'))
+                    if is_image(file.read(len(MAGIC))):
+                        file.seek(0)
+                        data = ImageReader(file).read()
+                    else:
+                        file.seek(0)
+                        data = json.loads(file.read().decode('utf-8'))
             except gzip.BadGzipFile:
                 with open(file_path, 'r') as file:
                     data = json.load(file)
@@ -56,8 +62,13 @@ class VirtualFSTree(Screen[bool]):
            print("File system JSON file not found.")
            self.dismiss(False)
 
-       root_node = Tree(data["name"])
-       self._build_tree(root_node, data)
+       # Binary images load straight into Directory objects
+       if isinstance(data, dict):
+           root_node = Tree(data["name"])
+           self._build_tree(root_node, data)
+       else:
+           root_node = Tree(data.name)
+           self._build_directory_tree(root_node.root, data)
        return root_node
 
     def _build_tree(self, tree_node, data):
@@ -72,6 +83,13 @@ class VirtualFSTree(Screen[bool]):
         for file_name in data["files"]:
             parent_node.add_leaf(file_name)
 
+    def _build_directory_tree(self, parent_node, directory):
+        for directory_name, subdirectory in directory.subdirectories.items():
+            directory_node = parent_node.add(directory_name, expand=True)
+            self._build_directory_tree(directory_node, subdirectory)
+        for file_name in directory.files:
+            parent_node.add_leaf(file_name)
+
     def compose(self) -> ComposeResult:
         yield Header()
         yield Footer()
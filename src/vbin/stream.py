@@ -0,0 +1,70 @@
+import os
+import time
+import threading
+from vsystem.virtualipc import lookup
+
+CHUNK_SIZE = 4096
+POLL = 0.1  # Longest wait for room before checking for kill
+STALL_TIMEOUT = 30.0  # Give up when nobody has read for this long
+
+class stream:
+    def __init__(self):
+        self.app_name = "stream"
+        self.app_args = ["fs_instance", "current_directory", "path=None", "name=None"]
+
+    @staticmethod
+    def produce(item, data, stop):
+        # Runs on a shared pool thread: waits for room in POLL slices so it
+        # notices stop (set on kill) and never holds the worker forever
+        view = memoryview(data)
+        offset = 0
+        progress = time.monotonic()
+        delay = 0.001
+        while offset < len(view):
+            if stop.is_set():
+                return offset
+            chunk = view[offset:offset + CHUNK_SIZE]
+            if item.kind == "queue":
+                try:
+                    item.send(bytes(chunk), timeout=POLL)
+                    written = len(chunk)
+                except TimeoutError:
+                    written = 0
+            elif item.kind == "ring":
+                # The ring never blocks, back off while it is full
+                written = item.write(chunk)
+                if not written:
+                    time.sleep(delay)
+                    delay = min(delay * 2, POLL)
+            else:
+                written = item.write_some(chunk, timeout=POLL)
+            if written:
+                offset += written
+                progress = time.monotonic()
+                delay = 0.001
+            elif time.monotonic() - progress > STALL_TIMEOUT:
+                raise TimeoutError(f"Nothing was read for {STALL_TIMEOUT:.0f} seconds, {offset} bytes streamed")
+        return offset
+
+    @staticmethod
+    def stream(fs, current_directory, path=None, name=None):
+        """
+        stream: Stream a file into a named pipe, queue or ring\nUsage: stream [file_path] [ipc_name]
+        """
+        if not path or not name:
+            return("Error: Please specify a file path and an IPC object.")
+
+        # Concatenate current directory path with the specified path
+        if not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
+        try:
+            content = fs.read_file(path)
+            item = lookup(name)
+        except FileNotFoundError as e:
+            return(f"Error: {e}")
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        stop = threading.Event()
+        task = fs.kernel.run_process("stream", stream.produce, (item, data, stop), executor="thread")
+        # kill cancels the future at once; the producer then stops at its next wait
+        task.future.add_done_callback(lambda future: stop.set())
+        return(f"Streaming {len(data)} bytes of {path} to {name} as PID {task.pid}")
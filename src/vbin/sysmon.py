@@ -21,14 +21,10 @@ class ProcessMonitor(App):
                 yield DataTable()
 
             # Populate the table with process information
-            for pid, process_info in ProcessList.running_processes.items():
-                process_name = process_info['name']
-                cache = process_info['cache']
-                start_time = float(next(iter(process_info['start_time'])))
-                elapsed_time = time.time() - start_time
+            for pid, record in list(ProcessList.running_processes.items()):
+                elapsed_time = time.time() - record.start_time
                 formatted_uptime = KernelMessage.format_uptime(elapsed_time)
-                user = process_info['user']
-                table.add_row(process_name, str(pid), str(cache), user, formatted_uptime)
+                table.add_row(record.name, str(pid), str(record.cache), record.user, formatted_uptime)
 
             # Highlight the current process
             table.highlighted = highlighted_index
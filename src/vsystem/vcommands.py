@@ -1,12 +1,20 @@
 import os
 import sys
 import platform
-from vsystem.virtualfs import File
+import re
+import datetime
 from vsystem.virtualfs import Directory
 from vsystem.virtualfs import VirtualFileSystem
+from vsystem.virtualfsck import FileSystemChecker
+from vsystem.virtualbackup import ArchiveExporter
+from vsystem.virtualsync import HostSync
 from vsystem.virtualkernel import VirtualKernel
 from vsystem.virtualkernel import QShellInterpreter
 from vsystem.virtualkernel import VirtualProcess
+from vsystem.virtualkernel import KernelMessage
+from vsystem.virtuallog import parse_level
+from vsystem.virtualsched import get_scheduler
+from vsystem import virtualipc
 from rich.console import Console
 from rich.layout import Layout
 from rich.panel import Panel
@@ -51,6 +59,29 @@ class VCommands:
             print("rm - Remove a file")
             print("mv - Move a file or directory")
             print("cp - Copy a file or directory")
+            print("ln - Create a hard or symbolic link")
+            print("compress - Store files compressed")
+            print("fsck - Check file system integrity")
+            print("import - Mirror a host directory into the file system")
+            print("export - Mirror a directory to the host or back it up to an archive")
+            print("sync - Two-way sync of a directory with a host directory")
+            print("history - Show command history, or the versions of a file")
+            print("restore - Restore an earlier version of a file")
+            print("dmesg - Show kernel messages, filtered by time, level or pattern")
+            print("tail - Show the last lines of a file or of dmesg")
+            print("jobs - List processes running on the scheduler")
+            print("renice - Change the priority of a scheduled process")
+            print("ipcmk - Create a named pipe, message queue or shared ring")
+            print("ipcs - List named pipes, message queues and shared rings")
+            print("ipcrm - Remove a named pipe, message queue or shared ring")
+            print("ipcsend - Write to a pipe or ring, or send to a queue")
+            print("ipcrecv - Read from a pipe or ring, or receive from a queue")
+            print("crontab - List scheduled jobs from /etc/crontab")
+            print("adduser - Add a user, or import users from a file")
+            print("readuser - Show a user's account")
+            print("verify - Check OS components against their stored checksums")
+            print("update - Update vOS from a local archive or directory")
+            print("qscript - Run a QShell script (variables, if, while, for)")
             print("echo - Display arguments")
 
 
@@ -79,7 +110,8 @@ class VCommands:
                 # Execute the command with elevated privileges
                 try:
                     if command == "dmesg":
-                        self.kernel.print_dmesg()
+                        for line in self.kernel.print_dmesg():
+                            print(line)
                     elif command == "uptime":
                         uptime = self.kernel.get_uptime()
                         return(f"vOS uptime: {uptime}")
@@ -234,15 +266,20 @@ class VCommands:
             return
         # Concatenate current directory and path
         directory_path = os.path.join(current_directory.get_full_path(), path) if not path.startswith('/') else path
-        fs.create_directory(directory_path)
+        try:
+            fs.create_directory(directory_path)
+        except PermissionError as e:
+            print(f"Error: {e}")
+            return
         fs.save_file_system("file_system.json")
         fs.kernel.log_command(f"Created directory: {directory_path}")
 
     @staticmethod
-    def ls(fs, current_directory, path=None):
+    def ls(fs, current_directory, path=None, offset=0, limit=None, prefix=None):
         """
-        ls: List files and directories\nUsage: ls [directory_path]
+        ls: List files and directories\nUsage: ls [--offset n] [--limit n] [--prefix text] [directory_path]
         If no directory path is provided, lists the contents of the current directory.
+        Entries are sorted by name, directories first; --offset and --limit page through large directories.
         """
         if not path:
             directory = current_directory
@@ -250,18 +287,11 @@ class VCommands:
             try:
                 directory = fs.find_directory(current_directory, path)
             except FileNotFoundError:
-                return(f"Directory '{path}' not found.")
-                return
+                return([f"Directory '{path}' not found."])
 
-        subdir_list = []
-        dir_list = []
-        for name, item in directory.subdirectories.items():
-            subdir_list.append(f"{name}/")
-#        return(subdir_list)
-        for name, item in directory.files.items():
-            dir_list.append(name)
-        subdir_list.extend(dir_list)
-        return subdir_list
+        with fs.lock.reading():
+            entries = directory.list_entries(offset, limit, prefix)
+        return [f"{name}/" if isinstance(item, Directory) else name for name, item in entries]
 
 
     @staticmethod
@@ -325,6 +355,8 @@ class VCommands:
             fs.kernel.log_command(f"Removed directory: {path}")
         except FileNotFoundError:
             print(f"Directory '{path}' not found.")
+        except PermissionError as e:
+            print(f"Error: {e}")
 
 
     @staticmethod
@@ -412,11 +444,11 @@ class VCommands:
         # Concatenate current directory path with the specified path
         file_path = os.path.join(current_directory.get_full_path(), path)
 
-        parent_directory_path, filename = os.path.split(file_path)
-        parent_directory = fs.find_directory(fs.root, parent_directory_path)
-        parent_directory.add_file(File(filename))
-        fs.save_file_system("file_system.json")
-        fs.kernel.log_command(f"Created file: {file_path}")
+        try:
+            fs.create_file(file_path)
+            fs.save_file_system("file_system.json")
+        except PermissionError as e:
+            print(f"Error: {e}")
 
 
 
@@ -450,6 +482,8 @@ class VCommands:
                 print(f"Error: File '{path}' not found.")
         except FileNotFoundError:
             print(f"Error: File '{path}' not found.")
+        except PermissionError as e:
+            print(f"Error: {e}")
 
     @staticmethod
     def mv(fs, current_directory, old_path, new_path):
@@ -467,6 +501,8 @@ class VCommands:
             new_path = os.path.join(current_directory.get_full_path(), new_path)
 
         try:
+            # Refuse before copying, so a read-only source is not left duplicated
+            fs.check_writable(fs.find_directory(fs.root, os.path.dirname(old_path)))
             file_content = fs.read_file(old_path)
             fs.create_file(new_path, file_content)
             fs.remove_file(old_path)
@@ -476,11 +512,14 @@ class VCommands:
             print(f"File '{old_path}' not found.")
         except FileExistsError:
             print(f"File '{new_path}' already exists.")
+        except PermissionError as e:
+            print(f"Error: {e}")
 
     @staticmethod
-    def cp(fs, current_directory, src_path, dest_path):
+    def cp(fs, current_directory, src_path, dest_path, reflink=False):
         """
-        cp: Copy a file or directory\nUsage: cp [source_path] [destination_path]
+        cp: Copy a file or directory\nUsage: cp [--reflink] [source_path] [destination_path]
+        With --reflink the copy shares content with the source until either is written.
         """
         if not src_path or not dest_path:
             print("Error: Please specify both source and destination paths.")
@@ -493,14 +532,473 @@ class VCommands:
             dest_path = os.path.join(current_directory.get_full_path(), dest_path)
 
         try:
-            file_content = fs.read_file(src_path)
-            fs.create_file(dest_path, file_content)
+            fs.copy_file(src_path, dest_path, reflink)
             fs.save_file_system("file_system.json")
             fs.kernel.log_command(f"Copied file '{src_path}' to '{dest_path}'")
         except FileNotFoundError:
             print(f"File '{src_path}' not found.")
+        except PermissionError as e:
+            print(f"Error: {e}")
+
+    @staticmethod
+    def ln(fs, current_directory, target, link_path, symbolic=False):
+        """
+        ln: Create a link to a file\nUsage: ln [-s] [target] [link_path]
+        Without -s a hard link is created; -s creates a symbolic link.
+        """
+        if not target or not link_path:
+            return("Error: Please specify both target and link paths.")
+
+        if not link_path.startswith('/'):
+            link_path = os.path.join(current_directory.get_full_path(), link_path)
+
+        try:
+            if symbolic:
+                # Symlink targets are stored as given and resolved on access
+                fs.symlink(target, link_path)
+            else:
+                if not target.startswith('/'):
+                    target = os.path.join(current_directory.get_full_path(), target)
+                fs.link(target, link_path)
+            fs.save_file_system("file_system.json")
+        except FileNotFoundError:
+            return(f"File '{target}' not found.")
+        except FileExistsError:
+            return(f"File '{link_path}' already exists.")
+        except (IsADirectoryError, OSError) as e:
+            return(f"Error: {e}")
+
+
+
+    @staticmethod
+    def compress(fs, current_directory, codec, path):
+        """
+        compress: Store a file (or every file in a directory) compressed\nUsage: compress [zlib|lzma|bz2|off] [path]
+        Files are decompressed transparently on read.
+        """
+        if not codec or not path:
+            return("Error: Please specify a codec and a path.")
+
+        if not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
+
+        try:
+            count = fs.set_compression(path, None if codec == "off" else codec)
+            fs.save_file_system("file_system.json")
+            fs.kernel.log_command(f"Set compression {codec} on {path}")
+            return(f"{count} file(s) set to {codec}")
+        except FileNotFoundError:
+            return(f"File '{path}' not found.")
+        except ValueError as e:
+            return(f"Error: {e}")
+
+    @staticmethod
+    def fsck(fs, current_directory, path=None, repair=False):
+        """
+        fsck: Check file system consistency and content checksums\nUsage: fsck [--repair] [directory_path]
+        Link and reference counts are only checked when run on /.
+        """
+        if not path:
+            path = "/"
+        elif not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
 
+        try:
+            report = FileSystemChecker(fs).check(path, repair)
+        except FileNotFoundError:
+            return [f"Directory '{path}' not found."]
+        fs.kernel.log_command(f"fsck {path}: {len(report.errors)} error(s), {len(report.warnings)} warning(s)")
+        return report.lines()
 
+    @staticmethod
+    def import_dir(fs, current_directory, host_dir, path, delete=False):
+        """
+        import: Mirror a host directory into a directory\nUsage: import [--delete] [host_directory] [directory_path]
+        Only files that changed are copied, binary files are skipped; --delete removes files missing on the host.
+        """
+        if not host_dir or not path:
+            return("Error: Please specify a host directory and a directory path.")
+
+        if not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
+
+        try:
+            stats = HostSync(fs).import_tree(host_dir, path, delete)
+            fs.save_file_system("file_system.json")
+        except FileNotFoundError as e:
+            return(f"Error: {e}")
+        except OSError as e:
+            return(f"Error: {e}")
+        return(stats.summary())
+
+    @staticmethod
+    def export(fs, current_directory, path, destination, incremental=False, since=None, delete=False):
+        """
+        export: Mirror a directory to a host directory, or write it to a tar.gz archive\nUsage: export [--delete] [directory_path] [host_directory]
+               export [--incremental] [--since generation] [directory_path] [host_archive.tar.gz]
+        With --incremental only files changed since the last export of the directory are archived.
+        """
+        if not path or not destination:
+            return("Error: Please specify a directory and a destination.")
+
+        if not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
+
+        try:
+            if destination.endswith((".tar.gz", ".tgz")):
+                stats = ArchiveExporter(fs).export(path, destination, incremental, since)
+                return(f"Exported {stats['files']} file(s), {stats['bytes']} bytes "
+                       f"(generations {max(stats['base'], 0)}..{stats['generation']}) to {destination}")
+            return(HostSync(fs).export_tree(path, destination, delete).summary())
+        except FileNotFoundError:
+            return(f"Directory '{path}' not found.")
+        except OSError as e:
+            return(f"Error: {e}")
+
+    @staticmethod
+    def sync(fs, current_directory, path, host_dir):
+        """
+        sync: Two-way sync of a directory with a host directory\nUsage: sync [directory_path] [host_directory]
+        Files changed on either side since the last sync are copied over; the host wins conflicts.
+        """
+        if not path or not host_dir:
+            return("Error: Please specify a directory path and a host directory.")
+
+        if not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
+
+        try:
+            stats = HostSync(fs).sync(host_dir, path)
+            fs.save_file_system("file_system.json")
+        except OSError as e:
+            return(f"Error: {e}")
+        result = stats.summary()
+        if stats.conflicts:
+            result += f"\n{len(stats.conflicts)} file(s) changed on both sides, kept the host copy: {', '.join(stats.conflicts)}"
+        return(result)
+
+    @staticmethod
+    def history(fs, current_directory, path, enable=None, keep=None):
+        """
+        history: List the versions of a file\nUsage: history [--enable|--disable] [--keep count] [file_path]
+        Versioning is off until enabled per file; without arguments history shows the command history.
+        """
+        if not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
+
+        try:
+            if enable is not None or keep is not None:
+                fs.set_versioning(path, enable is not False, keep)
+                fs.save_file_system("file_system.json")
+            entries = fs.file_history(path)
+        except FileNotFoundError:
+            return [f"File '{path}' not found."]
+        except PermissionError as e:
+            return [f"Error: {e}"]
+        if entries is None:
+            return [f"Versioning is off for {path}; enable it with history --enable {path}"]
+        lines = []
+        for index, (number, timestamp, size) in enumerate(entries):
+            modified = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+            lines.append(f"{number:>5}  {modified}  {size:>8} chars{'  (current)' if index == 0 else ''}")
+        return lines
+
+    @staticmethod
+    def restore(fs, current_directory, path, version):
+        """
+        restore: Restore an earlier version of a file\nUsage: restore [file_path] [version]
+        The replaced content becomes a new version, so a restore can be undone.
+        """
+        if not path or not version:
+            return("Error: Please specify a file and a version.")
+
+        if not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
+
+        try:
+            fs.restore_version(path, int(version))
+            fs.save_file_system("file_system.json")
+        except FileNotFoundError:
+            return(f"No version history for '{path}'.")
+        except (KeyError, ValueError):
+            return(f"Version {version} of '{path}' is not available.")
+        return(f"Restored {path} to version {version}")
+
+    @staticmethod
+    def parse_since(value):
+        """
+        Time for --since: relative ('30s', '10m', '2h', '1d') or ISO 8601.
+        """
+        units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+        if value[-1:] in units and value[:-1].replace(".", "", 1).isdigit():
+            return datetime.datetime.now().timestamp() - float(value[:-1]) * units[value[-1]]
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+    @staticmethod
+    def dmesg(kernel, since=None, level=None, grep=None, set_level=None, page=None, tail=None):
+        """
+        dmesg: Show kernel messages\nUsage: dmesg [--since 10m|2h|ISO time] [--level warn] [--grep pattern] [--tail count] [--page number] [--set-level debug]
+        Without options the recent messages are shown from memory; the other options read the
+        log files, including rotated ones, starting from the newest.
+        """
+        if set_level is not None:
+            try:
+                kernel.set_log_level(set_level)
+            except ValueError as e:
+                return [f"Error: {e}"]
+            return [f"Log level set to {set_level}"]
+        try:
+            tail = int(tail) if tail is not None else None
+            if since is None and level is None and grep is None:
+                if page is not None:
+                    return kernel.page_dmesg(int(page))
+                if tail is not None:
+                    return kernel.page_dmesg(1, tail)
+                return kernel.print_dmesg()
+            since = VCommands.parse_since(since) if since is not None else None
+            level = parse_level(level) if level is not None else None
+            return kernel.query_dmesg(since, level, grep, tail)
+        except re.error as e:
+            return [f"Error: invalid pattern: {e}"]
+        except ValueError as e:
+            return [f"Error: {e}"]
+
+    @staticmethod
+    def jobs(kernel):
+        """
+        jobs: List processes running on the scheduler\nUsage: jobs
+        """
+        processes = kernel.schedule_processes()
+        if not processes:
+            return ["No scheduled processes."]
+        lines = [f"{'PID':>7}  {'NICE':>4}  {'STATE':<8}  {'CPU':>8}  {'SWITCHES':>8}  NAME"]
+        for process in sorted(processes, key=lambda process: process.pid):
+            lines.append(f"{process.pid:>7}  {process.priority:>4}  {process.state:<8}  "
+                         f"{process.cpu_time:>7.3f}s  {process.switches:>8}  {process.name}")
+        return lines
+
+    @staticmethod
+    def renice(kernel, priority=None, pid=None):
+        """
+        renice: Change the priority of a scheduled process\nUsage: renice [priority -20..19] [pid]
+        """
+        try:
+            priority, pid = int(priority), int(pid)
+        except (TypeError, ValueError):
+            return("Error: Please specify a priority and a PID.")
+        if not -20 <= priority <= 19:
+            return("Error: Priority must be between -20 and 19.")
+        if not get_scheduler().renice(pid, priority):
+            return(f"Process with PID {pid} is not scheduled.")
+        return(f"{pid}: priority set to {priority}")
+
+    @staticmethod
+    def ipcmk(kernel, kind=None, name=None, size=None):
+        """
+        ipcmk: Create a named pipe, message queue or shared ring\nUsage: ipcmk [pipe|queue|ring] [name] [size]
+        """
+        if kind not in ("pipe", "queue", "ring") or not name:
+            return("Error: Please specify pipe, queue or ring and a name.")
+        try:
+            item = kernel.create_ipc(kind, name, int(size) if size else None)
+        except (ValueError, FileExistsError) as e:
+            return(f"Error: {e}")
+        return(f"{kind} {name}: {item.describe()}")
+
+    @staticmethod
+    def ipcs():
+        """
+        ipcs: List named pipes, message queues and shared rings\nUsage: ipcs
+        """
+        objects = virtualipc.list_objects()
+        if not objects:
+            return ["No IPC objects."]
+        lines = [f"{'KIND':<6}  {'NAME':<20}  USAGE"]
+        for name, kind, description in objects:
+            lines.append(f"{kind:<6}  {name:<20}  {description}")
+        return lines
+
+    @staticmethod
+    def ipcrm(kernel, name=None):
+        """
+        ipcrm: Remove a named pipe, message queue or shared ring\nUsage: ipcrm [name]
+        """
+        if not name:
+            return("Error: Please specify a name.")
+        try:
+            kernel.remove_ipc(name)
+        except FileNotFoundError as e:
+            return(f"Error: {e}")
+        return(f"Removed {name}")
+
+    @staticmethod
+    def ipcsend(name=None, message=""):
+        """
+        ipcsend: Write to a pipe or ring, or send to a queue\nUsage: ipcsend [name] [message]
+        Never blocks the shell: a full pipe or queue is reported instead.
+        """
+        try:
+            item = virtualipc.lookup(name)
+            if item.kind == "queue":
+                item.send(message, timeout=0)
+                return(f"Sent to {name}")
+            data = (message + "\n").encode("utf-8")
+            written = item.write(data) if item.kind == "ring" else item.write_nowait(data)
+            if not written:
+                raise TimeoutError
+            return(f"Wrote {written} of {len(data)} bytes to {name}")
+        except TimeoutError:
+            return(f"{name} is full")
+        except (FileNotFoundError, BrokenPipeError) as e:
+            return(f"Error: {e}")
+
+    @staticmethod
+    def ipcrecv(name=None, size=None):
+        """
+        ipcrecv: Read from a pipe or ring, or receive from a queue\nUsage: ipcrecv [name] [size]
+        Never blocks the shell: an empty pipe or queue is reported instead.
+        """
+        try:
+            item = virtualipc.lookup(name)
+            if item.kind == "queue":
+                return(str(item.receive(timeout=0)))
+            size = int(size) if size else -1
+            data = item.read(size) if item.kind == "ring" else item.read(size, timeout=0)
+            if not data and item.kind == "ring":
+                raise TimeoutError
+            return(data.decode("utf-8", errors="replace").rstrip("\n") if data else f"{name} is closed")
+        except TimeoutError:
+            return(f"{name} is empty")
+        except EOFError:
+            return(f"{name} is closed")
+        except (FileNotFoundError, ValueError) as e:
+            return(f"Error: {e}")
+
+    @staticmethod
+    def adduser(kernel, fs, current_directory, username=None, password=None):
+        """
+        adduser: Add a user, or import users from a file\nUsage: adduser [username] [password]
+        adduser --file [file_path] imports one username:password per line with a single passwd write.
+        """
+        if not username or not password:
+            return("Error: Please specify a username and a password, or --file and a file path.")
+        passwords = kernel.password_file
+        if username == "--file":
+            path = password
+            if not path.startswith('/'):
+                path = os.path.join(current_directory.get_full_path(), path)
+            try:
+                lines = fs.read_file(path).splitlines()
+            except FileNotFoundError:
+                return(f"Error: File '{path}' not found.")
+            accounts = [line.strip().split(":", 1) for line in lines if ":" in line]
+            added, skipped = passwords.add_users(fs, accounts)
+            # One directory per account, but a single image save for all of them
+            for username in added:
+                if not fs.directory_exists(f"/home/{username}"):
+                    fs.create_directory(f"/home/{username}")
+            fs.save_file_system("file_system.json")
+            kernel.log_command(f"Imported {len(added)} users from {path}")
+            message = f"Added {len(added)} users"
+            return(message + (f", skipped {len(skipped)} existing or invalid" if skipped else ""))
+        try:
+            passwords.add_user(fs, username, password)
+        except ValueError as e:
+            return(f"Error: {e}")
+        if not fs.directory_exists(f"/home/{username}"):
+            fs.create_directory(f"/home/{username}")
+            fs.save_file_system("file_system.json")
+        kernel.log_command(f"Added user: {username}")
+        return(f"Added user {username}")
+
+    @staticmethod
+    def readuser(kernel, username=None):
+        """
+        readuser: Show a user's account\nUsage: readuser [username]
+        """
+        user = kernel.password_file.get_user(username)
+        if user is None:
+            return(f"User '{username}' not found.")
+        name, _, uid, gid, home_dir, shell = user
+        return(f"{name} uid={uid} gid={gid} home={home_dir} shell={shell}")
+
+    @staticmethod
+    def verify(kernel, option=None):
+        """
+        verify: Check OS components against their stored checksums\nUsage: verify [--no-cache|--update]
+        --no-cache hashes every file again, --update records the current checksums (requires su).
+        """
+        if option == "--update":
+            report = kernel.integrity().write_manifest()
+            lines = [f"Checksums updated in {os.path.basename(kernel.integrity().manifest)}"]
+        else:
+            try:
+                report = kernel.verify_components(use_cache=option != "--no-cache")
+            except FileNotFoundError as e:
+                return [f"Error: {e}"]
+            lines = [f"{name}: {status}" for name, status, _ in report.results]
+            lines.append("All checksums passed." if report.ok else f"{len(report.failed)} component(s) failed.")
+        lines.append(f"{report.hashed} hashed ({KernelMessage.format_size(report.bytes_hashed)}), "
+                     f"{report.cached} cached in {report.elapsed * 1000:.1f} ms")
+        return lines
+
+    @staticmethod
+    def update(kernel, source=None, option=None):
+        """
+        update: Update vOS from a local archive or directory\nUsage: update --from [archive_or_directory] [--dry-run]
+        Only files that differ from the installed ones are written.
+        """
+        if not source:
+            return ["Error: Please specify a zip archive or directory to update from."]
+        dry_run = option == "--dry-run"
+        try:
+            report = kernel.update_from(os.path.expanduser(source), dry_run)
+        except (OSError, ValueError) as e:
+            return [f"Error: {e}"]
+        lines = [f"{'Would update' if dry_run else 'Updated'} {name}" for name in report.changed]
+        lines.append(f"{len(report.changed)} changed, {report.unchanged} unchanged, {report.preserved} preserved "
+                     f"in {report.elapsed:.2f}s")
+        lines.append(f"{KernelMessage.format_size(report.bytes_written)} written, "
+                     f"{KernelMessage.format_size(report.bytes_saved)} saved")
+        return lines
+
+    @staticmethod
+    def crontab(kernel, option=None):
+        """
+        crontab: List scheduled jobs from /etc/crontab\nUsage: crontab [--reload]
+        """
+        if kernel.cron is None:
+            return ["cron is not running."]
+        if option == "--reload":
+            kernel.cron.reload()
+        entries = kernel.cron.list_entries()
+        if not entries:
+            return [f"No jobs in {kernel.cron.path}."]
+        lines = [f"{'NEXT RUN':<19}  ENTRY"]
+        for next_run, line in entries:
+            lines.append(f"{next_run.strftime('%Y-%m-%d %H:%M') if next_run else 'never':<19}  {line}")
+        return lines
+
+    @staticmethod
+    def tail(fs, current_directory, path=None, count=10):
+        """
+        tail: Show the last lines of a file\nUsage: tail [-n count] [-f] [file_path|dmesg]
+        -f keeps following dmesg until tail --stop.
+        """
+        if not path:
+            return ["Error: Please specify a file path to read."]
+
+        if path == "dmesg":
+            return fs.kernel.page_dmesg(1, count)
+
+        if not path.startswith('/'):
+            path = os.path.join(current_directory.get_full_path(), path)
+
+        try:
+            lines = fs.read_file(path).splitlines()
+        except FileNotFoundError:
+            return [f"File '{path}' not found."]
+        return lines[-count:] if count else []
 
     @staticmethod
     def echo(fs, current_directory, *args, file=None):
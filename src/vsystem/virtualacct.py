@@ -0,0 +1,131 @@
+# virtualacct.py
+#
+# Per-process resource accounting.
+#
+# Every process in the table has a Usage record of plain counters. Work is
+# charged to the process in the current_pid context variable, which is set
+# by whoever runs code on a process's behalf: the shell around each command,
+# the scheduler for each task and the pool wrappers for each job. Charging
+# is a context variable lookup, a dict lookup and an addition, cheap enough
+# for every VFS read and write.
+#
+#   cpu_time       thread CPU seconds (time.thread_time) while running
+#   memory         net bytes allocated by shell commands and pool thread
+#                  jobs, only while tracemalloc is tracing (sysmon --memory);
+#                  approximate when several threads allocate at once
+#   bytes_read     file content returned by VFS reads
+#   bytes_written  file content stored by VFS writes
+#   commands       shell commands executed
+
+import time
+import functools
+import tracemalloc
+from contextvars import ContextVar
+
+current_pid = ContextVar("current_pid", default=None)
+
+usage_table = {}  # pid -> Usage
+
+
+class Usage:
+    __slots__ = ("cpu_time", "memory", "bytes_read", "bytes_written", "commands")
+
+    def __init__(self):
+        self.cpu_time = 0.0
+        self.memory = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.commands = 0
+
+
+def register(pid):
+    usage = usage_table[pid] = Usage()
+    return usage
+
+
+def unregister(pid):
+    usage_table.pop(pid, None)
+
+
+def charge_read(size):
+    usage = usage_table.get(current_pid.get())
+    if usage is not None:
+        usage.bytes_read += size
+
+
+def charge_written(size):
+    usage = usage_table.get(current_pid.get())
+    if usage is not None:
+        usage.bytes_written += size
+
+
+def charge_cpu(pid, seconds):
+    usage = usage_table.get(pid)
+    if usage is not None:
+        usage.cpu_time += seconds
+
+
+def memory_tracking(enabled=None):
+    """
+    Switch allocation tracking on or off; returns whether it is on.
+    """
+    if enabled is True and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif enabled is False and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return tracemalloc.is_tracing()
+
+
+class Charge:
+    """
+    Context manager running its block as process pid: VFS I/O inside it is
+    charged to pid, and so are its CPU time and allocations.
+    """
+    __slots__ = ("pid", "command", "token", "cpu_start", "memory_start")
+
+    def __init__(self, pid, command=False):
+        self.pid = pid
+        self.command = command
+
+    def __enter__(self):
+        self.token = current_pid.set(self.pid)
+        self.memory_start = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        cpu_time = time.thread_time() - self.cpu_start
+        current_pid.reset(self.token)
+        usage = usage_table.get(self.pid)
+        if usage is None:
+            return
+        usage.cpu_time += cpu_time
+        if self.command:
+            usage.commands += 1
+        if self.memory_start is not None and tracemalloc.is_tracing():
+            usage.memory += tracemalloc.get_traced_memory()[0] - self.memory_start
+
+
+def charged_command(method):
+    """
+    Run a shell's command handler as the shell process (self.shell_pid),
+    counting one command per call.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with Charge(self.shell_pid, command=True):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def run_charged(pid, function, args):
+    # Pool thread entry point; pool threads do not inherit the caller's context
+    with Charge(pid):
+        return function(*args)
+
+
+def run_measured(function, args):
+    # Process pool entry point; the parent charges the returned CPU time
+    start = time.process_time()
+    result = function(*args)
+    return result, time.process_time() - start
@@ -0,0 +1,137 @@
+# virtualbackup.py
+#
+# Export of a VFS subtree to a host tar archive.
+#
+# Every modification stamps the changed node with a generation number (see
+# VirtualFileSystem.mark_changed). A full export archives the whole subtree;
+# an incremental export archives only the nodes changed since the previous
+# export of the same path, found with changed_since, which skips unchanged
+# subtrees without visiting them. The archive is written in streaming mode
+# so nothing is buffered beyond the file being added.
+#
+# The generation counter restarts from the newest generation in the saved
+# image, so a recorded base is only safe once the image holding it is on
+# disk; export saves the image before recording the new base. Otherwise a
+# restart from an older image would stamp new changes with generations at
+# or below the base, and the next incremental export would miss them.
+#
+# Deleted entries cannot be archived, so each archive ends with a manifest
+# (MANIFEST_NAME) listing the current entries of every changed directory;
+# restoring a chain of archives in order applies deletions from it.
+
+import io
+import os
+import json
+import time
+import tarfile
+from vsystem.virtualfs import Directory, Symlink, generations
+
+MANIFEST_NAME = ".vos-export.json"
+
+
+def permission_mode(permissions):
+    """
+    Convert a permission string such as 'rwxr-xr-x' to a mode (0o755).
+    """
+    mode = 0
+    for character in permissions[:9].ljust(9, "-"):
+        mode = (mode << 1) | (character != "-")
+    return mode
+
+
+class ArchiveExporter:
+    def __init__(self, fs, state_path=None):
+        self.fs = fs
+        # Generation of the last export of each VFS path, kept across reboots
+        self.state_path = state_path or os.path.abspath("../src/vinit/export.gen")
+
+    def load_state(self):
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(temp_path, self.state_path)
+
+    def export(self, path, archive_path, incremental=False, since=None):
+        """
+        Write the subtree at path to a gzip compressed tar archive on the host.
+
+        Parameters:
+            path (str): VFS directory to export.
+            archive_path (str): Host path of the archive.
+            incremental (bool): Only archive nodes changed since the last export of path.
+            since (int): Explicit base generation, overrides the recorded one.
+
+        Returns:
+            dict: base and new generation, files archived and bytes written.
+        """
+        directory = self.fs.find_directory(self.fs.root, path)
+        path = directory.get_full_path() or "/"
+        state = self.load_state()
+        if since is None:
+            since = state.get(path, -1) if incremental else -1
+        # A base newer than the counter comes from a tree that was never saved, start over
+        if since > generations.value:
+            since = -1
+        generation = generations.value
+
+        # Members are named relative to the parent of the exported directory, like tar -C
+        base = os.path.dirname(path.rstrip("/")) or "/"
+        stats = {"base": since, "generation": generation, "files": 0, "directories": 0, "bytes": 0}
+        manifest = {}
+        archived = {}  # id(file) -> member name, later links become hard links
+        with tarfile.open(archive_path, "w|gz") as archive:
+            for item_path, item in self.fs.changed_since(since, path):
+                name = os.path.relpath(item_path, base)
+                if isinstance(item, Directory):
+                    manifest[name] = sorted(list(item.files) + list(item.subdirectories))
+                    if name != ".":
+                        archive.addfile(self._member(name, tarfile.DIRTYPE, item.permissions))
+                        stats["directories"] += 1
+                elif isinstance(item, Symlink):
+                    member = self._member(name, tarfile.SYMTYPE, item.permissions)
+                    member.linkname = item.target
+                    archive.addfile(member)
+                elif id(item) in archived:
+                    member = self._member(name, tarfile.LNKTYPE, item.permissions)
+                    member.linkname = archived[id(item)]
+                    archive.addfile(member)
+                else:
+                    archived[id(item)] = name
+                    data = item.read().encode("utf-8")
+                    member = self._member(name, tarfile.REGTYPE, item.permissions)
+                    member.size = len(data)
+                    archive.addfile(member, io.BytesIO(data))
+                    stats["files"] += 1
+                    stats["bytes"] += len(data)
+
+            data = json.dumps({"path": path, "base": since, "generation": generation,
+                               "directories": manifest}).encode("utf-8")
+            member = self._member(MANIFEST_NAME, tarfile.REGTYPE, "rw-r--r--")
+            member.size = len(data)
+            archive.addfile(member, io.BytesIO(data))
+
+        # The image must hold the base before it is recorded, see above. The
+        # image keeps the newest generation in the tree, which is lower than
+        # the counter if the last stamped node has since been removed.
+        saved = self.fs.root.subtree_generation
+        self.fs.save_file_system("file_system.json").result()
+        state[path] = min(generation, saved)
+        self.save_state(state)
+        self.fs.kernel.log_command(f"Exported {path} to {archive_path}: {stats['files']} file(s), "
+                                   f"{stats['bytes']} bytes, generations {since}..{generation}")
+        return stats
+
+    @staticmethod
+    def _member(name, kind, permissions):
+        member = tarfile.TarInfo(name)
+        member.type = kind
+        member.mode = permission_mode(permissions)
+        member.mtime = int(time.time())
+        return member
@@ -0,0 +1,225 @@
+# virtualboot.py
+#
+# Frozen boot image for the read-only system directories (/bin, /boot,
+# /sbin, /dev).
+#
+# The host source files that make up those directories are compiled once
+# into vinit/boot.img:
+#
+#   header   MAGIC, version, entry count
+#   entries  vfs path, host path, mtime_ns, size, sha256, offset, length
+#   data     raw file contents
+#
+# At boot the image is memory-mapped and only its small index is read; file
+# contents stay in the mapping and are decoded when a file is read. Images
+# are validated against the host files' mtimes and sizes, falling back to
+# their sha256 when a file was touched, and rebuilt when anything changed.
+# A touched file whose content is unchanged gets its new mtime written into
+# the index, so it is not hashed again on every boot. A mapped image is
+# shared by every VirtualFileSystem in the process; a stale one is unmapped
+# before it is rebuilt, as the file cannot be replaced while it is mapped
+# on Windows.
+
+import os
+import mmap
+import struct
+import hashlib
+
+MAGIC = b"VOSBOOT"
+VERSION = 1
+
+HEADER = struct.Struct("<7sBI")
+LENGTH = struct.Struct("<I")
+ENTRY = struct.Struct("<qQ32sQQ")
+MTIME = struct.Struct("<q")  # First field of ENTRY
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Mapped images shared by all sessions, keyed by image path
+_mapped_images = {}
+
+
+def hash_host_file(path):
+    """
+    sha256 of a host file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class BootImageEntry:
+    __slots__ = ("vfs_path", "host_path", "mtime_ns", "size", "sha256", "offset", "length", "position", "touched")
+
+    def __init__(self, vfs_path, host_path, mtime_ns, size, sha256, offset, length, position=None):
+        self.vfs_path = vfs_path
+        self.host_path = host_path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = sha256
+        self.offset = offset
+        self.length = length
+        self.position = position  # Offset of the ENTRY record in the image
+        self.touched = False  # mtime_ns was updated and must be written back
+
+    def is_current(self):
+        """
+        Check the entry against its host file: mtime and size first, hash
+        only when those changed. A touched file with unchanged content takes
+        the new mtime, see BootImage.restamp.
+        """
+        try:
+            stat = os.stat(self.host_path)
+        except OSError:
+            return False
+        if stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size:
+            return True
+        if stat.st_size != self.size or hash_host_file(self.host_path) != self.sha256:
+            return False
+        self.mtime_ns = stat.st_mtime_ns
+        self.touched = True
+        return True
+
+
+class BootImage:
+    def __init__(self, path, entries, mapping):
+        self.path = path
+        self.entries = entries
+        self.mapping = mapping
+        self.blobs = {}
+
+    @classmethod
+    def build(cls, path, sources):
+        """
+        Compile host files into a boot image.
+
+        Parameters:
+            path (str): Where to write the image.
+            sources (list): (vfs_path, host_path) pairs.
+        """
+        contents = []
+        for vfs_path, host_path in sources:
+            with open(host_path, "rb") as file:
+                data = file.read()
+            stat = os.stat(host_path)
+            contents.append((vfs_path, host_path, stat.st_mtime_ns, data))
+
+        # Contents start right after the header and the index
+        offset = HEADER.size
+        for vfs_path, host_path, mtime_ns, data in contents:
+            offset += 2 * LENGTH.size + len(vfs_path.encode("utf-8")) + len(host_path.encode("utf-8")) + ENTRY.size
+
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(contents)))
+            for vfs_path, host_path, mtime_ns, data in contents:
+                for text in (vfs_path, host_path):
+                    encoded = text.encode("utf-8")
+                    file.write(LENGTH.pack(len(encoded)) + encoded)
+                file.write(ENTRY.pack(mtime_ns, len(data), hashlib.sha256(data).digest(), offset, len(data)))
+                offset += len(data)
+            for vfs_path, host_path, mtime_ns, data in contents:
+                file.write(data)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Map an image and read its index. Returns None if it is not a boot image.
+        """
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < HEADER.size:
+                return None
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC or version != VERSION:
+            mapping.close()
+            return None
+
+        entries = []
+        position = HEADER.size
+        for _ in range(count):
+            texts = []
+            for _ in range(2):
+                length, = LENGTH.unpack_from(mapping, position)
+                position += LENGTH.size
+                texts.append(bytes(mapping[position:position + length]).decode("utf-8"))
+                position += length
+            fields = ENTRY.unpack_from(mapping, position)
+            entries.append(BootImageEntry(texts[0], texts[1], *fields, position))
+            position += ENTRY.size
+        return cls(path, entries, mapping)
+
+    @classmethod
+    def load(cls, path, sources):
+        """
+        Return a current, mapped boot image for sources, rebuilding it when
+        missing or stale. The mapping is reused by later calls in this process.
+        """
+        image = _mapped_images.get(path)
+        if image is not None:
+            if image.matches(sources):
+                return image
+            del _mapped_images[path]
+            image.close()
+        image = cls.open(path) if os.path.exists(path) else None
+        if image is not None and not image.matches(sources):
+            image.close()
+            image = None
+        if image is None:
+            cls.build(path, sources)
+            image = cls.open(path)
+        _mapped_images[path] = image
+        return image
+
+    def matches(self, sources):
+        """
+        Check that the image holds exactly sources and that none changed on the host.
+        """
+        if [(entry.vfs_path, entry.host_path) for entry in self.entries] != list(sources):
+            return False
+        if not all(entry.is_current() for entry in self.entries):
+            return False
+        self.restamp()
+        return True
+
+    def restamp(self):
+        """
+        Write the mtimes of touched but unchanged entries back to the index.
+        """
+        touched = [entry for entry in self.entries if entry.touched]
+        if not touched:
+            return
+        try:
+            with open(self.path, "r+b") as file:
+                for entry in touched:
+                    file.seek(entry.position)
+                    file.write(MTIME.pack(entry.mtime_ns))
+        except OSError:
+            # Only costs a hash on the next boot
+            return
+        for entry in touched:
+            entry.touched = False
+
+    def close(self):
+        """
+        Unmap the image. Files still holding its blobs get a copy of their
+        content first.
+        """
+        for blob in self.blobs.values():
+            blob.detach()
+        self.blobs = {}
+        self.mapping.close()
+
+    def blob(self, entry):
+        """
+        The shared, read-only blob for an entry.
+        """
+        blob = self.blobs.get(entry.vfs_path)
+        if blob is None:
+            # Imported here as virtualfs imports this module
+            from vsystem.virtualfs import MappedBlob
+            blob = self.blobs[entry.vfs_path] = MappedBlob(self.mapping, entry.offset, entry.length, entry.sha256)
+        return blob
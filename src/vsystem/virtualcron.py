@@ -0,0 +1,209 @@
+# virtualcron.py
+#
+# cron: runs commands from /etc/crontab in the VFS on a schedule.
+#
+# Each line is five time fields and a command, as in Unix cron:
+#
+#   # minute hour day-of-month month day-of-week command
+#   */5 * * * * fsck
+#   0 3 * * 1-5 export /home /backup/home.zip
+#   @hourly sync /home/docs ../docs
+#
+# Fields take *, numbers, ranges (1-5), lists (1,15) and steps (*/5,
+# 10-50/20). Day of week runs from 0 (Sunday) to 7 (Sunday again). When
+# both day fields are restricted a day matching either one counts.
+#
+# Every entry keeps exactly one timer on the timer wheel, armed for its
+# next run, so an idle cron costs nothing. Each run starts a virtual
+# process named after the command on the thread pool, which hands the
+# command line to the runner (the shell). The crontab is re-read once a
+# minute and the timers are rebuilt only if it changed.
+
+import datetime
+from vsystem.virtuallog import INFO, WARNING, ERROR
+
+CRONTAB = "/etc/crontab"
+RELOAD_INTERVAL = 60
+
+FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+ALIASES = {"@yearly": "0 0 1 1 *", "@annually": "0 0 1 1 *", "@monthly": "0 0 1 * *",
+           "@weekly": "0 0 * * 0", "@daily": "0 0 * * *", "@midnight": "0 0 * * *", "@hourly": "0 * * * *"}
+
+
+def parse_field(text, low, high):
+    """
+    The set of values a cron field matches.
+
+    Raises:
+        ValueError: If the field is malformed or out of range.
+    """
+    values = set()
+    for part in text.split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = end = int(part)
+            if step > 1:
+                end = high
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"'{text}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronEntry:
+    __slots__ = ("line", "command", "minute", "hour", "day", "month", "weekday", "any_day", "any_weekday", "timer",
+                 "next_run")
+
+    def __init__(self, line):
+        self.line = line
+        fields = line.split(None, 1)
+        if fields[0] in ALIASES:
+            fields = ALIASES[fields[0]].split() + fields[1:]
+        else:
+            fields = line.split(None, 5)
+        if len(fields) != 6:
+            raise ValueError("expected five time fields and a command")
+        for (name, low, high), text in zip(FIELDS, fields):
+            setattr(self, name, parse_field(text, low, high))
+        if 7 in self.weekday:
+            self.weekday.add(0)
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+        self.command = fields[5]
+        self.timer = None
+        self.next_run = None
+
+    def day_matches(self, date):
+        weekday = date.isoweekday() % 7  # Sunday is 0
+        if self.any_day or self.any_weekday:
+            return date.day in self.day and weekday in self.weekday
+        return date.day in self.day or weekday in self.weekday
+
+    def next_after(self, moment):
+        """
+        The first minute after moment at which the entry runs.
+        """
+        moment = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=366 * 5)  # 29 February on a Monday is rarer than this
+        while moment < limit:
+            if moment.month not in self.month:
+                moment = (moment.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif moment.hour not in self.hour:
+                moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+            elif moment.minute not in self.minute:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment
+        return None
+
+
+class CronService:
+    def __init__(self, kernel, fs, runner=None, path=CRONTAB):
+        """
+        Parameters:
+            kernel (VirtualKernel): Starts the job processes and logs.
+            fs (VirtualFileSystem): Holds the crontab.
+            runner: Called with each command line on a pool thread; without
+                one runs are only logged.
+        """
+        self.kernel = kernel
+        self.fs = fs
+        self.runner = runner
+        self.path = path
+        self.wheel = None
+        self.content = None
+        self.entries = []
+        self.reload_timer = None
+
+    def start(self, wheel):
+        self.wheel = wheel
+        self.reload()
+        self.reload_timer = wheel.call_every(RELOAD_INTERVAL, self.reload)
+        return self
+
+    def stop(self):
+        if self.reload_timer is not None:
+            self.wheel.cancel(self.reload_timer)
+            self.reload_timer = None
+        self._clear()
+
+    def _clear(self):
+        for entry in self.entries:
+            if entry.timer is not None:
+                self.wheel.cancel(entry.timer)
+        self.entries = []
+
+    def reload(self):
+        """
+        Re-read the crontab and re-arm every entry if it changed.
+        """
+        try:
+            content = self.fs.read_file(self.path) if self.fs.file_exists(self.path) else ""
+        except (FileNotFoundError, PermissionError) as e:
+            self.kernel.log(WARNING, "cron", "cannot read %s: %s", self.path, e)
+            return
+        if content == self.content:
+            return
+        self.content = content
+        self._clear()
+        for number, line in enumerate(content.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                self.entries.append(CronEntry(line))
+            except ValueError as e:
+                self.kernel.log(WARNING, "cron", "%s:%d: %s", self.path, number, e)
+        now = datetime.datetime.now()
+        for entry in self.entries:
+            self._arm(entry, now)
+        self.kernel.log(INFO, "cron", "loaded %d entries from %s", len(self.entries), self.path)
+
+    def _arm(self, entry, now):
+        entry.next_run = entry.next_after(now)
+        if entry.next_run is None:
+            entry.timer = None
+            return
+        delay = (entry.next_run - now).total_seconds()
+        entry.timer = self.wheel.call_later(delay, self._fire, entry)
+
+    def _fire(self, entry):
+        now = datetime.datetime.now()
+        if now < entry.next_run:
+            # The wall clock was set back; wait for the real time
+            entry.timer = self.wheel.call_later((entry.next_run - now).total_seconds(), self._fire, entry)
+            return
+        self._arm(entry, now)
+        self.run(entry.command)
+
+    def run(self, command):
+        """
+        Start command as a virtual process; returns its PoolTask.
+        """
+        program = command.split(None, 1)[0]
+        self.kernel.log(INFO, "cron", "running %s", command)
+        return self.kernel.run_process(program, self._execute, (command,), executor="thread")
+
+    def _execute(self, command):
+        if self.runner is None:
+            self.kernel.log(WARNING, "cron", "no shell to run %s", command)
+            return None
+        try:
+            return self.runner(command)
+        except Exception as e:
+            self.kernel.log(ERROR, "cron", "%s failed: %s", command, e)
+            raise
+
+    def list_entries(self):
+        """
+        (next run, line) of every entry, soonest first.
+        """
+        entries = sorted(self.entries, key=lambda entry: entry.next_run or datetime.datetime.max)
+        return [(entry.next_run, entry.line) for entry in entries]
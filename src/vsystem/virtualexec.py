@@ -0,0 +1,136 @@
+# virtualexec.py
+#
+# Pool-backed virtual processes.
+#
+# CPU-heavy work (hashing, compression) would block the shell if it ran on
+# the UI thread and would stall every other process on the cooperative
+# scheduler. Such a process runs instead as a plain function on a shared
+# worker pool:
+#
+#   thread   ThreadPoolExecutor, for work that releases the GIL (hashlib,
+#            zlib, file I/O) or needs the live VFS
+#   process  ProcessPoolExecutor, for pure Python number crunching; the
+#            function and its arguments must be picklable
+#
+# Both pools have one worker per core and are created on first use. The
+# PoolTask of a process holds its future. kill cancels work that has not
+# started yet; work that is already running cannot be interrupted, so it is
+# detached instead: its future is cancelled at once and the result is
+# thrown away when the worker finishes.
+
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, InvalidStateError
+from vsystem.virtualacct import run_charged, run_measured, charge_cpu
+
+WORKERS = os.cpu_count() or 1
+
+_executors = {}
+_executors_lock = threading.Lock()
+tasks = {}  # pid -> PoolTask
+
+
+def get_executor(kind):
+    """
+    The shared 'thread' or 'process' pool.
+    """
+    with _executors_lock:
+        executor = _executors.get(kind)
+        if executor is None:
+            if kind == "thread":
+                executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="vos-worker")
+            elif kind == "process":
+                executor = ProcessPoolExecutor(max_workers=WORKERS)
+            else:
+                raise ValueError(f"Unknown executor: {kind}")
+            _executors[kind] = executor
+        return executor
+
+
+class PoolTask:
+    __slots__ = ("pid", "name", "kind", "future", "worker", "start_time", "detached", "on_exit")
+
+    def __init__(self, pid, name, kind, on_exit):
+        self.pid = pid
+        self.name = name
+        self.kind = kind
+        self.future = None
+        self.worker = None  # Pool future; future is set from it unless the task is detached
+        self.start_time = time.time()
+        self.detached = False  # Killed while running, the result is discarded
+        self.on_exit = on_exit
+
+    @property
+    def state(self):
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "done"
+        return "running" if self.worker.running() else "queued"
+
+
+def submit_task(pid, name, kind, function, args=(), on_exit=None):
+    """
+    Run function(*args) on the kind pool as process pid.
+
+    Returns:
+        PoolTask: Its future holds the result.
+    """
+    task = PoolTask(pid, name, kind, on_exit)
+    tasks[pid] = task
+    executor = get_executor(kind)
+    task.future = Future()
+    if kind == "process":
+        # The worker reports its CPU time alongside the result
+        task.worker = executor.submit(run_measured, function, args)
+    else:
+        task.worker = executor.submit(run_charged, pid, function, args)
+    task.future.add_done_callback(lambda future: _finished(task))
+    task.worker.add_done_callback(lambda worker: _collect(task, worker))
+    return task
+
+
+def _collect(task, worker):
+    if worker.cancelled():
+        task.future.cancel()
+        return
+    if worker.exception() is not None:
+        result, exception = None, worker.exception()
+    else:
+        result, exception = worker.result(), None
+        if task.kind == "process":
+            # The CPU time is charged even if the result is thrown away
+            result, cpu_time = result
+            charge_cpu(task.pid, cpu_time)
+    if task.detached:
+        return
+    try:
+        if exception is not None:
+            task.future.set_exception(exception)
+        else:
+            task.future.set_result(result)
+    except InvalidStateError:
+        # Killed while running, just after the check above
+        pass
+
+
+def _finished(task):
+    if tasks.get(task.pid) is task:
+        del tasks[task.pid]
+    if task.on_exit is not None:
+        task.on_exit(task)
+
+
+def cancel_task(pid):
+    task = tasks.pop(pid, None)
+    if task is None:
+        return False
+    if not task.worker.cancel():
+        task.detached = True
+        task.future.cancel()
+    return True
+
+
+def get_task(pid):
+    return tasks.get(pid)
@@ -1,21 +1,449 @@
 import json
 import os, sys
+import io
 import gzip
 import sys
 import copy
+import errno
+import threading
+import hashlib
+import zlib
+import mmap
+import lzma
+import bz2
+from bisect import bisect_left, insort
+from collections import OrderedDict
 from vsystem.virtualkernel import VirtualKernel
+from vsystem.virtualimage import ImageReader, ImageWriter, ImageSnapshot, is_image
+from vsystem.virtualimage import MAGIC as IMAGE_MAGIC
+from vsystem.virtualboot import BootImage
+from vsystem.virtualhistory import FileHistory
+from vsystem.virtuallock import ReadWriteLock, reads, writes
+from vsystem.virtualacct import charge_read, charge_written
+
+# Maximum number of symlinks followed while resolving a single path
+MAX_SYMLINK_FOLLOWS = 40
+
+# System directories mounted read-only from the boot image
+READ_ONLY_MOUNTS = ("bin", "boot", "sbin", "dev")
+
+# Codecs available for per-file compression
+COMPRESSION_CODECS = {
+    "zlib": zlib,
+    "lzma": lzma,
+    "bz2": bz2
+}
+
+
+class DecompressedCache:
+    """
+    Small LRU of decompressed blob contents so hot compressed files are
+    not decompressed on every read.
+    """
+    def __init__(self, max_entries=32, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Readers share the VFS lock, so the LRU order needs its own
+        self.lock = threading.RLock()
+
+    def get(self, blob):
+        with self.lock:
+            data = self.entries.get(blob)
+            if data is not None:
+                self.entries.move_to_end(blob)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = COMPRESSION_CODECS[blob.codec].decompress(blob.raw).decode('utf-8')
+        self.put(blob, data)
+        return data
+
+    def put(self, blob, data):
+        # Entries larger than the whole budget are never cached
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            self.discard(blob)
+            self.entries[blob] = data
+            self.size += len(data)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def discard(self, blob):
+        with self.lock:
+            data = self.entries.pop(blob, None)
+            if data is not None:
+                self.size -= len(data)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+decompressed_cache = DecompressedCache()
+
+
+class GenerationCounter:
+    """
+    Monotonic counter stamped on nodes as they are modified, so changes
+    can be found with VirtualFileSystem.changed_since.
+    """
+    def __init__(self):
+        self.value = 0
+
+    def next(self):
+        self.value += 1
+        return self.value
+
+    def advance(self, value):
+        # Never hand out a generation already used by a loaded image
+        self.value = max(self.value, value)
+
+
+generations = GenerationCounter()
+
+
+class Blob:
+    """
+    Content shared between reflinked files. A blob is copied the first
+    time one of its holders writes to it (copy-on-write).
+
+    Content at or above compression_threshold characters is stored
+    compressed when a codec is given and decompressed lazily on read.
+
+    Every blob keeps the sha256 of its stored bytes, updated on write, so
+    its integrity can be verified without decompressing it.
+
+    A blob pinned by an ImageSnapshot that is being saved is copied on
+    write as well, so the snapshot keeps the content it was taken with.
+    """
+    compression_threshold = 4096
+    read_only = False
+    pins = 0
+
+    def __init__(self, data="", codec=None):
+        self.refs = 0
+        self.store(data, codec)
+
+    def store(self, data, codec=None):
+        decompressed_cache.discard(self)
+        if codec and len(data) >= self.compression_threshold:
+            self.codec = codec
+            self.raw = COMPRESSION_CODECS[codec].compress(data.encode('utf-8'))
+            # The freshly written content is likely to be read again soon
+            decompressed_cache.put(self, data)
+        else:
+            self.codec = None
+            self.raw = data
+        self.checksum = self.compute_checksum()
+
+    @classmethod
+    def from_raw(cls, raw, codec=None, checksum=None):
+        """
+        Build a blob from already stored content (compressed bytes if codec is set).
+        A checksum loaded alongside the content is kept so later corruption shows up.
+        """
+        blob = cls()
+        blob.codec = codec
+        blob.raw = raw
+        blob.checksum = checksum if checksum is not None else blob.compute_checksum()
+        return blob
+
+    def stored_bytes(self):
+        """
+        The content exactly as stored: compressed bytes, or the UTF-8 encoded text.
+        """
+        return self.raw if self.codec else self.raw.encode('utf-8')
+
+    def compute_checksum(self):
+        return hashlib.sha256(self.stored_bytes()).digest()
+
+    def verify(self):
+        """
+        Check the stored bytes against the checksum recorded on write.
+        """
+        return self.compute_checksum() == self.checksum
+
+    @property
+    def data(self):
+        if self.codec is None:
+            return self.raw
+        return decompressed_cache.get(self)
+
+    def stored_size(self):
+        """
+        Size of the content as held in memory (compressed bytes or characters).
+        """
+        return len(self.raw)
+
+
+class MappedBlob(Blob):
+    """
+    Read-only content backed by a memory-mapped boot image. Files holding
+    one get a private Blob on their first write.
+    """
+    read_only = True
+
+    def __init__(self, mapping, offset, length, checksum):
+        self.refs = 0
+        self.codec = None
+        self.mapping = mapping
+        self.offset = offset
+        self.length = length
+        self.checksum = checksum
+
+    def store(self, data, codec=None):
+        raise PermissionError(errno.EROFS, "Read-only file system")
+
+    @property
+    def data(self):
+        return self.mapping[self.offset:self.offset + self.length].decode('utf-8', errors='ignore')
+
+    @property
+    def raw(self):
+        return self.data
+
+    def stored_bytes(self):
+        return self.mapping[self.offset:self.offset + self.length]
+
+    def stored_size(self):
+        # Content lives in the mapping, not on the heap, until it is detached
+        return 0 if isinstance(self.mapping, mmap.mmap) else self.length
+
+    def detach(self):
+        """
+        Copy the content out of the mapping, so the image can be unmapped
+        while files still hold this blob.
+        """
+        if isinstance(self.mapping, mmap.mmap):
+            self.mapping = self.mapping[self.offset:self.offset + self.length]
+            self.offset = 0
+
 
 class File:
-    def __init__(self, name, content="", permissions=""):
+    generation = 0  # Generation of the last modification
+    history = None  # FileHistory when versioning is enabled
+
+    def __init__(self, name, content="", permissions="", blob=None, compression=None):
         self.name = name
-        self.content = content
+        self.compression = compression  # Codec name from COMPRESSION_CODECS or None
+        self.blob = blob if blob is not None else Blob(content, compression)
+        self.blob.refs += 1
+        self.nlink = 0  # Number of directory entries pointing at this file
         self.permissions = permissions if permissions else "rw-r--r--"  # Default permissions: rw-r--r--
 
+    @property
+    def content(self):
+        return self.blob.data
+
+    @content.setter
+    def content(self, content):
+        self.write(content)
+
     def read(self):
-        return self.content
+        return self.blob.data
 
     def write(self, content):
-        self.content = content
+        if self.history is not None:
+            self.history.record(self.read(), content)
+        # Break the share if another file still references this blob
+        if self.blob.refs > 1 or self.blob.pins or self.blob.read_only:
+            self.blob.refs -= 1
+            self.blob = Blob()
+            self.blob.refs = 1
+        self.blob.store(content, self.compression)
+
+    def set_compression(self, codec):
+        """
+        Change the codec used for this file and re-store its content.
+        """
+        if codec is not None and codec not in COMPRESSION_CODECS:
+            raise ValueError(f"Unknown compression codec: {codec}")
+        content = self.read()
+        self.compression = codec
+        self.write(content)  # Same content, so no version is recorded
+
+    def reflink(self, name):
+        """
+        Create a new file sharing this file's content until either is written.
+        """
+        return File(name, permissions=self.permissions, blob=self.blob, compression=self.compression)
+
+    def unlink(self):
+        """
+        Drop one directory entry; releases the blob once no entries remain.
+        """
+        self.nlink -= 1
+        if self.nlink <= 0:
+            self.blob.refs -= 1
+
+
+class Symlink:
+    generation = 0
+    parent = None
+
+    def __init__(self, name, target, permissions=""):
+        self.name = name
+        self.target = target
+        self.nlink = 0
+        self.permissions = permissions if permissions else "rwxrwxrwx"  # Symlinks are always rwxrwxrwx
+
+    def read(self):
+        return self.target
+
+    def unlink(self):
+        self.nlink -= 1
+
+class SortedNames:
+    """
+    Sorted list of names kept as a list of blocks of about `load` names,
+    a flat B-tree: inserts and removes touch one small block instead of
+    shifting the whole list, and positions are found by bisecting the
+    block maxima.
+    """
+    load = 1000
+
+    def __init__(self, names=()):
+        names = sorted(names)
+        self.blocks = [names[index:index + self.load] for index in range(0, len(names), self.load)]
+        self.maxes = [block[-1] for block in self.blocks]
+        self.size = len(names)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def add(self, name):
+        self.size += 1
+        if not self.blocks:
+            self.blocks.append([name])
+            self.maxes.append(name)
+            return
+        index = bisect_left(self.maxes, name)
+        if index == len(self.blocks):
+            index -= 1
+            self.blocks[index].append(name)
+            self.maxes[index] = name
+        else:
+            insort(self.blocks[index], name)
+        block = self.blocks[index]
+        if len(block) > 2 * self.load:
+            self.blocks[index:index + 1] = [block[:self.load], block[self.load:]]
+            self.maxes[index:index + 1] = [block[self.load - 1], block[-1]]
+
+    def remove(self, name):
+        index = bisect_left(self.maxes, name)
+        block = self.blocks[index]
+        del block[bisect_left(block, name)]
+        self.size -= 1
+        if block:
+            self.maxes[index] = block[-1]
+        else:
+            del self.blocks[index]
+            del self.maxes[index]
+
+    def clear(self):
+        self.blocks, self.maxes, self.size = [], [], 0
+
+    def position(self, name):
+        """
+        Number of names that sort before name.
+        """
+        index = bisect_left(self.maxes, name)
+        if index == len(self.blocks):
+            return self.size
+        return sum(len(block) for block in self.blocks[:index]) + bisect_left(self.blocks[index], name)
+
+    def slice(self, low, high):
+        """
+        Names at positions low..high, like list slicing.
+        """
+        names = []
+        for block in self.blocks:
+            if low >= high:
+                break
+            if low < len(block):
+                names.extend(block[low:high])
+            low = max(0, low - len(block))
+            high -= len(block)
+        return names
+
+
+class SortedEntries(dict):
+    """
+    Directory entries: a dict that also keeps its names sorted, so listings
+    come out ordered and pages, prefixes and name ranges are found by
+    bisection instead of sorting on every call.
+    """
+    def __init__(self, entries=()):
+        super().__init__(entries)
+        self.names = SortedNames(super().keys())
+
+    def __setitem__(self, name, item):
+        if name not in self:
+            self.names.add(name)
+        super().__setitem__(name, item)
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self.names.remove(name)
+
+    def pop(self, name, *default):
+        if name not in self:
+            return super().pop(name, *default)
+        self.names.remove(name)
+        return super().pop(name)
+
+    def popitem(self):
+        name, item = super().popitem()
+        self.names.remove(name)
+        return name, item
+
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self[name] = default
+        return self[name]
+
+    def update(self, *args, **kwargs):
+        for name, item in dict(*args, **kwargs).items():
+            self[name] = item
+
+    def clear(self):
+        super().clear()
+        self.names.clear()
+
+    def copy(self):
+        return SortedEntries(self)
+
+    def __reduce__(self):
+        # Rebuilt from the items alone, the name index is derived
+        return (SortedEntries, (dict(self),))
+
+    def bounds(self, prefix=None, start=None, stop=None):
+        """
+        Position range in names of the entries with the given prefix and
+        with start <= name < stop.
+        """
+        low, high = 0, len(self.names)
+        if prefix:
+            low = self.names.position(prefix)
+            # The first string after every string starting with prefix
+            high = self.names.position(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        if start is not None:
+            low = max(low, self.names.position(start))
+        if stop is not None:
+            high = min(high, self.names.position(stop))
+        return low, max(low, high)
+
 
 class DirectoryEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -26,10 +454,14 @@ class DirectoryEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 class Directory:
+    read_only = False  # Set on directories mounted from the boot image
+    generation = 0  # Last time an entry was added or removed
+    subtree_generation = 0  # Newest generation anywhere below this directory
+
     def __init__(self, name, parent=None, permissions=""):
         self.name = name
-        self.subdirectories = {}
-        self.files = {}
+        self.subdirectories = SortedEntries()
+        self.files = SortedEntries()
         self.parent = parent
         self.permissions = permissions if permissions else "rwxr-xr-x"  # Default permissions: rwxr-xr-x
 
@@ -45,12 +477,60 @@ class Directory:
         del self.subdirectories[name]
 
     def add_file(self, file, permissions=""):
-        self.files[file.name] = file
+        self.link_file(file.name, file)
         file.parent = self
         file.permissions = permissions if permissions else "rw-r--r--"  # Default permissions: rw-r--r--
 
+    def link_file(self, name, file):
+        """
+        Add a directory entry for an existing file (hard link or symlink).
+        """
+        previous = self.files.get(name)
+        if previous is file:
+            return
+        if previous is not None:
+            previous.unlink()
+        self.files[name] = file
+        file.nlink += 1
+
     def remove_file(self, name):
-        del self.files[name]
+        self.files.pop(name).unlink()
+
+    def list_entries(self, offset=0, limit=None, prefix=None, start=None, stop=None):
+        """
+        List entries in name order, subdirectories before files.
+
+        Parameters:
+            offset (int): Number of matching entries to skip.
+            limit (int): Maximum number of entries to return, None for all.
+            prefix (str): Only names starting with prefix.
+            start (str): Only names >= start.
+            stop (str): Only names < stop.
+
+        Returns:
+            list: (name, item) tuples.
+        """
+        entries = []
+        for table in (self.subdirectories, self.files):
+            low, high = table.bounds(prefix, start, stop)
+            skipped = min(offset, high - low)
+            offset -= skipped
+            low += skipped
+            if limit is not None:
+                high = min(high, low + limit - len(entries))
+            entries.extend((name, table[name]) for name in table.names.slice(low, high))
+            if limit is not None and len(entries) >= limit:
+                break
+        return entries
+
+    def release(self):
+        """
+        Drop the directory entries of every file in this subtree.
+        """
+        for file in self.files.values():
+            file.unlink()
+        for subdirectory in self.subdirectories.values():
+            subdirectory.release()
 
     def get_subdirectory(self, name):
         """
@@ -123,10 +603,12 @@ class Directory:
                 new_subdirectory = subdirectory.deepcopy(copied_directories, skip_directories)
                 new_directory.add_subdirectory(new_subdirectory)
 
-        # Copy files to the new directory
+        # Copy files to the new directory, sharing content with the original
         for file_name, file in self.files.items():
-            new_file = File(file_name, content=file.content, permissions=file.permissions)
-            new_directory.add_file(new_file)
+            if isinstance(file, Symlink):
+                new_directory.link_file(file_name, Symlink(file_name, file.target))
+            else:
+                new_directory.add_file(file.reflink(file_name), file.permissions)
 
         return new_directory
 
@@ -138,7 +620,8 @@ class Directory:
             'name': self.name,
             'permissions': self.permissions,
             'subdirectories': {name: subdir.to_dict() for name, subdir in self.subdirectories.items()},
-            'files': {name: {'content': file.content, 'permissions': file.permissions} for name, file in self.files.items()}
+            'files': {name: {'symlink': file.target, 'permissions': file.permissions} if isinstance(file, Symlink)
+                      else {'content': file.content, 'permissions': file.permissions} for name, file in self.files.items()}
         }
         return directory_dict
 
@@ -148,8 +631,12 @@ class Directory:
         Create a Directory object from a dictionary.
         """
         directory = cls(directory_dict['name'], permissions=directory_dict['permissions'])
-        directory.subdirectories = {name: cls.from_dict(subdir_dict) for name, subdir_dict in directory_dict['subdirectories'].items()}
-        directory.files = {name: File(name, content=file_dict['content'], permissions=file_dict['permissions']) for name, file_dict in directory_dict['files'].items()}
+        directory.subdirectories = SortedEntries({name: cls.from_dict(subdir_dict) for name, subdir_dict in directory_dict['subdirectories'].items()})
+        for name, file_dict in directory_dict['files'].items():
+            if 'symlink' in file_dict:
+                directory.link_file(name, Symlink(name, file_dict['symlink']))
+            else:
+                directory.add_file(File(name, content=file_dict['content']), file_dict['permissions'])
         return directory
 
 
@@ -286,6 +773,11 @@ class Directory:
 class VirtualFileSystem:
     def __init__(self, permissions=""):
         self.permissions = permissions if permissions else "rwxr-xr-x"
+        # Guards the whole tree, see virtuallock.py
+        self.lock = ReadWriteLock()
+        self.save_lock = threading.Lock()
+        self.save_sequence = 0  # Last save started
+        self.saved_sequence = 0  # Last save whose image is in place
         self.kernel = VirtualKernel()
         self.kernel.log_command("Kernel Module for VirtualFileSystem loaded")
         self.root = Directory("")
@@ -293,8 +785,7 @@ class VirtualFileSystem:
         self.current_directory = self.root
         self.kernel.log_command(f"Setting Default Directory: {self.current_directory.get_full_path()}")
         self.kernel.log_command("Loading OS and Placing OS files...")
-        self.add_os_filesystem(self.filesystem_data)
-        self.add_bin_files()
+        self.mount_boot_image()
         self.users = {}
 
 
@@ -331,30 +822,205 @@ class VirtualFileSystem:
         return True  # User's permissions are sufficient for all operations
 
 
+    @reads
     def find_item(self, path):
         """
         Find an item (file or directory) in the filesystem given its path.
+        Symlinks along the path are followed.
         """
-        # Split the path into directory components
-        components = path.strip("/").split("/")
-        
-        # Start from the root directory
-        current_directory = self.root
+        try:
+            return self.resolve_path(self.root, path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise FileNotFoundError(f"Item '{path}' not found.")
 
-        # Traverse through each component of the path
-        for component in components:
-            if component == "":
-                continue
-            if component not in current_directory.subdirectories and component not in current_directory.files:
+    @reads
+    def resolve_path(self, current_directory, path, follow_symlinks=True, depth=0):
+        """
+        Resolve a path to a Directory, File or Symlink.
+
+        Parameters:
+            current_directory (Directory): Directory relative paths start from.
+            path (str): The path to resolve.
+            follow_symlinks (bool): Whether a symlink in the last component is followed.
+            depth (int): Number of symlinks already followed (loop protection).
+
+        Returns:
+            Directory, File or Symlink: The item the path points at.
+        """
+        if depth > MAX_SYMLINK_FOLLOWS:
+            raise OSError(errno.ELOOP, "Too many levels of symbolic links", path)
+        if path.startswith('/'):
+            current_directory = self.root
+
+        components = [component for component in path.split('/') if component and component != '.']
+        item = current_directory
+        for index, component in enumerate(components):
+            if not isinstance(item, Directory):
+                raise NotADirectoryError(f"Not a directory: {path}")
+            last = index == len(components) - 1
+            if component == '..':
+                item = item.parent or item
+            elif component in item.subdirectories:
+                item = item.subdirectories[component]
+            elif component in item.files:
+                entry = item.files[component]
+                if isinstance(entry, Symlink) and (follow_symlinks or not last):
+                    entry = self.resolve_path(item, entry.target, True, depth + 1)
+                item = entry
+            else:
                 raise FileNotFoundError(f"Item '{path}' not found.")
-            if component in current_directory.subdirectories:
-                current_directory = current_directory.subdirectories[component]
-            elif component in current_directory.files:
-                return current_directory.files[component]
+        return item
+
+    def mark_changed(self, *items):
+        """
+        Stamp items with a new generation and record it as the subtree
+        generation of every directory above them, so changed_since can skip
+        subtrees that were not touched. A directory is stamped itself when
+        entries were added to or removed from it. Callers hold the write lock.
 
-        # Return the final item
-        return current_directory
+        Only the parent a file was created in is propagated; writes through
+        a hard link in another directory are found from that parent.
+        """
+        generation = generations.next()
+        for item in items:
+            item.generation = generation
+            directory = item if isinstance(item, Directory) else item.parent
+            while directory is not None and directory.subtree_generation != generation:
+                directory.subtree_generation = generation
+                directory = directory.parent
+        return generation
+
+    @reads
+    def changed_since(self, generation, path="/"):
+        """
+        List (path, item) for every directory, file and symlink below path
+        modified after generation. Directories are listed when entries were
+        added to or removed from them; subtrees with nothing newer are skipped
+        without being visited.
 
+        Parameters:
+            generation (int): Generation of the last backup, 0 for everything.
+            path (str): Directory to search from.
+        """
+        changed = []
+        start = self.find_directory(self.root, path)
+        stack = [(start, start.get_full_path() or "/")]
+        while stack:
+            directory, directory_path = stack.pop()
+            if directory.subtree_generation <= generation and directory.generation <= generation:
+                continue
+            if directory.generation > generation:
+                changed.append((directory_path, directory))
+            for name, file in directory.files.items():
+                if file.generation > generation:
+                    changed.append((os.path.join(directory_path, name), file))
+            for name, subdirectory in directory.subdirectories.items():
+                stack.append((subdirectory, os.path.join(directory_path, name)))
+        return changed
+
+    def check_writable(self, directory):
+        """
+        Raise if directory belongs to a read-only mount.
+        """
+        if directory.read_only:
+            raise PermissionError(errno.EROFS, "Read-only file system", directory.get_full_path())
+
+    @writes
+    def link(self, target_path, link_path):
+        """
+        Create a hard link at link_path to the file at target_path.
+        """
+        target = self.resolve_path(self.root, target_path)
+        if isinstance(target, Directory):
+            raise IsADirectoryError("Hard links to directories are not allowed")
+        directory_path, link_name = os.path.split(link_path)
+        parent_directory = self.find_directory(self.root, directory_path)
+        self.check_writable(parent_directory)
+        # Boot image files live on their own read-only mount
+        if target.parent.read_only:
+            raise OSError(errno.EXDEV, "Invalid cross-device link", target_path)
+        if link_name in parent_directory.files or link_name in parent_directory.subdirectories:
+            raise FileExistsError("File already exists")
+        parent_directory.link_file(link_name, target)
+        self.mark_changed(parent_directory)
+        self.kernel.log_command(f"Linked {link_path} to {target_path} (links: {target.nlink})")
+
+    @writes
+    def symlink(self, target, link_path):
+        """
+        Create a symbolic link at link_path pointing at target. The target
+        is stored as given and is not required to exist.
+        """
+        directory_path, link_name = os.path.split(link_path)
+        parent_directory = self.find_directory(self.root, directory_path)
+        self.check_writable(parent_directory)
+        if link_name in parent_directory.files or link_name in parent_directory.subdirectories:
+            raise FileExistsError("File already exists")
+        link = Symlink(link_name, target)
+        parent_directory.link_file(link_name, link)
+        link.parent = parent_directory
+        self.mark_changed(parent_directory, link)
+        self.kernel.log_command(f"Created symlink: {link_path} -> {target}")
+
+    @reads
+    def readlink(self, path):
+        item = self.resolve_path(self.root, path, follow_symlinks=False)
+        if not isinstance(item, Symlink):
+            raise OSError(errno.EINVAL, "Not a symbolic link", path)
+        return item.target
+
+    @writes
+    def set_compression(self, path, codec):
+        """
+        Set the compression codec of a file, or of every file below a
+        directory. Content under Blob.compression_threshold stays uncompressed.
+
+        Parameters:
+            path (str): Path to a file or directory.
+            codec (str): One of COMPRESSION_CODECS, or None to store uncompressed.
+
+        Returns:
+            int: The number of files updated.
+        """
+        item = self.find_item(path)
+        if isinstance(item, File):
+            self.check_writable(item.parent)
+            item.set_compression(codec)
+            return 1
+        if item.read_only:
+            return 0
+        count = 0
+        for file in item.files.values():
+            if isinstance(file, File):
+                file.set_compression(codec)
+                count += 1
+        for subdirectory in item.subdirectories.values():
+            count += self.set_compression(subdirectory.get_full_path(), codec)
+        return count
+
+    @writes
+    def copy_file(self, src_path, dest_path, reflink=False):
+        """
+        Copy a file. With reflink the copy shares content with the source
+        until one of them is written.
+        """
+        source = self.resolve_path(self.root, src_path)
+        if not isinstance(source, File):
+            raise FileNotFoundError("File not found")
+        if not self.check_permissions(source.permissions, "read"):
+            raise PermissionError("Permission denied: read access not allowed for file")
+        directory_path, filename = os.path.split(dest_path)
+        parent_directory = self.find_directory(self.root, directory_path)
+        self.check_writable(parent_directory)
+        if reflink:
+            copy = source.reflink(filename)
+        else:
+            copy = File(filename, source.read(), compression=source.compression)
+        parent_directory.add_file(copy, source.permissions)
+        self.mark_changed(parent_directory, copy)
+        self.kernel.log_command(f"Copied file: {src_path} to {dest_path}{' (reflink)' if reflink else ''}")
+
+    @reads
     def compare_directories(self, path1, path2):
         """
         Compare contents of two directories recursively.
@@ -400,6 +1066,7 @@ class VirtualFileSystem:
         return diff
 
 
+    @reads
     def directory_exists(self, path):
         try:
             self.find_directory(self.root, path)
@@ -435,6 +1102,7 @@ class VirtualFileSystem:
         default_directory = self._decode_directory(default_filesystem_data)
         self.root = default_directory
 
+    @writes
     def reset_filesystem(self):
         # Backup the /home directory
         home_directory = self.root.get_subdirectory("home")
@@ -445,11 +1113,11 @@ class VirtualFileSystem:
         # Restore the /home directory
         if home_directory:
             self.root.add_subdirectory(home_directory)
-            self.add_os_filesystem(self.filesystem_data)
+            self.mount_boot_image()
 
-    def add_os_filesystem(self, filesystem_data):
-        # Add provided files to their relevant locations
-        provided_files = {
+    def os_files(self):
+        # Host files placed in the system directories, mapped to their VFS location
+        return {
             "virtualkernel.py": {"name": "boot/virtualkernel"},  # Place virtualkernel.py in /boot
             os.path.abspath("../src/vui/vterminal.py"): {"name": "boot/virtualos"},  # Place virtualos.py in /boot
             "virtualfs.py": {"name": "boot/virtualfs"},  # Place virtualfs.py in /boot
@@ -458,6 +1126,50 @@ class VirtualFileSystem:
             os.path.abspath("../src/vapi/vapi.py"): {"name": "dev/vapi"}
         }
 
+    def boot_sources(self):
+        """
+        Every host file baked into the file system at boot, as
+        (vfs_path, host_path) pairs.
+        """
+        sources = []
+        for file_name, file_data in self.os_files().items():
+            sources.append((file_data["name"], os.path.join(os.path.dirname(__file__), file_name)))
+
+        vbin_directory = os.path.join(os.path.dirname(__file__), os.path.abspath("../src/vbin/"))
+        for filename in sorted(os.listdir(vbin_directory)):
+            if filename.endswith(".py"):
+                sources.append(("bin/" + os.path.splitext(filename)[0], os.path.join(vbin_directory, filename)))
+        return sources
+
+    def mount_boot_image(self):
+        """
+        Mount /bin, /boot, /sbin and /dev read-only from the memory-mapped
+        boot image, rebuilding the image if the host files changed. Falls
+        back to reading the host files directly if the image can't be used.
+        """
+        try:
+            image = BootImage.load(os.path.abspath("../src/vinit/boot.img"), self.boot_sources())
+        except (OSError, ValueError) as e:
+            self.kernel.log_command(f"[!] Boot image unavailable, loading OS files directly: {e}")
+            self.add_os_filesystem(self.filesystem_data)
+            self.add_bin_files()
+            return
+
+        for name in READ_ONLY_MOUNTS:
+            existing = self.root.get_subdirectory(name)
+            mount = Directory(name)
+            mount.read_only = True
+            self.root.add_directory(mount, existing.permissions if existing else "")
+
+        for entry in image.entries:
+            directory_name, file_name = os.path.split(entry.vfs_path)
+            parent_directory = self.find_directory(self.root, directory_name)
+            parent_directory.add_file(File(file_name, blob=image.blob(entry)))
+        self.kernel.log_command(f"Mounted boot image: {len(image.entries)} files")
+
+    def add_os_filesystem(self, filesystem_data):
+        # Add provided files to their relevant locations
+        provided_files = self.os_files()
         for file_name, file_data in provided_files.items():
             file_path = os.path.join(os.path.dirname(__file__), file_name)
 
@@ -498,6 +1210,7 @@ class VirtualFileSystem:
 
 
 
+    @reads
     def file_exists(self, path):
         directory_path, filename = os.path.split(path)
         parent_directory = self.find_directory(self.root, directory_path)
@@ -506,14 +1219,19 @@ class VirtualFileSystem:
         else:
             return False
 
+    @writes
     def create_directory(self, path):
         current_directory = self.root
         for directory_name in path.split('/'):
             if directory_name:
                 if directory_name not in current_directory.subdirectories:
-                    current_directory.add_directory(Directory(directory_name, current_directory))
+                    self.check_writable(current_directory)
+                    new_directory = Directory(directory_name, current_directory)
+                    current_directory.add_directory(new_directory)
+                    self.mark_changed(current_directory, new_directory)
                 current_directory = current_directory.subdirectories[directory_name]
 
+    @writes
     def remove_directory(self, path):
         current_directory = self.root
         parts = path.split('/')
@@ -525,82 +1243,195 @@ class VirtualFileSystem:
                     raise FileNotFoundError("Directory not found")
         directory_name = parts[-1]
         if directory_name in current_directory.subdirectories:
-            del current_directory.subdirectories[directory_name]
+            self.check_writable(current_directory)
+            self.check_writable(current_directory.subdirectories[directory_name])
+            current_directory.subdirectories.pop(directory_name).release()
+            self.mark_changed(current_directory)
         else:
             raise FileNotFoundError("Directory not found")
 
+    @reads
     def find_directory(self, current_directory, path):
         if not path:
             return self.root
-        if path.startswith('/'):
-            current_directory = self.root
-
-        for directory_name in path.split('/'):
-            if directory_name:
-                if directory_name == '..':
-                    current_directory = current_directory.parent
-                elif directory_name in current_directory.subdirectories:
-                    current_directory = current_directory.subdirectories[directory_name]
-                else:
-                    raise FileNotFoundError("Directory not found")
+        try:
+            directory = self.resolve_path(current_directory, path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise FileNotFoundError("Directory not found")
+        if not isinstance(directory, Directory):
+            raise FileNotFoundError("Directory not found")
+        return directory
 
-        return current_directory
+    def _lookup_file(self, directory, filename):
+        """
+        Return the File named filename in directory, following symlinks,
+        or None if there is no such file.
+        """
+        if filename not in directory.files:
+            return None
+        try:
+            item = self.resolve_path(directory, filename)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return item if isinstance(item, File) else None
 
+    @writes
     def create_file(self, path, content="", permissions=""):
         directory_path, filename = os.path.split(path)
         parent_directory = self.find_directory(self.root, directory_path)
+        self.check_writable(parent_directory)
+        # Overwriting a versioned file keeps its history
+        existing = self._lookup_file(parent_directory, filename)
+        if existing is not None and existing.history is not None:
+            self.update_file(path, content)
+            return
         new_file = File(filename, content, permissions)
-        parent_directory.add_file(new_file)
+        parent_directory.add_file(new_file, new_file.permissions)
+        self.mark_changed(parent_directory, new_file)
+        charge_written(len(content))
         self.kernel.log_command(f"Created file: {os.path.join(parent_directory.get_full_path(), filename)}")
 
+    @reads
     def read_file(self, path):
         directory_path, filename = os.path.split(path)
         parent_directory = self.find_directory(self.root, directory_path)
-        if filename in parent_directory.files:
+        file = self._lookup_file(parent_directory, filename)
+        if file is not None:
             # Check permissions before allowing file access
-            if self.check_permissions(parent_directory.files[filename].permissions, "read"):
-                return parent_directory.files[filename].read()
+            if self.check_permissions(file.permissions, "read"):
+                content = file.read()
+                charge_read(len(content))
+                return content
             else:
                 raise PermissionError("Permission denied: read access not allowed for file")
         else:
             raise FileNotFoundError("File not found")
 
+    @writes
     def write_file(self, path, content):
         directory_path, filename = os.path.split(path)
         parent_directory = self.find_directory(self.root, directory_path)
     
         # Check if the file already exists
-        if filename in parent_directory.files:
+        file = self._lookup_file(parent_directory, filename)
+        if file is not None:
             # Append content to the existing file
-            parent_directory.files[filename].content += content
+            self.check_writable(file.parent)
+            file.write(file.read() + content)
+            self.mark_changed(file)
+            charge_written(len(content))
             self.kernel.log_command(f"Appended content to file: {os.path.join(parent_directory.get_full_path(), filename)}")
         else:
             # Create a new file with the given content
+            self.check_writable(parent_directory)
             new_file = File(filename, content)
             parent_directory.add_file(new_file)
+            self.mark_changed(parent_directory, new_file)
+            charge_written(len(content))
             self.kernel.log_command(f"Created file: {os.path.join(parent_directory.get_full_path(), filename)}")
 
+    @writes
+    def update_file(self, path, content):
+        """
+        Replace the content of a file, creating it if it does not exist.
+        Unlike create_file an existing file keeps its links and permissions.
+        """
+        directory_path, filename = os.path.split(path)
+        parent_directory = self.find_directory(self.root, directory_path)
+        file = self._lookup_file(parent_directory, filename)
+        if file is None:
+            self.create_file(path, content)
+            return
+        self.check_writable(file.parent)
+        file.write(content)
+        self.mark_changed(file)
+        charge_written(len(content))
+        self.kernel.log_command(f"Updated file: {os.path.join(parent_directory.get_full_path(), filename)}")
+
+    @writes
+    def set_versioning(self, path, enabled=True, keep=None):
+        """
+        Turn version history on or off for a file. Disabling drops the
+        stored versions.
+
+        Parameters:
+            path (str): Path to the file.
+            enabled (bool): Whether earlier versions are kept from now on.
+            keep (int): Number of versions to retain, None keeps the current limit.
+        """
+        file = self.resolve_path(self.root, path)
+        if not isinstance(file, File):
+            raise FileNotFoundError("File not found")
+        self.check_writable(file.parent)
+        if not enabled:
+            file.history = None
+        else:
+            if file.history is None:
+                file.history = FileHistory()
+            if keep is not None:
+                file.history.keep = keep
+                file.history.trim()
+        self.mark_changed(file)
+        return file.history
+
+    @reads
+    def file_history(self, path):
+        """
+        Return (number, timestamp, size) of every retained version of a
+        file, newest first, or None if the file is not versioned.
+        """
+        file = self.resolve_path(self.root, path)
+        if not isinstance(file, File):
+            raise FileNotFoundError("File not found")
+        if file.history is None:
+            return None
+        return file.history.entries(len(file.read()))
+
+    @writes
+    def restore_version(self, path, number):
+        """
+        Make an earlier version the current content. The content it
+        replaces is kept as a new version, so a restore can be undone.
+        """
+        file = self.resolve_path(self.root, path)
+        if not isinstance(file, File) or file.history is None:
+            raise FileNotFoundError("No version history for file")
+        content = file.history.content_at(file.read(), number)
+        self.update_file(path, content)
+        self.kernel.log_command(f"Restored {path} to version {number}")
+
+    @writes
     def remove_file(self, path):
         directory_path, filename = os.path.split(path)
         parent_directory = self.find_directory(self.root, directory_path)
         if filename in parent_directory.files:
+            self.check_writable(parent_directory)
             # Check permissions before allowing file deletion
             if self.check_permissions(parent_directory.files[filename].permissions, "execute"):
                 parent_directory.remove_file(filename)
+                self.mark_changed(parent_directory)
                 self.kernel.log_command(f"Removed file: {path}")
             else:
                 raise PermissionError("Permission denied: delete access not allowed for file")
         else:
             raise FileNotFoundError("File not found")
 
+    @writes
     def rename_file(self, old_path, new_path):
         old_directory_path, old_filename = os.path.split(old_path)
         new_directory_path, new_filename = os.path.split(new_path)
         old_parent_directory = self.find_directory(self.root, old_directory_path)
         new_parent_directory = self.find_directory(self.root, new_directory_path)
         if old_filename in old_parent_directory.files:
+            self.check_writable(old_parent_directory)
+            self.check_writable(new_parent_directory)
             if new_filename not in new_parent_directory.files:
-                new_parent_directory.add_file(old_parent_directory.files.pop(old_filename))
+                file = old_parent_directory.files[old_filename]
+                new_parent_directory.link_file(new_filename, file)
+                old_parent_directory.remove_file(old_filename)
+                file.name = new_filename
+                file.parent = new_parent_directory
+                self.mark_changed(old_parent_directory, new_parent_directory, file)
                 self.kernel.log_command(f"Renamed file: {old_path} to {new_path}")
             else:
                 raise FileExistsError("File already exists")
@@ -640,6 +1471,7 @@ class VirtualFileSystem:
 
 
 
+    @reads
     def get_permissions(self, path):
         # Find the directory or file based on the provided path
         item = self.find_item(path)
@@ -656,10 +1488,19 @@ class VirtualFileSystem:
             return "Item not found"
 
 
+    @writes
     def load_file_system(self, file_path):
         if os.path.exists(file_path):
             try:
                 with gzip.open(file_path, 'rb') as file:
+                    if is_image(file.read(len(IMAGE_MAGIC))):
+                        file.seek(0)
+                        reader = ImageReader(file)
+                        self.root = reader.read()
+                        generations.advance(reader.generation)
+                        return self.root
+                    # Images saved before the binary format are gzipped JSON
+                    file.seek(0)
                     data = json.loads(file.read().decode('utf-8'))
                     self.root = self._decode_directory(data)
                     return data
@@ -680,22 +1521,117 @@ class VirtualFileSystem:
             self.add_default_filesystem()
 
     def save_file_system(self, file_path):
-        with gzip.open(os.path.abspath("../src/vinit/file_system.json"), 'wb') as file:
-            encoded_data = json.dumps(self._encode_directory(self.root)).encode('utf-8')
-            file.write(encoded_data)
+        """
+        Save the tree to the image. Only taking a snapshot of the tree holds
+        the lock; the image is streamed from the snapshot into the compressor
+        on the thread pool as a savefs process, so the shell does not wait
+        for it and the uncompressed image is never held in memory.
+
+        Returns:
+            Future: Done once the image is in place.
+        """
+        image_path = os.path.abspath("../src/vinit/file_system.json")
+        # Readers may carry on while the tree is serialised, other saves wait
+        with self.save_lock, self.lock.reading():
+            snapshot = ImageSnapshot(self.root)
+            self.save_sequence += 1
+            sequence = self.save_sequence
+        task = self.kernel.run_process("savefs", self._write_image, (image_path, sequence, snapshot), "thread")
+        return task.future
+
+    def _write_image(self, image_path, sequence, snapshot):
+        # zlib releases the GIL, so this overlaps with the shell
+        temp_path = f"{image_path}.{sequence}.tmp"
+        try:
+            with gzip.open(temp_path, 'wb', compresslevel=6) as file:
+                with io.BufferedWriter(file, buffer_size=256 * 1024) as stream:
+                    ImageWriter(stream).write(snapshot)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            # Pins are counted under save_lock, like the snapshots are taken
+            with self.save_lock:
+                snapshot.release()
+        with self.save_lock:
+            # Saves can finish out of order; never replace a newer image
+            if sequence > self.saved_sequence:
+                os.replace(temp_path, image_path)
+                self.saved_sequence = sequence
+            else:
+                os.remove(temp_path)
 
-    def _encode_directory(self, directory):
+    @writes
+    def read_snapshot(self, path="/"):
+        """
+        Copy a subtree for lock-free reading. Files are reflinked, so the
+        copy is cheap and later writes to the live tree copy their content
+        instead of changing the snapshot. release() the snapshot when done
+        so live files stop copying on write.
+
+        Returns:
+            Directory: A detached copy of the directory at path.
+        """
+        return self.find_directory(self.root, path).deepcopy()
+
+    def _encode_directory(self, directory, links=None):
+        # links maps shared files and blobs to the id of their first occurrence
+        if links is None:
+            links = {'inodes': {}, 'blobs': {}}
         data = {
             'name': directory.name,
-            'files': {name: file.content for name, file in directory.files.items()},
-            'subdirectories': {name: self._encode_directory(subdirectory) for name, subdirectory in directory.subdirectories.items()}
+            'files': {name: self._encode_file(file, links) for name, file in directory.files.items()},
+            'subdirectories': {name: self._encode_directory(subdirectory, links) for name, subdirectory in directory.subdirectories.items()}
         }
         return data
 
-    def _decode_directory(self, data, parent=None):
+    def _encode_file(self, file, links):
+        """
+        Encode a file entry. Plain files are stored as their content; links
+        and shared content are stored once and referenced by id afterwards.
+        """
+        if isinstance(file, Symlink):
+            return {'symlink': file.target}
+        if file.nlink <= 1 and file.blob.refs <= 1 and file.compression is None:
+            return file.content
+        if id(file) in links['inodes']:
+            return {'hardlink': links['inodes'][id(file)]}
+        entry = {'permissions': file.permissions}
+        if file.compression:
+            entry['compression'] = file.compression
+        if file.nlink > 1:
+            entry['inode'] = links['inodes'][id(file)] = len(links['inodes'])
+        if file.blob.refs > 1:
+            if id(file.blob) in links['blobs']:
+                entry['blob'] = links['blobs'][id(file.blob)]
+                return entry
+            entry['blob'] = links['blobs'][id(file.blob)] = len(links['blobs'])
+        entry['content'] = file.content
+        return entry
+
+    def _decode_directory(self, data, parent=None, links=None):
+        if links is None:
+            links = {'inodes': {}, 'blobs': {}}
         directory = Directory(data['name'], parent)
-        for name, content in data['files'].items():
-            directory.add_file(File(name, content))
+        for name, entry in data['files'].items():
+            if isinstance(entry, str):
+                directory.add_file(File(name, entry))
+            elif 'symlink' in entry:
+                directory.link_file(name, Symlink(name, entry['symlink']))
+            elif 'hardlink' in entry:
+                directory.link_file(name, links['inodes'][entry['hardlink']])
+            else:
+                compression = entry.get('compression')
+                blob = links['blobs'].get(entry.get('blob'))
+                if blob is None:
+                    blob = Blob(entry.get('content', ""), compression)
+                    if 'blob' in entry:
+                        links['blobs'][entry['blob']] = blob
+                file = File(name, blob=blob, compression=compression)
+                directory.add_file(file, entry.get('permissions', ""))
+                if 'inode' in entry:
+                    links['inodes'][entry['inode']] = file
         for name, subdirectory_data in data['subdirectories'].items():
-            directory.add_directory(self._decode_directory(subdirectory_data, directory))
+            directory.add_directory(self._decode_directory(subdirectory_data, directory, links))
         return directory
@@ -0,0 +1,216 @@
+# virtualfsck.py
+#
+# Integrity checking for the virtual file system: a full consistency check
+# (fsck) that hashes blobs on a worker pool, and a background scrubber that
+# re-verifies blob checksums incrementally under a rate limit.
+
+import os
+import errno
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from vsystem.virtualfs import File, Symlink, decompressed_cache
+from vsystem.virtualkernel import VirtualProcess
+
+
+class FsckReport:
+    def __init__(self):
+        self.directories = 0
+        self.files = 0
+        self.symlinks = 0
+        self.blobs = 0
+        self.bytes_verified = 0
+        self.errors = []
+        self.warnings = []
+        self.repaired = 0
+
+    def clean(self):
+        return not self.errors
+
+    def lines(self):
+        """
+        Human readable summary, one line per entry.
+        """
+        lines = [f"{path}: {message}" for path, message in self.errors]
+        lines += [f"{path}: warning: {message}" for path, message in self.warnings]
+        lines.append(f"{self.directories} directories, {self.files} files, {self.symlinks} symlinks, "
+                     f"{self.blobs} blobs ({self.bytes_verified} bytes verified)")
+        if self.repaired:
+            lines.append(f"{self.repaired} problem(s) repaired")
+        lines.append("File system is clean" if self.clean() else f"{len(self.errors)} error(s) found")
+        return lines
+
+
+class FileSystemChecker:
+    """
+    Validate a tree: parent pointers, link counts, blob reference counts,
+    orphaned cache entries and content checksums. Checksums are verified
+    on a thread pool; hashlib releases the GIL for large buffers.
+    """
+    def __init__(self, fs, workers=None):
+        self.fs = fs
+        self.workers = workers or os.cpu_count() or 1
+
+    def check(self, path="/", repair=False):
+        # Repairs change the tree, a plain check only needs to keep writers out
+        with self.fs.lock.writing() if repair else self.fs.lock.reading():
+            return self._check(path, repair)
+
+    def _check(self, path, repair):
+        report = FsckReport()
+        start = self.fs.find_directory(self.fs.root, path)
+        # Link and reference counts can only be judged when every entry is seen
+        whole_tree = start is self.fs.root
+
+        entries = {}   # id(file) -> [file, entry count, containing directories, first path]
+        holders = {}   # id(blob) -> [blob, set of holding file ids, first path]
+        stack = [(start, start.get_full_path() or "/")]
+        while stack:
+            directory, directory_path = stack.pop()
+            report.directories += 1
+            for name, subdirectory in list(directory.subdirectories.items()):
+                subdirectory_path = os.path.join(directory_path, name)
+                if subdirectory.parent is not directory:
+                    report.errors.append((subdirectory_path, "bad parent pointer"))
+                    if repair:
+                        subdirectory.parent = directory
+                        report.repaired += 1
+                if subdirectory.name != name:
+                    report.errors.append((subdirectory_path, f"entry name differs from directory name '{subdirectory.name}'"))
+                stack.append((subdirectory, subdirectory_path))
+
+            for name, file in list(directory.files.items()):
+                file_path = os.path.join(directory_path, name)
+                if isinstance(file, Symlink):
+                    report.symlinks += 1
+                    self._check_symlink(directory, file, file_path, report)
+                    continue
+                report.files += 1
+                entry = entries.setdefault(id(file), [file, 0, [], file_path])
+                entry[1] += 1
+                entry[2].append(directory)
+                holder = holders.setdefault(id(file.blob), [file.blob, set(), file_path])
+                holder[1].add(id(file))
+
+        for file, count, directories, file_path in entries.values():
+            if not any(file.parent is directory for directory in directories) and whole_tree:
+                report.errors.append((file_path, "parent pointer does not match any directory entry"))
+                if repair:
+                    file.parent = directories[0]
+                    report.repaired += 1
+            if whole_tree and file.nlink != count:
+                report.errors.append((file_path, f"link count {file.nlink}, but {count} entries"))
+                if repair:
+                    file.nlink = count
+                    report.repaired += 1
+
+        for blob, files, blob_path in holders.values():
+            if blob.read_only or not whole_tree:
+                continue
+            if blob.refs < len(files):
+                report.errors.append((blob_path, f"blob shared by {len(files)} files but refcount is {blob.refs}"))
+            elif blob.refs > len(files):
+                # Harmless but forces a needless copy on the next write
+                report.warnings.append((blob_path, f"orphaned blob reference(s): refcount {blob.refs}, {len(files)} holder(s)"))
+            if blob.refs != len(files) and repair:
+                blob.refs = len(files)
+                report.repaired += 1
+
+        if whole_tree:
+            live = set(holders)
+            orphans = [blob for blob in list(decompressed_cache.entries) if id(blob) not in live]
+            if orphans:
+                # The cache is shared, other sessions' blobs show up here too
+                report.warnings.append(("<cache>", f"{len(orphans)} cached blob(s) not referenced by this tree"))
+                if repair:
+                    for blob in orphans:
+                        decompressed_cache.discard(blob)
+                    report.repaired += 1
+
+        report.blobs = len(holders)
+        self._verify_checksums(list(holders.values()), report)
+        return report
+
+    def _check_symlink(self, directory, link, link_path, report):
+        try:
+            self.fs.resolve_path(directory, link.target)
+        except FileNotFoundError:
+            report.warnings.append((link_path, f"dangling symlink to '{link.target}'"))
+        except NotADirectoryError:
+            report.warnings.append((link_path, f"symlink through a file '{link.target}'"))
+        except OSError as e:
+            if e.errno != errno.ELOOP:
+                raise
+            report.errors.append((link_path, "symlink loop"))
+
+    def _verify_checksums(self, holders, report):
+        def verify(holder):
+            blob = holder[0]
+            return holder, len(blob.stored_bytes()), blob.verify()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for holder, size, ok in pool.map(verify, holders):
+                report.bytes_verified += size
+                if not ok:
+                    report.errors.append((holder[2], "checksum mismatch"))
+
+
+class Scrubber(threading.Thread):
+    """
+    Background thread that walks the tree and re-verifies blob checksums,
+    sleeping between blobs to stay under bytes_per_second so it never
+    competes with the shell for long.
+    """
+    def __init__(self, fs, bytes_per_second=4 * 1024 * 1024, pass_interval=300):
+        super().__init__(name="scrubd", daemon=True)
+        self.fs = fs
+        self.bytes_per_second = bytes_per_second
+        self.pass_interval = pass_interval
+        self.stop_event = threading.Event()
+        self.passes = 0
+        self.scrubbed_files = 0
+        self.scrubbed_bytes = 0
+        self.errors = []
+
+    def run(self):
+        pid = self.fs.kernel.create_process("scrubd")
+        while not self.stop_event.is_set():
+            self.scrub_pass()
+            self.passes += 1
+            self.stop_event.wait(self.pass_interval)
+        if pid is not None:
+            VirtualProcess.kill_process(self.fs.kernel, pid)
+
+    def scrub_pass(self):
+        seen = set()
+        stack = [(self.fs.root, "")]
+        while stack and not self.stop_event.is_set():
+            directory, directory_path = stack.pop()
+            # Copy the entries so the shell can keep modifying the directory
+            with self.fs.lock.reading():
+                stack.extend((subdirectory, f"{directory_path}/{name}") for name, subdirectory in list(directory.subdirectories.items()))
+                files = list(directory.files.items())
+            for name, file in files:
+                if not isinstance(file, File) or id(file.blob) in seen:
+                    continue
+                # The lock is taken per blob so writers wait for one hash at most
+                with self.fs.lock.reading():
+                    blob = file.blob
+                    seen.add(id(blob))
+                    size = len(blob.stored_bytes())
+                    ok = blob.verify()
+                path = f"{directory_path}/{name}"
+                if not ok and path not in self.errors:
+                    self.errors.append(path)
+                    self.fs.kernel.log_command(f"[!] scrubd: checksum mismatch in {path}")
+                self.scrubbed_files += 1
+                self.scrubbed_bytes += size
+                if self.stop_event.wait(size / self.bytes_per_second):
+                    return
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self):
+        state = "running" if self.is_alive() else "stopped"
+        return (f"scrubd {state}: {self.passes} pass(es), {self.scrubbed_files} blobs, "
+                f"{self.scrubbed_bytes} bytes verified, {len(self.errors)} error(s)")
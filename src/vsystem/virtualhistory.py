@@ -0,0 +1,112 @@
+# virtualhistory.py
+#
+# Per-file version history stored as reverse line deltas.
+#
+# The current content of a versioned file lives in its blob as usual. Each
+# earlier version is kept as a delta that turns the next newer version back
+# into it (the RCS layout), so the newest versions are the cheapest to
+# reach and dropping the oldest version never touches the others. A delta
+# is a list of instructions built with difflib:
+#
+#   [start, end]   copy lines start..end of the newer version
+#   "text"         insert text that only the older version has
+#
+# so a version costs about the size of the lines that were edited.
+
+import time
+import difflib
+
+DEFAULT_KEEP = 20
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+
+def make_delta(newer, older):
+    """
+    Build the delta that rebuilds older from newer.
+    """
+    newer_lines = newer.splitlines(keepends=True)
+    older_lines = older.splitlines(keepends=True)
+    delta = []
+    matcher = difflib.SequenceMatcher(None, newer_lines, older_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j1 < j2:
+            delta.append("".join(older_lines[j1:j2]))
+    return delta
+
+
+def apply_delta(newer, delta):
+    newer_lines = newer.splitlines(keepends=True)
+    parts = []
+    for instruction in delta:
+        if isinstance(instruction, str):
+            parts.append(instruction)
+        else:
+            parts.extend(newer_lines[instruction[0]:instruction[1]])
+    return "".join(parts)
+
+
+def delta_size(delta):
+    # Copies are two integers, count them as 8 bytes
+    return sum(len(instruction) if isinstance(instruction, str) else 8 for instruction in delta)
+
+
+class FileHistory:
+    """
+    Earlier versions of one file. Versions are numbered from 1; the
+    current content is version `current`.
+    """
+    def __init__(self, keep=DEFAULT_KEEP, max_bytes=DEFAULT_MAX_BYTES):
+        self.keep = keep
+        self.max_bytes = max_bytes
+        self.current = 1
+        self.modified = time.time()  # When the current version was written
+        self.versions = []  # [number, timestamp, size, delta], oldest first
+
+    def record(self, old_content, new_content):
+        """
+        Keep old_content as a version before new_content replaces it.
+        """
+        if old_content == new_content:
+            return
+        delta = make_delta(new_content, old_content)
+        self.versions.append([self.current, self.modified, len(old_content), delta])
+        self.current += 1
+        self.modified = time.time()
+        self.trim()
+
+    def trim(self):
+        """
+        Drop the oldest versions beyond the retention limits.
+        """
+        while len(self.versions) > self.keep:
+            self.versions.pop(0)
+        while self.versions and self.stored_size() > self.max_bytes:
+            self.versions.pop(0)
+
+    def stored_size(self):
+        return sum(delta_size(version[3]) for version in self.versions)
+
+    def content_at(self, current_content, number):
+        """
+        Rebuild version number from the current content.
+        """
+        if number == self.current:
+            return current_content
+        if not self.versions or not self.versions[0][0] <= number < self.current:
+            raise KeyError(f"Version {number} is not retained")
+        content = current_content
+        for version in reversed(self.versions):
+            if version[0] < number:
+                break
+            content = apply_delta(content, version[3])
+        return content
+
+    def entries(self, current_size):
+        """
+        (number, timestamp, size) of every version, newest first.
+        """
+        entries = [(self.current, self.modified, current_size)]
+        entries += [(number, timestamp, size) for number, timestamp, size, delta in reversed(self.versions)]
+        return entries
@@ -0,0 +1,331 @@
+# virtualimage.py
+#
+# Binary, length-prefixed image format for the virtual file system.
+#
+# The image is a flat stream of records written in a single depth-first walk
+# of the tree, so it can be written straight into a compressor and read back
+# without building intermediate dicts:
+#
+#   header   MAGIC, version
+#   'D'      name, permissions, generation,
+#            subtree generation                  enter a directory
+#   'U'                                          leave the current directory
+#   'F'      name, permissions, compression, inode, blob, has_content,
+#            generation
+#            [, stored codec, sha256, content]   regular file
+#   'V'      keep, max bytes, current, modified,
+#            versions (JSON)                     history of the preceding file
+#   'H'      name, inode                         hard link to an earlier file
+#   'S'      name, target, generation            symbolic link
+#   'E'                                          end of image
+#
+# Strings and content are prefixed with their length as an unsigned 32-bit
+# integer. Content that is held compressed in memory is written as the
+# compressed bytes, so neither saving nor loading decompresses it. The
+# sha256 of the stored bytes is kept so corruption on disk is detected by
+# fsck and the scrubber; version 1 images have none and are hashed on load.
+# Generations (version 3) keep incremental exports working across reboots.
+# Version history records were added in version 4.
+#
+# The image is written from an ImageSnapshot: a frozen view of the tree
+# taken under the VFS lock in one walk that copies no content. The blobs it
+# references are pinned, so the live tree copies a blob on write instead of
+# changing it while the snapshot is streamed into the compressor on another
+# thread.
+
+import json
+import struct
+from vsystem.virtualhistory import FileHistory
+
+MAGIC = b"VOSIMG"
+VERSION = 4
+
+HEADER = struct.Struct("<6sB")
+LENGTH = struct.Struct("<I")
+FILE_INFO = struct.Struct("<iiB")
+GENERATION = struct.Struct("<Q")
+DIRECTORY_INFO = struct.Struct("<QQ")
+HISTORY_INFO = struct.Struct("<IQId")
+CHECKSUM_SIZE = 32
+
+
+class ImageFormatError(Exception):
+    pass
+
+
+def is_image(header):
+    """
+    Check whether the first bytes of a stream belong to a binary image.
+    """
+    return header[:len(MAGIC)] == MAGIC
+
+
+class _DirectoryView:
+    __slots__ = ("name", "permissions", "generation", "subtree_generation", "files", "subdirectories")
+
+    def __init__(self, directory):
+        self.name = directory.name
+        self.permissions = directory.permissions
+        self.generation = directory.generation
+        self.subtree_generation = directory.subtree_generation
+        self.files = {}
+        self.subdirectories = {}
+
+
+class _FileView:
+    __slots__ = ("target", "blob", "shared", "nlink", "permissions", "compression", "generation", "history")
+
+    def __init__(self, file):
+        self.generation = file.generation
+        self.permissions = file.permissions
+        self.nlink = file.nlink
+        self.blob = getattr(file, "blob", None)  # None for symlinks
+        if self.blob is None:
+            self.target = file.target
+            return
+        self.shared = self.blob.refs > 1
+        self.compression = file.compression
+        history = file.history
+        # Version entries are never changed once recorded, a shallow copy is enough
+        self.history = None if history is None else \
+            (history.keep, history.max_bytes, history.current, history.modified, list(history.versions))
+
+
+class ImageSnapshot:
+    """
+    Frozen view of a tree to write an image from on another thread. Take it
+    while holding the VFS lock and release() it once the image is written.
+    """
+    def __init__(self, root):
+        self.blobs = []  # Pinned blobs
+        self.root = self._directory(root, {})
+
+    def _directory(self, directory, views):
+        view = _DirectoryView(directory)
+        # Read-only mounts are rebuilt from the boot image, only their entry is kept
+        if not directory.read_only:
+            for name, file in directory.files.items():
+                view.files[name] = self._file(file, views)
+            for name, subdirectory in directory.subdirectories.items():
+                view.subdirectories[name] = self._directory(subdirectory, views)
+        return view
+
+    def _file(self, file, views):
+        # Hard links share one view, so the writer still sees them as one file
+        view = views.get(id(file))
+        if view is None:
+            view = views[id(file)] = _FileView(file)
+            if view.blob is not None:
+                view.blob.pins += 1
+                self.blobs.append(view.blob)
+        return view
+
+    def release(self):
+        for blob in self.blobs:
+            blob.pins -= 1
+        self.blobs = []
+
+
+class ImageWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.inodes = {}
+        self.blobs = {}
+
+    def write(self, root):
+        """
+        Write an ImageSnapshot, or the tree below a directory, to the stream.
+        """
+        if isinstance(root, ImageSnapshot):
+            self._write(root)
+            return
+        snapshot = ImageSnapshot(root)
+        try:
+            self._write(snapshot)
+        finally:
+            snapshot.release()
+
+    def _write(self, snapshot):
+        self.stream.write(HEADER.pack(MAGIC, VERSION))
+        self._write_directory(snapshot.root)
+        self.stream.write(b"E")
+
+    def _write_bytes(self, data):
+        self.stream.write(LENGTH.pack(len(data)))
+        self.stream.write(data)
+
+    def _write_str(self, text):
+        self._write_bytes(text.encode('utf-8'))
+
+    def _write_directory(self, directory):
+        self.stream.write(b"D")
+        self._write_str(directory.name)
+        self._write_str(directory.permissions)
+        self.stream.write(DIRECTORY_INFO.pack(directory.generation, directory.subtree_generation))
+        # Empty for read-only mounts, see ImageSnapshot
+        for name, file in directory.files.items():
+            self._write_file(name, file)
+        for subdirectory in directory.subdirectories.values():
+            self._write_directory(subdirectory)
+        self.stream.write(b"U")
+
+    def _write_file(self, name, file):
+        # Symlinks carry no blob
+        if file.blob is None:
+            self.stream.write(b"S")
+            self._write_str(name)
+            self._write_str(file.target)
+            self.stream.write(GENERATION.pack(file.generation))
+            return
+        if id(file) in self.inodes:
+            self.stream.write(b"H")
+            self._write_str(name)
+            self.stream.write(LENGTH.pack(self.inodes[id(file)]))
+            return
+
+        inode = -1
+        if file.nlink > 1:
+            inode = self.inodes[id(file)] = len(self.inodes)
+        blob = -1
+        has_content = True
+        if file.shared:
+            if id(file.blob) in self.blobs:
+                blob = self.blobs[id(file.blob)]
+                has_content = False
+            else:
+                blob = self.blobs[id(file.blob)] = len(self.blobs)
+
+        self.stream.write(b"F")
+        self._write_str(name)
+        self._write_str(file.permissions)
+        self._write_str(file.compression or "")
+        self.stream.write(FILE_INFO.pack(inode, blob, has_content))
+        self.stream.write(GENERATION.pack(file.generation))
+        if has_content:
+            self._write_str(file.blob.codec or "")
+            self.stream.write(file.blob.checksum)
+            self._write_bytes(file.blob.stored_bytes())
+        if file.history is not None:
+            self._write_history(file.history)
+
+    def _write_history(self, history):
+        keep, max_bytes, current, modified, versions = history
+        self.stream.write(b"V")
+        self.stream.write(HISTORY_INFO.pack(keep, max_bytes, current, modified))
+        self._write_str(json.dumps(versions, separators=(",", ":")))
+
+
+class ImageReader:
+    # Records are small, so the stream is read in large chunks and sliced locally
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = b""
+        self.offset = 0
+        self.inodes = {}
+        self.blobs = {}
+        self.generation = 0  # Newest generation in the image
+
+    def read(self):
+        """
+        Read an image and return its root Directory.
+        """
+        # Imported here as virtualfs imports this module for load/save
+        from vsystem.virtualfs import Directory, File, Blob, Symlink
+
+        magic, version = HEADER.unpack(self._read_exact(HEADER.size))
+        if magic != MAGIC:
+            raise ImageFormatError("Not a vOS file system image")
+        if version > VERSION:
+            raise ImageFormatError(f"Unsupported image version {version}")
+
+        root = None
+        stack = []
+        file = None
+        while True:
+            tag = self._read_exact(1)
+            if tag == b"F":
+                name = self._read_str()
+                permissions = self._read_str()
+                compression = self._read_str() or None
+                inode, blob_id, has_content = FILE_INFO.unpack(self._read_exact(FILE_INFO.size))
+                generation = self._read_generation(version)
+                if has_content:
+                    codec = self._read_str() or None
+                    checksum = self._read_exact(CHECKSUM_SIZE) if version >= 2 else None
+                    raw = self._read_bytes()
+                    blob = Blob.from_raw(raw if codec else raw.decode('utf-8'), codec, checksum)
+                    if blob_id >= 0:
+                        self.blobs[blob_id] = blob
+                else:
+                    blob = self.blobs[blob_id]
+                file = File(name, blob=blob, compression=compression)
+                file.generation = generation
+                stack[-1].add_file(file, permissions)
+                if inode >= 0:
+                    self.inodes[inode] = file
+            elif tag == b"V":
+                keep, max_bytes, current, modified = HISTORY_INFO.unpack(self._read_exact(HISTORY_INFO.size))
+                file.history = FileHistory(keep, max_bytes)
+                file.history.current = current
+                file.history.modified = modified
+                file.history.versions = json.loads(self._read_str())
+            elif tag == b"D":
+                name = self._read_str()
+                permissions = self._read_str()
+                directory = Directory(name, permissions=permissions)
+                if version >= 3:
+                    directory.generation, directory.subtree_generation = DIRECTORY_INFO.unpack(self._read_exact(DIRECTORY_INFO.size))
+                    self.generation = max(self.generation, directory.subtree_generation)
+                if stack:
+                    stack[-1].add_directory(directory, permissions)
+                else:
+                    root = directory
+                stack.append(directory)
+            elif tag == b"U":
+                stack.pop()
+            elif tag == b"H":
+                name = self._read_str()
+                inode, = LENGTH.unpack(self._read_exact(LENGTH.size))
+                stack[-1].link_file(name, self.inodes[inode])
+            elif tag == b"S":
+                name = self._read_str()
+                link = Symlink(name, self._read_str())
+                link.generation = self._read_generation(version)
+                link.parent = stack[-1]
+                stack[-1].link_file(name, link)
+            elif tag == b"E":
+                return root
+            else:
+                raise ImageFormatError(f"Unknown record {tag!r}")
+
+    def _read_generation(self, version):
+        if version < 3:
+            return 0
+        generation, = GENERATION.unpack(self._read_exact(GENERATION.size))
+        self.generation = max(self.generation, generation)
+        return generation
+
+    def _fill(self, size):
+        self.buffer = self.buffer[self.offset:] + self.stream.read(max(size, self.CHUNK_SIZE))
+        self.offset = 0
+        if len(self.buffer) < size:
+            raise ImageFormatError("Truncated file system image")
+
+    def _read_exact(self, size):
+        if self.offset + size > len(self.buffer):
+            self._fill(size)
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def _read_bytes(self):
+        if self.offset + LENGTH.size > len(self.buffer):
+            self._fill(LENGTH.size)
+        size, = LENGTH.unpack_from(self.buffer, self.offset)
+        self.offset += LENGTH.size
+        return self._read_exact(size)
+
+    def _read_str(self):
+        return self._read_bytes().decode('utf-8')
@@ -0,0 +1,210 @@
+# virtualintegrity.py
+#
+# Boot integrity checks against vinit/checksums.txt.
+#
+# The manifest has one "path: sha256" line per OS component, with paths
+# relative to src/ (older manifests name only the file; those are looked
+# up in the component directories). Files are hashed in CHUNK_SIZE pieces,
+# so memory use does not grow with file size, on a pool of HASH_WORKERS
+# threads; hashlib releases the GIL, so hashing overlaps with reading and
+# with the shell.
+#
+# Digests are cached by (path, size, mtime_ns) in vinit/checksum.cache. A
+# file whose size and modification time are unchanged is not read again,
+# so re-verifying an unchanged tree costs one stat per component.
+
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST = os.path.join(SRC_DIR, "vinit", "checksums.txt")
+CACHE = os.path.join(SRC_DIR, "vinit", "checksum.cache")
+COMPONENTS = ["virtualos.py", "vsystem/virtualfs.py", "vsystem/vcommands.py", "vsystem/virtualkernel.py",
+              "vsystem/virtualmachine.py", "vui/vterminal.py"]
+SEARCH_DIRS = ("", "vsystem", "vui", "vapi", "vbin")
+CHUNK_SIZE = 1024 * 1024
+HASH_WORKERS = max(4, os.cpu_count() or 1)
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """
+    SHA-256 of a file, read in chunks into one reused buffer.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as file:
+        while True:
+            size = file.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def resolve(name, root=SRC_DIR):
+    """
+    Host path of a manifest entry.
+    """
+    if os.path.isabs(name):
+        return name
+    for directory in SEARCH_DIRS:
+        path = os.path.join(root, directory, name)
+        if os.path.exists(path):
+            return path
+    return os.path.join(root, name)
+
+
+class VerifyReport:
+    __slots__ = ("results", "hashed", "cached", "bytes_hashed", "elapsed")
+
+    def __init__(self):
+        self.results = []  # (name, status, digest), status "OK", "MISMATCH" or "MISSING"
+        self.hashed = 0
+        self.cached = 0
+        self.bytes_hashed = 0
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return all(status == "OK" for _, status, _ in self.results)
+
+    @property
+    def failed(self):
+        return [name for name, status, _ in self.results if status != "OK"]
+
+
+class IntegrityService:
+    def __init__(self, manifest=MANIFEST, cache_path=CACHE, root=SRC_DIR):
+        self.manifest = manifest
+        self.cache_path = cache_path
+        self.root = root
+        self.cache = self._load_cache()  # path -> (size, mtime_ns, digest)
+        self.cache_dirty = False
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r") as file:
+                return {path: tuple(entry) for path, entry in json.load(file).items()}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.cache, file)
+        os.replace(temp_path, self.cache_path)
+        self.cache_dirty = False
+
+    def read_manifest(self):
+        """
+        Stored checksums, {name: digest} in manifest order.
+        """
+        checksums = {}
+        with open(self.manifest, "r") as file:
+            for line in file:
+                if line.strip():
+                    name, checksum = line.strip().split(": ")
+                    checksums[name] = checksum
+        return checksums
+
+    def _digest(self, path, use_cache):
+        # Returns (digest, bytes hashed); digest is None if the file is missing
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None, 0
+        if use_cache:
+            entry = self.cache.get(path)
+            if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                return entry[2], 0
+        digest = hash_file(path)
+        with self.lock:
+            self.cache[path] = (stat.st_size, stat.st_mtime_ns, digest)
+            self.cache_dirty = True
+        return digest, stat.st_size
+
+    def digest(self, path):
+        """
+        Digest of one host file, from the cache if it is unchanged; None if
+        the file does not exist.
+        """
+        return self._digest(path, True)[0]
+
+    def record(self, path, digest):
+        """
+        Cache the digest of a file that was just written.
+        """
+        stat = os.stat(path)
+        with self.lock:
+            self.cache[path] = (stat.st_size, stat.st_mtime_ns, digest)
+            self.cache_dirty = True
+
+    def save(self):
+        if self.cache_dirty:
+            self._save_cache()
+
+    def digests(self, names, use_cache=True):
+        """
+        Current digests of names, hashing only what changed, in parallel.
+
+        Returns:
+            tuple: ({name: digest or None}, VerifyReport with the counters).
+        """
+        report = VerifyReport()
+        start = time.perf_counter()
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="vos-hash")
+        paths = [resolve(name, self.root) for name in names]
+        digests = {}
+        for name, (digest, size) in zip(names, self.executor.map(lambda path: self._digest(path, use_cache), paths)):
+            digests[name] = digest
+            if size:
+                report.hashed += 1
+                report.bytes_hashed += size
+            elif digest is not None:
+                report.cached += 1
+        if self.cache_dirty:
+            self._save_cache()
+        report.elapsed = time.perf_counter() - start
+        return digests, report
+
+    def verify(self, use_cache=True):
+        """
+        Compare every component with the manifest.
+
+        Returns:
+            VerifyReport
+        """
+        stored = self.read_manifest()
+        digests, report = self.digests(list(stored), use_cache)
+        for name, checksum in stored.items():
+            digest = digests[name]
+            status = "MISSING" if digest is None else "OK" if digest == checksum else "MISMATCH"
+            report.results.append((name, status, digest))
+        return report
+
+    def write_manifest(self, names=None):
+        """
+        Record the current digests of names (the manifest's entries, or
+        COMPONENTS if there is none yet) as the new manifest.
+        """
+        if names is None:
+            try:
+                names = list(self.read_manifest())
+            except FileNotFoundError:
+                names = COMPONENTS
+        digests, report = self.digests(names)
+        temp_path = f"{self.manifest}.tmp"
+        with open(temp_path, "w") as file:
+            for name in names:
+                if digests[name] is not None:
+                    file.write(f"{name}: {digests[name]}\n")
+        os.replace(temp_path, self.manifest)
+        return report
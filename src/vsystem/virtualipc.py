@@ -0,0 +1,371 @@
+# virtualipc.py
+#
+# Inter-process communication between virtual processes.
+#
+#   Pipe          bounded byte stream; writers block while it is full, so a
+#                 fast producer is held to the pace of its consumer
+#   MessageQueue  bounded queue of whole messages (any Python object)
+#   SharedRing    single-producer single-consumer byte ring in shared
+#                 memory, for bulk transfer to and from process pool workers
+#
+# Pipes and queues can be used from threads (read/write, send/receive with
+# an optional timeout) and from scheduled processes, which must not block
+# the scheduler thread and use the async forms through process.wait():
+#
+#   data = await process.wait(pipe.read_async())
+#
+# Both kinds of waiter are woken by the other side, so a blocked process
+# costs nothing while it waits. Named objects live in a kernel-wide
+# registry (create_pipe, create_queue, create_ring, lookup, remove) shared
+# by vbin programs and the shell.
+
+import struct
+import asyncio
+import threading
+from collections import deque
+from multiprocessing import shared_memory
+
+PIPE_CAPACITY = 64 * 1024
+QUEUE_SIZE = 1024
+RING_CAPACITY = 1024 * 1024
+
+_registry = {}  # name -> Pipe, MessageQueue or SharedRing
+_registry_lock = threading.Lock()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Channel:
+    """
+    Lock, conditions and async waiters shared by pipes and queues. The
+    subclass implements _try_get and _try_put, which return None when the
+    call would block.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.get_waiters = []  # (loop, future) of async readers
+        self.put_waiters = []
+        self.closed = False
+
+    def _wake(self, condition, waiters):
+        # Called with the lock held
+        condition.notify_all()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        waiters.clear()
+
+    def _get(self, argument, timeout):
+        with self.lock:
+            while True:
+                result = self._try_get(argument)
+                if result is not None:
+                    self._wake(self.not_full, self.put_waiters)
+                    return result
+                if not self.not_empty.wait(timeout):
+                    raise TimeoutError("Nothing to read")
+
+    def _put(self, item, timeout):
+        with self.lock:
+            while True:
+                result = self._try_put(item)
+                if result is not None:
+                    self._wake(self.not_empty, self.get_waiters)
+                    return result
+                if not self.not_full.wait(timeout):
+                    raise TimeoutError("No room to write")
+
+    async def _get_async(self, argument):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                result = self._try_get(argument)
+                if result is not None:
+                    self._wake(self.not_full, self.put_waiters)
+                    return result
+                future = loop.create_future()
+                self.get_waiters.append((loop, future))
+            await future
+
+    async def _put_async(self, item):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                result = self._try_put(item)
+                if result is not None:
+                    self._wake(self.not_empty, self.get_waiters)
+                    return result
+                future = loop.create_future()
+                self.put_waiters.append((loop, future))
+            await future
+
+    def close(self):
+        """
+        Refuse further writes; readers drain what is left, then get EOF.
+        """
+        with self.lock:
+            self.closed = True
+            self._wake(self.not_empty, self.get_waiters)
+            self._wake(self.not_full, self.put_waiters)
+
+
+class Pipe(_Channel):
+    kind = "pipe"
+
+    def __init__(self, capacity=PIPE_CAPACITY):
+        super().__init__()
+        self.capacity = capacity
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def _try_get(self, size):
+        if not self.buffer:
+            return b"" if self.closed else None
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def _try_put(self, data):
+        # Returns the bytes written, only part of data if the pipe fills up
+        if self.closed:
+            raise BrokenPipeError("Pipe is closed")
+        room = self.capacity - len(self.buffer)
+        if room <= 0:
+            return None
+        self.buffer += data[:room]
+        return min(room, len(data))
+
+    def read(self, size=-1, timeout=None):
+        """
+        Up to size bytes (everything buffered for -1), blocking until some
+        are available. b"" means the pipe is closed and drained.
+        """
+        return self._get(size, timeout)
+
+    def write(self, data, timeout=None):
+        """
+        Write all of data, blocking while the pipe is full.
+        """
+        data = memoryview(data.encode("utf-8") if isinstance(data, str) else data)
+        written = 0
+        while written < len(data):
+            written += self._put(data[written:], timeout)
+        return written
+
+    def write_some(self, data, timeout=None):
+        """
+        Write as much of data as fits, waiting up to timeout for room;
+        returns the number of bytes written, 0 if the pipe stayed full.
+        """
+        try:
+            return self._put(memoryview(data), timeout)
+        except TimeoutError:
+            return 0
+
+    def write_nowait(self, data):
+        """
+        Write as much of data as fits without blocking; returns the number
+        of bytes written.
+        """
+        with self.lock:
+            written = self._try_put(data) or 0
+            if written:
+                self._wake(self.not_empty, self.get_waiters)
+            return written
+
+    async def read_async(self, size=-1):
+        return await self._get_async(size)
+
+    async def write_async(self, data):
+        data = memoryview(data.encode("utf-8") if isinstance(data, str) else data)
+        written = 0
+        while written < len(data):
+            written += await self._put_async(data[written:])
+        return written
+
+    def describe(self):
+        return f"{len(self.buffer)}/{self.capacity} bytes"
+
+
+class MessageQueue(_Channel):
+    kind = "queue"
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        super().__init__()
+        self.maxsize = maxsize
+        self.messages = deque()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def _try_get(self, _):
+        if not self.messages:
+            if self.closed:
+                raise EOFError("Queue is closed")
+            return None
+        # Wrapped so that a None message is not mistaken for "would block"
+        return (self.messages.popleft(),)
+
+    def _try_put(self, message):
+        if self.closed:
+            raise BrokenPipeError("Queue is closed")
+        if len(self.messages) >= self.maxsize:
+            return None
+        self.messages.append(message)
+        return True
+
+    def send(self, message, timeout=None):
+        self._put(message, timeout)
+
+    def receive(self, timeout=None):
+        """
+        The oldest message, blocking until there is one. Raises EOFError
+        once the queue is closed and empty.
+        """
+        return self._get(None, timeout)[0]
+
+    async def send_async(self, message):
+        await self._put_async(message)
+
+    async def receive_async(self):
+        return (await self._get_async(None))[0]
+
+    def describe(self):
+        return f"{len(self.messages)}/{self.maxsize} messages"
+
+
+class SharedRing:
+    """
+    Byte ring in a shared memory block. Exactly one producer and one
+    consumer, in any processes: the producer only advances head and the
+    consumer only advances tail, so no lock is needed. Both counters only
+    grow; head - tail is the number of bytes buffered.
+    """
+    kind = "ring"
+    HEADER = struct.Struct("<8sQ")  # magic, capacity
+    COUNTER = struct.Struct("<Q")
+    MAGIC = b"VOSRING1"
+    HEAD, TAIL, DATA = 16, 24, 32
+
+    def __init__(self, name=None, capacity=RING_CAPACITY, create=True):
+        if create:
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=self.DATA + capacity)
+            self.HEADER.pack_into(self.memory.buf, 0, self.MAGIC, capacity)
+            self.COUNTER.pack_into(self.memory.buf, self.HEAD, 0)
+            self.COUNTER.pack_into(self.memory.buf, self.TAIL, 0)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        magic, self.capacity = self.HEADER.unpack_from(self.memory.buf, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"{name} is not a shared ring")
+        self.name = self.memory.name
+        self.owner = create
+        self.buffer = self.memory.buf
+
+    def __reduce__(self):
+        # Workers attach to the same block
+        return (SharedRing, (self.name, 0, False))
+
+    def _counter(self, offset):
+        return self.COUNTER.unpack_from(self.buffer, offset)[0]
+
+    def __len__(self):
+        return self._counter(self.HEAD) - self._counter(self.TAIL)
+
+    def write(self, data):
+        """
+        Copy as much of data as fits; returns the number of bytes written.
+        """
+        head = self._counter(self.HEAD)
+        count = min(len(data), self.capacity - (head - self._counter(self.TAIL)))
+        if count <= 0:
+            return 0
+        start = head % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[self.DATA + start:self.DATA + start + first] = data[:first]
+        self.buffer[self.DATA:self.DATA + count - first] = data[first:count]
+        # Publish only after the data is in place
+        self.COUNTER.pack_into(self.buffer, self.HEAD, head + count)
+        return count
+
+    def read(self, size=-1):
+        """
+        Up to size bytes that are buffered, possibly none.
+        """
+        tail = self._counter(self.TAIL)
+        available = self._counter(self.HEAD) - tail
+        count = available if size < 0 else min(size, available)
+        if count <= 0:
+            return b""
+        start = tail % self.capacity
+        first = min(count, self.capacity - start)
+        data = bytes(self.buffer[self.DATA + start:self.DATA + start + first])
+        if first < count:
+            data += bytes(self.buffer[self.DATA:self.DATA + count - first])
+        self.COUNTER.pack_into(self.buffer, self.TAIL, tail + count)
+        return data
+
+    def describe(self):
+        return f"{len(self)}/{self.capacity} bytes, shm {self.name}"
+
+    def close(self):
+        self.buffer.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def _register(name, item):
+    with _registry_lock:
+        if name in _registry:
+            raise FileExistsError(f"IPC object '{name}' already exists")
+        _registry[name] = item
+    return item
+
+
+def create_pipe(name, capacity=PIPE_CAPACITY):
+    return _register(name, Pipe(capacity))
+
+
+def create_queue(name, maxsize=QUEUE_SIZE):
+    return _register(name, MessageQueue(maxsize))
+
+
+def create_ring(name, capacity=RING_CAPACITY):
+    return _register(name, SharedRing(None, capacity))
+
+
+def lookup(name, kind=None):
+    """
+    The named IPC object, optionally checking that it is a 'pipe', 'queue'
+    or 'ring'.
+    """
+    item = _registry.get(name)
+    if item is None:
+        raise FileNotFoundError(f"IPC object '{name}' not found")
+    if kind is not None and item.kind != kind:
+        raise TypeError(f"'{name}' is a {item.kind}, not a {kind}")
+    return item
+
+
+def remove(name):
+    with _registry_lock:
+        item = _registry.pop(name, None)
+    if item is None:
+        raise FileNotFoundError(f"IPC object '{name}' not found")
+    item.close()
+
+
+def list_objects():
+    """
+    (name, kind, description) of every named IPC object.
+    """
+    return [(name, item.kind, item.describe()) for name, item in sorted(_registry.items())]
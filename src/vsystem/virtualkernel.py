@@ -2,6 +2,7 @@ import signal
 import sys
 import os
 import hashlib
+import hmac
 import base64
 from datetime import datetime
 import traceback
@@ -13,7 +14,20 @@ import urllib.request
 import time
 from zipfile import ZipFile, is_zipfile
 from io import BytesIO
+from collections import deque
 import threading
+from vsystem.virtuallog import kernel_log, parse_level, DEBUG, INFO, ERROR
+from vsystem.virtualsched import get_scheduler, get_process, cancel
+from vsystem.virtualexec import submit_task, cancel_task, get_task
+from vsystem.virtualacct import register, unregister, memory_tracking
+from vsystem import virtualipc
+from vsystem.virtualtimer import get_timer_wheel
+from vsystem.virtualcron import CronService
+from vsystem.virtualusers import user_database, UserRecord
+from vsystem.virtualsession import session_store
+from vsystem.virtualintegrity import IntegrityService
+from vsystem.virtualupdate import DeltaUpdater
+from vsystem.virtualqshell import QShellInterpreter
 from rich.console import Console
 from rich.prompt import Prompt
 from rich.text import Text
@@ -24,66 +38,6 @@ from rich.layout import Layout
 from rich.panel import Panel
 
 
-class QShellInterpreter:
-    def __init__(self):
-        self.ext = ".qs"
-        self.variables = {}  # Dictionary to store variables
-
-    def execute_script(self, script):
-        if script.endswith(self.ext):
-            # Split the script into individual lines
-            lines = script.split('\n')
-            for line in lines:
-                # Execute each line of the script
-                command = self.parse_line(line)
-                if command:
-                    yield command
-        else:
-            print(f"{script} must have {self.ext} extension")
-
-    def parse_line(self, line):
-        # Parse and return the individual command from the qShell script line
-        if line.startswith("#"):
-            return None  # Ignore comments
-        elif "#" in line:
-            command, _ = line.split("#", 1)  # Split at the first #
-            return command.strip()  # Remove any trailing whitespace and return the command
-        else:
-            command_parts = line.split(" ")  # Split the line into parts
-            command = command_parts[0]  # Extract the command
-
-            if command == "if":
-                condition = " ".join(command_parts[1:])  # Extract the condition
-                return self.execute_if(condition)
-            elif command == "for":
-                variables = command_parts[1].split(",")  # Extract the variable(s)
-                iterable = command_parts[3]  # Extract the iterable
-                return self.execute_for(variables, iterable)
-            elif command == "while":
-                condition = " ".join(command_parts[1:])  # Extract the condition
-                return self.execute_while(condition)
-            else:
-                return line.strip()  # Remove any leading/trailing whitespace and return the command
-
-    def execute_if(self, condition):
-        # Execute the if statement based on the condition
-        if condition:
-            return True
-        else:
-            return False
-
-    def execute_for(self, variables, iterable):
-        # Execute the for loop using the provided variables and iterable
-        for variable in variables:
-            self.variables[variable] = iterable
-        return True
-
-    def execute_while(self, condition):
-        # Execute the while loop based on the condition
-        while condition:
-            return True
-        return False
-
 class UserAccount:
     def __init__(self, username, password, uid, gid, home_dir, shell):
         self.username = username
@@ -95,7 +49,8 @@ class UserAccount:
 
 
 
-    def encrypt_password(self, password):
+    @staticmethod
+    def encrypt_password(password):
         # Use SHA-256 hashing algorithm for password encryption
         hashed_password = hashlib.sha256(password.encode()).digest()
         # Encode the hashed password using base64 for storage
@@ -128,6 +83,8 @@ class UserAccount:
 class PasswordFile:
     def __init__(self, file_path):
         self.file_path = os.path.abspath(f"../src/vinit/{file_path}")
+        self.users = user_database(self.file_path, log=KernelMessage.log)
+        self.sessions = session_store()
         self.dmesg_file = os.path.abspath("../src/vinit/dmesg")
         self.active_user = None
 
@@ -136,26 +93,19 @@ class PasswordFile:
     def generate_random_id():
         return uuid.uuid4().int & (1<<32)-1
     def online_user(self):
-        return self.active_user
+        return self.active_user or session_store().current_user()
 
     def check_passwd_file(self, fs):
         """
-        Check if the passwd file exists and if it's empty.
-        If it doesn't exist or it's empty, prompt to create a new user.
+        Create the admin account if there are no accounts yet, otherwise
+        return the first one.
         """
-        if os.path.isfile(self.file_path):
-            # Check if the file is empty
-            if os.path.getsize(self.file_path) == 0:
-                self.add_user(fs, "admin", "admin")
-#                self.create_new_user(fs)
-            else:
-                with open(self.file_path, 'r') as file:
-                    for line in file:
-                        parts = line.strip().split(':')
-                        return [parts[0], parts[1], parts[2], parts[3], parts[4], parts[5]]
-        else:
+        record = self.users.first()
+        if record is None:
             self.add_user(fs, "admin", "admin")
 #            self.create_new_user(fs)
+            record = self.users.first()
+        return record.fields()
 
     def create_new_user(self, fs):
         """
@@ -165,81 +115,108 @@ class PasswordFile:
         password = getpass.getpass("Enter password: ")
         self.add_user(fs, username, password)
 
-    def add_user(self, fs, username, password):
-        # Generate random uid and gid if not provided
+    def _new_record(self, username, password):
+        # Generate random uid and gid, avoiding uids already taken
         uid = self.generate_random_id()
+        while self.users.get_by_uid(uid) is not None:
+            uid = self.generate_random_id()
         gid = self.generate_random_id()
         user_dir = "/home/" + username
         shell = "/bin/qshell"
 
-        # Create a UserAccount instance
+        # Create a UserAccount instance, which hashes the password
         user_account = UserAccount(username, password, uid, gid, user_dir, shell)
+        return UserRecord(user_account.username, user_account.password, user_account.uid,
+                          user_account.gid, user_account.home_dir, user_account.shell)
 
-        # Write the user account information to the password file
-        with open(self.file_path, 'a') as file:
-            file.write(f"{user_account.username}:{user_account.password}:{user_account.uid}:"
-                       f"{user_account.gid}:{user_account.home_dir}:{user_account.shell}\n")
+    def add_user(self, fs, username, password):
+        """
+        Raises:
+            ValueError: If the user already exists.
+        """
+        self.users.add(self._new_record(username, password))
+
+    def add_users(self, fs, accounts):
+        """
+        Add many accounts with a single write of the passwd file.
+
+        Parameters:
+            accounts: (username, password) pairs.
+
+        Returns:
+            tuple: (added, skipped) usernames. A name that already existed,
+            repeats an earlier line or is not a valid username is skipped.
+        """
+        added, skipped = [], []
+        with self.users.batch():
+            for username, password in accounts:
+                try:
+                    self.users.add(self._new_record(username, password))
+                except ValueError:
+                    skipped.append(username)
+                else:
+                    added.append(username)
+        return added, skipped
 
     def remove_user(self, username):
-        # Read all lines from the password file, excluding the user to be removed
-        with open(self.file_path, 'r') as file:
-            lines = file.readlines()
-        with open(self.file_path, 'w') as file:
-            for line in lines:
-                if not line.startswith(f"{username}:"):
-                    file.write(line)
+        self.sessions.revoke_user(username)
+        return self.users.remove(username)
 
     def update_user_password(self, username, new_password):
-        # Read all lines from the password file, updating the password for the specified user
-        with open(self.file_path, 'r') as file:
-            lines = file.readlines()
-        with open(self.file_path, 'w') as file:
-            for line in lines:
-                if line.startswith(f"{username}:"):
-                    parts = line.strip().split(':')
-                    parts[1] = UserAccount.encrypt_password(new_password)
-                    file.write(':'.join(parts) + '\n')
-                else:
-                    file.write(line)
+        # Sessions, and any su elevation, issued under the old password end here
+        if not self.users.set_password(username, UserAccount.encrypt_password(new_password)):
+            return False
+        self.sessions.revoke_user(username)
+        return True
 
     def get_user(self, username):
-        with open(self.file_path, 'r') as file:
-            for line in file:
-                parts = line.strip().split(':')
-                if parts[0] == username:
-                    return [parts[0], parts[1], parts[2], parts[3], parts[4], parts[5]]
-        return None
+        record = self.users.get(username)
+        return record.fields() if record is not None else None
 
-    def authenticate(self, username, password):
-        user = self.get_user(username)
-        try:
-            user_account = UserAccount(username, password, user[2], user[3], user[4], user[5])
-        except Exception as e:
-            return False
-        VirtualKernel.log_command(self, f"auth: {user[1]} and {user_account.password}")
-        if user[1] == user_account.password:
-            pid = VirtualKernel.create_process(self, "qShell", True, "qShell_Instance")
-            self.active_user = user[0]
-            return True
-        else:
+    def verify(self, username, password):
+        """
+        Check a password against the stored hash, hashing it once.
+        """
+        user = self.users.get(username)
+        if user is None:
             return False
+        return hmac.compare_digest(user.password, UserAccount.encrypt_password(password))
 
+    def authenticate(self, username, password):
+        """
+        Log in: on success the user gets a session, which later privilege
+        checks validate without hashing again.
+        """
+        KernelMessage.log(DEBUG, "auth", "auth: %s", username)
+        if not self.verify(username, password):
+            return False
+        pid = VirtualKernel.create_process(self, "qShell", True, "qShell_Instance")
+        self.active_user = username
+        self.sessions.current = self.sessions.issue(username, self.users.get(username).uid)
+        return True
 
     def su_prompt(self):
-            while True:
-                password = getpass.getpass("Password: ")
-                username = self.active_user
-                if self.authenticate(username, password):
-                    return True
-                    break
-                else:
-                    print("Invalid password. su cancelled")
-                    return False
-                    break
-
+        """
+        Elevate the console session, asking for the password only if the
+        last su has expired.
+        """
+        if self.sessions.is_elevated(self.sessions.current):
+            return True
+        password = getpass.getpass("Password: ")
+        username = self.online_user()
+        if self.verify(username, password):
+            # The console session may have ended with a password change or
+            # expired; the password was just checked, so start a new one
+            if self.sessions.validate(self.sessions.current) is None:
+                self.sessions.current = self.sessions.issue(username, self.users.get(username).uid)
+            if self.sessions.elevate(self.sessions.current):
+                return True
+        print("Invalid password. su cancelled")
+        return False
 
     def logout(self):
-       self.active_user = None
+        self.sessions.revoke(self.sessions.current)
+        self.active_user = None
 
 
 
@@ -266,9 +243,12 @@ class KernelMessage:
 
     @classmethod
     def log_process(cls, program):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(cls.dmesg_file, "a") as f:
-            f.write(f"[{timestamp}] {program}\n")
+        kernel_log(cls.dmesg_file).write(program, "proc")
+
+    @classmethod
+    def log(cls, level, subsystem, template, *args, pid=0):
+        # Formatted lazily, and not at all below the log level
+        kernel_log(cls.dmesg_file).log(level, subsystem, template, *args, pid=pid)
 
 
     @classmethod
@@ -289,7 +269,18 @@ class KernelMessage:
         else:
             return f"{seconds:,.4f} seconds"
 
+    @classmethod
+    def format_size(cls, size):
+        for unit in ("B", "KiB", "MiB"):
+            if abs(size) < 1024:
+                return f"{size:,.0f} {unit}" if unit == "B" else f"{size:,.1f} {unit}"
+            size /= 1024
+        return f"{size:,.1f} GiB"
+
 class VirtualKernel:
+    cron = None  # CronService shared by every kernel instance
+    integrity_service = None  # IntegrityService, created on first use
+
     def __init__(self):
         self.processes = ProcessList.running_processes
         self.create_process("VirtualKernel")
@@ -313,64 +304,61 @@ class VirtualKernel:
         return formatted_uptime
 
     def get_checksum_file(self):
-        checksums = {}
         try:
-            # Define the paths to the OS components
-            component_paths = [
-                os.path.abspath("../src/vui/vterminal.py"),
-                "virtualfs.py",
-                "vcommands.py",
-                "virtualkernel.py",
-                "virtualmachine.py"
-            ]
-
-            # Calculate checksum for each component
-            for component_path in component_paths:
-                with open(component_path, "rb") as file:
-                    checksum = hashlib.sha256(file.read()).hexdigest()
-                    checksums[component_path] = checksum
-
-            # Write the checksums to a checksum file
-            with open("checksums.txt", "w") as checksum_file:
-                for component_path, checksum in checksums.items():
-                    checksum_file.write(f"{component_path}: {checksum}\n")
-
-            print("Checksum file created successfully.")
+            # Record the current checksums of the OS components
+            report = self.integrity().write_manifest()
+            print(f"Checksum file created successfully ({report.hashed} hashed, {report.cached} cached).")
         except Exception as e:
             print(f"Error creating checksum file: {e}")
 
+    def integrity(self):
+        if VirtualKernel.integrity_service is None:
+            VirtualKernel.integrity_service = IntegrityService()
+        return VirtualKernel.integrity_service
+
+    def verify_components(self, use_cache=True):
+        """
+        Check the OS components against vinit/checksums.txt.
+
+        Returns:
+            VerifyReport
+        """
+        return self.integrity().verify(use_cache)
+
     def compare_checksums(self):
         try:
-            # Read the checksum file
-            stored_checksums = {}
-            with open(os.path.abspath("../src/vinit/checksum.txt"), "r") as checksum_file:
-                for line in checksum_file:
-                    component, checksum = line.strip().split(": ")
-                    stored_checksums[component] = checksum
-
-            # Initialize a flag to track if all checksums are matching
-            all_checksums_match = True
-
-            # Calculate checksum for each component and compare with stored checksums
-            for component, stored_checksum in stored_checksums.items():
-                with open(component, "rb") as file:
-                    current_checksum = hashlib.sha256(file.read()).hexdigest()
-                if current_checksum == stored_checksum:
-                    self.log_command(f"{component}: OK")
-                else:
-                    self.log_command(f"{component}: Checksum mismatch!")
-                    # Update flag if any checksum doesn't match
-                    all_checksums_match = False
+            # Verify as a process; the service hashes on its own thread pool
+            task = self.run_process("checksumd", self.verify_components, (), "thread")
+            task.future.add_done_callback(self.report_checksums)
+            return task.future
 
-            # Print overall result based on the flag
-            if all_checksums_match:
-                self.log_command("All checksums passed successfully!")
-            else:
-                self.log_command("Some checksums failed. Checksum verification failed!")
-                self.update_vos()
+        except Exception as e:
+            print(f"Error comparing checksums: {e}")
 
+    def report_checksums(self, future):
+        if future.cancelled():
+            return
+        try:
+            report = future.result()
         except Exception as e:
             print(f"Error comparing checksums: {e}")
+            return
+
+        # Log each component with its result
+        for component, status, _ in report.results:
+            if status == "OK":
+                self.log_command(f"{component}: OK")
+            elif status == "MISSING":
+                self.log_command(f"{component}: Missing!")
+            else:
+                self.log_command(f"{component}: Checksum mismatch!")
+
+        # Print overall result
+        if report.ok:
+            self.log_command("All checksums passed successfully!")
+        else:
+            self.log_command("Some checksums failed. Checksum verification failed!")
+            self.update_vos()
 
     def update_vos(self):
         pid = self.create_process("update_vos", False, self.active_user)
@@ -428,6 +416,29 @@ class VirtualKernel:
 
 
 
+    def update_from(self, source, dry_run=False):
+        """
+        Update vOS from a local zip archive or directory, writing only the
+        files that changed.
+
+        Returns:
+            UpdateReport
+        """
+        pid = self.create_process("update_vos", False, self.active_user)
+        self.log(INFO, "update", "updating from %s%s", source, " (dry run)" if dry_run else "")
+        try:
+            report = DeltaUpdater(self.integrity()).update(source, dry_run)
+        except Exception as e:
+            self.log(ERROR, "update", "update from %s failed: %s", source, e)
+            raise
+        finally:
+            if pid is not None:
+                VirtualProcess.kill_process(self, pid)
+        self.log(INFO, "update", "%d changed, %d unchanged, %s written, %s saved", len(report.changed),
+                 report.unchanged, KernelMessage.format_size(report.bytes_written),
+                 KernelMessage.format_size(report.bytes_saved))
+        return report
+
     def move_files(self, src_dir, dest_dir):
         # Move files and directories from source directory to destination directory
         for item in os.listdir(src_dir):
@@ -451,9 +462,9 @@ class VirtualKernel:
         except FileNotFoundError:
             print("Version file not found.")
 
-    def execute_qshell_script(self, script):
-        # Execute a qShell script using the qShell interpreter
-        self.qshell_interpreter.execute_script(script)
+    def execute_qshell_script(self, script, runner=None, output=print):
+        # Execute a qShell script using the qShell interpreter; compiled scripts are cached by content
+        self.qshell_interpreter.execute_script(script, runner, output)
 
 
     def reboot_os(self):
@@ -465,7 +476,6 @@ class VirtualKernel:
         self.log_command("[!!]Rebooting vOS...")
         VirtualProcess.shutdown_vproc(self)
         self.processes = ProcessList.running_processes
-        self.dmesg_file = "dmesg"
         self.create_process("dmesgd")
         self.filesystem_monitoring_enabled = True
         self.last_error = None
@@ -479,55 +489,138 @@ class VirtualKernel:
         self.password_file.login_prompt_rich()
 
 
-    def create_process(self, program, allow_multiple=False, user=None):
-        KernelMessage.log_process(f"Initialize {program} Allow_Multiple: {allow_multiple} User: {user}")
-        # Check if the process is already running
-        for pid, process_info in ProcessList.running_processes.items():
-            if process_info['name'] == program:
-                if not allow_multiple:
-                    return None
-
-        # If not running or allowing multiple instances, create a new process instance
-        pid = ProcessList.get_next_pid()
+    def create_process(self, program, allow_multiple=False, user=None, parent=0, target=None, priority=0,
+                       executor=None, args=()):
+        """
+        Register a process. With a target, a coroutine function taking the
+        ScheduledProcess, the process also runs it on the scheduler and
+        leaves the table when it returns. With executor 'thread' or
+        'process' the target is instead a plain function, called with args
+        on that worker pool. process_future(pid) gives the result.
+        """
+        KernelMessage.log(DEBUG, "proc", "Initialize %s Allow_Multiple: %s User: %s", program, allow_multiple, user)
         if user == None:
             user = "Root"
         else:
             user = PasswordFile.online_user(self)
-        new_process = VirtualProcess(program, pid, user)
+        with ProcessList.lock:
+            # Check if the process is already running
+            if not allow_multiple and ProcessList.find_by_name(program):
+                return None
+
+            # If not running or allowing multiple instances, create a new process instance
+            pid = ProcessList.get_next_pid()
+            new_process = VirtualProcess(program, pid, user, parent, target, priority, executor, args)
+        if target is not None:
+            new_process.execute()
         return pid
 
+    def run_process(self, program, target, args=(), executor=None, priority=0, user="Root", parent=0):
+        """
+        Start a workload as a new process, see create_process.
+
+        Returns:
+            PoolTask or ScheduledProcess: pid and future of the workload.
+        """
+        with ProcessList.lock:
+            pid = ProcessList.get_next_pid()
+            new_process = VirtualProcess(program, pid, user, parent, target, priority, executor, args)
+        return new_process.execute()
+
+    def process_future(self, pid):
+        """
+        Future of the workload of pid, None if it has none or has finished.
+        """
+        task = get_task(pid) or get_process(pid)
+        return task.future if task is not None else None
+
     def schedule_processes(self):
-        for process in self.processes:
-            try:
-                process.execute()
-            except Exception as e:
-                self.handle_error(e)
-                # Recover from error by removing the last process and retrying
-                self.recover_from_error()
+        # Workloads run on the shared scheduler as soon as they are created;
+        # this only makes sure it is running and lists what it runs
+        return list(get_scheduler().processes.values())
+
+    def create_ipc(self, kind, name, size=None):
+        """
+        Create a named pipe, queue or ring that any process can open with
+        virtualipc.lookup(name).
+
+        Parameters:
+            kind (str): 'pipe', 'queue' or 'ring'.
+            size (int): Capacity in bytes, or in messages for a queue.
+        """
+        factories = {"pipe": (virtualipc.create_pipe, virtualipc.PIPE_CAPACITY),
+                     "queue": (virtualipc.create_queue, virtualipc.QUEUE_SIZE),
+                     "ring": (virtualipc.create_ring, virtualipc.RING_CAPACITY)}
+        if kind not in factories:
+            raise ValueError(f"Unknown IPC kind: {kind}")
+        factory, default = factories[kind]
+        item = factory(name, size or default)
+        self.log(INFO, "ipc", "created %s %s (%s)", kind, name, item.describe())
+        return item
+
+    def remove_ipc(self, name):
+        virtualipc.remove(name)
+        self.log(INFO, "ipc", "removed %s", name)
+
+    def timer_wheel(self):
+        # Started on first use, like the scheduler
+        return get_timer_wheel(KernelMessage.log)
+
+    def start_cron(self, fs, runner=None):
+        """
+        Start cron on /etc/crontab, or hand a running cron a new runner.
+
+        Parameters:
+            runner: Called with each command line of a job, see CronService.
+        """
+        with ProcessList.lock:
+            if VirtualKernel.cron is None:
+                self.create_process("timerd")
+                self.create_process("crond")
+                VirtualKernel.cron = CronService(self, fs, runner).start(self.timer_wheel())
+                return VirtualKernel.cron
+        VirtualKernel.cron.runner = runner
+        return VirtualKernel.cron
 
     def log_command(self, command):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(self.dmesg_file, "a") as f:
-            f.write(f"[{timestamp}] {command}\n")
+        # Buffered; written to disk in batches by dmesgd
+        kernel_log(self.dmesg_file).write(command)
+
+    def log(self, level, subsystem, template, *args, pid=0):
+        """
+        Log a structured message. template is %-formatted with args only if
+        the record passes the log level, so debug calls are nearly free.
+        """
+        kernel_log(self.dmesg_file).log(level, subsystem, template, *args, pid=pid)
+
+    def set_log_level(self, level):
+        kernel_log(self.dmesg_file).level = parse_level(level)
+
+    def query_dmesg(self, since=None, level=None, grep=None, limit=None):
+        return kernel_log(self.dmesg_file).query(since, level, grep, limit)
+
+    def page_dmesg(self, number, size=50):
+        # Reads the rotated segments from the newest end, chunk by chunk
+        return kernel_log(self.dmesg_file).page(number, size)
+
+    def follow_dmesg(self, cursor=None):
+        return kernel_log(self.dmesg_file).follow(cursor)
 
     def boot_verbose(self):
         verbose_message = "VirtualOS boot-up completed."
         self.log_command(verbose_message)
 
     def print_dmesg(self):
-        dmesg_list = []
-        try:
-            with open(self.dmesg_file, "r") as f:
-                dmesg_list.append(f.read())
-            return dmesg_list
-        except FileNotFoundError:
-            print("dmesg file not found.")
+        # Served from the in-memory ring, the file is only written
+        return kernel_log(self.dmesg_file).lines()
+
+    def flush_dmesg(self):
+        kernel_log(self.dmesg_file).flush()
 
     def delete_dmesg(self):
-        try:
-            os.remove(self.dmesg_file)
+        if kernel_log(self.dmesg_file).delete():
             print("dmesg file deleted.")
-        except FileNotFoundError:
+        else:
             print("dmesg file not found.")
 
     def toggle_filesystem_monitoring(self):
@@ -552,43 +645,140 @@ class VirtualKernel:
             self.reboot_os()
 
 
+class ProcessRecord:
+    """
+    One entry of the process table.
+    """
+    __slots__ = ("pid", "name", "user", "ppid", "cache", "start_time", "children", "executor", "usage")
+
+    def __init__(self, pid, name, user, ppid, cache, start_time, executor=None):
+        self.pid = pid
+        self.name = name
+        self.user = user
+        self.ppid = ppid
+        self.cache = cache
+        self.start_time = start_time
+        self.children = set()  # PIDs of the live children
+        self.executor = executor  # 'thread' or 'process' for pool-backed processes
+        self.usage = None  # Usage counters, see virtualacct.py
+
+
+class PidAllocator:
+    """
+    Hands out PIDs from first to limit in order, then wraps around and
+    reuses released PIDs oldest first, so a PID is not reused until the
+    range has been walked once. Both directions are O(1).
+    """
+    def __init__(self, first=100, limit=4194304):
+        self.first = first
+        self.limit = limit
+        self.next = first
+        self.free = deque()  # Released PIDs, oldest first
+
+    def allocate(self):
+        if self.next < self.limit:
+            pid = self.next
+            self.next += 1
+            return pid
+        if self.free:
+            return self.free.popleft()
+        raise RuntimeError("No free PIDs")
+
+    def release(self, pid):
+        # PIDs below first are reserved for kernel daemons and assigned by hand
+        if self.first <= pid < self.next:
+            self.free.append(pid)
+
+
 class ProcessList:
-    running_processes = {}
+    running_processes = {}  # pid -> ProcessRecord
+    names = {}  # name -> set of PIDs running that program
+    pids = PidAllocator()
+    lock = threading.RLock()
 
     @classmethod
-    def add_process(cls, name, pid, cache, user):
-        if not cls.running_processes:
-            cls.next_pid = 0
+    def add_process(cls, name, pid, cache, user, ppid=0, executor=None):
         start_time = time.time()
-        cls.running_processes[pid] = {'name': name, 'cache': cache, 'start_time': {start_time}, 'user': user}
-        KernelMessage.log_process(f"name: {name}, pid: {pid},  cache: {cache}, start_time: {start_time}, user: {user}")
+        record = ProcessRecord(pid, name, user, ppid, cache, start_time, executor)
+        with cls.lock:
+            if pid in cls.running_processes:
+                # Reserved PIDs (vprocd) are registered again by each VCommands
+                cls.remove_process(pid, release=False)
+            cls.running_processes[pid] = record
+            record.usage = register(pid)
+            cls.names.setdefault(name, set()).add(pid)
+            parent = cls.running_processes.get(ppid)
+            if parent is not None and ppid != pid:
+                parent.children.add(pid)
+        KernelMessage.log(DEBUG, "proc", "name: %s, pid: %s, ppid: %s, cache: %s, start_time: %s, user: %s",
+                          name, pid, ppid, cache, start_time, user, pid=pid)
+        return record
 
     @classmethod
-    def remove_process(cls, pid):
-        if pid in cls.running_processes:
-            del cls.running_processes[pid]
+    def remove_process(cls, pid, release=True):
+        """
+        Drop pid from the table. Its children are adopted by the kernel
+        (PID 0). Returns the removed record or None.
+        """
+        with cls.lock:
+            record = cls.running_processes.pop(pid, None)
+            if record is None:
+                return None
+            unregister(pid)
+            pids = cls.names.get(record.name)
+            if pids is not None:
+                pids.discard(pid)
+                if not pids:
+                    del cls.names[record.name]
+            parent = cls.running_processes.get(record.ppid)
+            if parent is not None:
+                parent.children.discard(pid)
+            kernel = cls.running_processes.get(0)
+            for child in record.children:
+                child_record = cls.running_processes.get(child)
+                if child_record is not None:
+                    child_record.ppid = 0
+                    if kernel is not None:
+                        kernel.children.add(child)
+            if release:
+                cls.pids.release(pid)
+            return record
 
     @classmethod
     def get_next_pid(cls):
-        if not cls.running_processes:
-            return 100
-        else:
-            last_pid = max(cls.running_processes.keys())
-            return max(100, last_pid + 1)
+        with cls.lock:
+            return cls.pids.allocate()
 
     @classmethod
     def get_running_pids(cls):
         return list(cls.running_processes.keys())
 
+    @classmethod
+    def find_by_name(cls, name):
+        """
+        PIDs running program name, lowest first.
+        """
+        return sorted(cls.names.get(name, ()))
+
+    @classmethod
+    def get_children(cls, pid):
+        record = cls.running_processes.get(pid)
+        return sorted(record.children) if record is not None else []
+
 
 
 class VirtualProcess:
-    def __init__(self, program, pid, user):
+    def __init__(self, program, pid, user, ppid=0, target=None, priority=0, executor=None, args=()):
         self.program = program
         self.pid = pid
         self.cache = 1
-        KernelMessage.log_process(f"[*]{user} starting {program}...")
-        ProcessList.add_process(self.program, self.pid, self.cache, user)
+        self.target = target
+        self.priority = priority
+        self.executor = executor
+        self.args = args
+        KernelMessage.log(INFO, "proc", "[*]%s starting %s...", user, program, pid=pid)
+        self.record = ProcessList.add_process(self.program, self.pid, self.cache, user, ppid, executor)
+        self.start_time = self.record.start_time
 
 
     def get_elapsed_time(self):
@@ -596,32 +786,61 @@ class VirtualProcess:
         return time.time() - self.start_time
 
     def execute(self):
-        pass
+        """
+        Start the workload on its worker pool or on the scheduler.
+
+        Returns:
+            PoolTask or ScheduledProcess: Its future holds the result.
+        """
+        if self.executor is not None:
+            return submit_task(self.pid, self.program, self.executor, self.target, self.args, self.exited)
+        return get_scheduler().spawn(self.pid, self.program, self.target, self.priority, self.exited)
+
+    def exited(self, process):
+        if not process.future.cancelled() and process.future.exception() is not None:
+            KernelMessage.log(ERROR, "proc", "%s failed: %r", process.name, process.future.exception(), pid=process.pid)
+        else:
+            KernelMessage.log(DEBUG, "proc", "%s exited", process.name, pid=process.pid)
+        with ProcessList.lock:
+            # Unless it was killed, and the PID perhaps reused, meanwhile
+            if ProcessList.running_processes.get(self.pid) is self.record:
+                ProcessList.remove_process(self.pid)
 
 
 
+    @staticmethod
+    def process_state(pid):
+        """
+        (where the workload of pid runs, its state) for sysmon.
+        """
+        task = get_task(pid)
+        if task is not None:
+            return f"{task.kind} pool", task.state
+        process = get_process(pid)
+        if process is not None:
+            return "scheduler", process.state
+        return "-", "idle"
+
     @staticmethod
     def kill_process(self, pid, verbose=False):
-        if pid in ProcessList.running_processes:
-            process_info = ProcessList.running_processes[pid]
-            process_name = process_info['name']
-            del ProcessList.running_processes[pid]
+        record = ProcessList.remove_process(pid)
+        # Cancelling may run the exit callback at once; the entry is already gone
+        cancel(pid)
+        cancel_task(pid)
+        if record is not None:
+            process_name = record.name
             if verbose:
                 print(f"Process '{process_name}' with PID {pid} has been killed.")
-            KernelMessage.log_process(f"Process '{process_name}' with PID {pid} has been killed.")
+            KernelMessage.log(INFO, "proc", "Process '%s' with PID %s has been killed.", process_name, pid, pid=pid)
         else:
             print(f"Process with PID {pid} not found.")
 
     @staticmethod
     def kill_process_by_name(self, process_name, verbose=False):
-        pid_to_remove = None
-        for pid, process_info in ProcessList.running_processes.items():
-            if process_info['name'] == process_name:
-                pid_to_remove = pid
-                break
-
-        if pid_to_remove is not None:
-            VirtualProcess.kill_process(self, pid_to_remove, verbose)
+        pids = ProcessList.find_by_name(process_name)
+
+        if pids:
+            VirtualProcess.kill_process(self, pids[0], verbose)
         else:
             print(f"Process '{process_name}' not found.")
 
@@ -630,15 +849,39 @@ class VirtualProcess:
     def shutdown_vproc(self):
         # Create a copy of the dictionary to avoid modifying it during iteration
         running_processes_copy = ProcessList.running_processes.copy()
-        for pid, process_info in running_processes_copy.items():
-            process_name = process_info['name']
+        for pid in running_processes_copy:
             VirtualProcess.kill_process(self, pid)
 
 
 
 
+    # sysmon --sort keys; counters sort largest first
+    SORT_KEYS = {
+        "pid": lambda record: record.pid,
+        "name": lambda record: record.name,
+        "uptime": lambda record: record.start_time,
+        "cpu": lambda record: -record.usage.cpu_time,
+        "mem": lambda record: -record.usage.memory,
+        "read": lambda record: -record.usage.bytes_read,
+        "write": lambda record: -record.usage.bytes_written,
+        "io": lambda record: -(record.usage.bytes_read + record.usage.bytes_written),
+        "cmds": lambda record: -record.usage.commands,
+    }
+
+    @staticmethod
+    def sorted_processes(sort="pid"):
+        """
+        Process records ordered by one of SORT_KEYS.
+        """
+        if sort not in VirtualProcess.SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort} (use {', '.join(VirtualProcess.SORT_KEYS)})")
+        return sorted(list(ProcessList.running_processes.values()), key=VirtualProcess.SORT_KEYS[sort])
+
     @staticmethod
-    def monitor_processes(self):
+    def monitor_processes(self, sort="pid", memory=None):
+        if memory is not None:
+            memory_tracking(memory)
+        VirtualProcess.sorted_processes(sort)  # Reject a bad key before taking over the screen
         sysmon_pid = VirtualKernel.create_process(self, "sysmon", True, self.active_user)
 
         console = Console()
@@ -653,19 +896,30 @@ class VirtualProcess:
                 table = Table(title="Process Monitor")
                 table.add_column("Process Name", justify="center")
                 table.add_column("PID", justify="center")
+                table.add_column("PPID", justify="center")
                 table.add_column("Cache", justify="center")
                 table.add_column("User", justify="center")
                 table.add_column("Uptime", justify="center")
+                table.add_column("Runs On", justify="center")
+                table.add_column("State", justify="center")
+                table.add_column("CPU", justify="right")
+                table.add_column("Memory", justify="right")
+                table.add_column("Read", justify="right")
+                table.add_column("Written", justify="right")
+                table.add_column("Cmds", justify="right")
+                tracking = memory_tracking()
 
                 # Populate the table with process information
-                for pid, process_info in ProcessList.running_processes.items():
-                    process_name = process_info['name']
-                    cache = process_info['cache']
-                    start_time = float(next(iter(process_info['start_time'])))
-                    elapsed_time = time.time() - start_time
+                for record in VirtualProcess.sorted_processes(sort):
+                    pid, usage = record.pid, record.usage
+                    elapsed_time = time.time() - record.start_time
                     formatted_uptime = KernelMessage.format_uptime(elapsed_time)
-                    user = process_info['user']
-                    table.add_row(process_name, str(pid), str(cache), user, formatted_uptime)
+                    runs_on, state = VirtualProcess.process_state(pid)
+                    table.add_row(record.name, str(pid), str(record.ppid), str(record.cache), record.user, formatted_uptime,
+                                  runs_on, state, f"{usage.cpu_time:.2f}s",
+                                  KernelMessage.format_size(usage.memory) if tracking else "-",
+                                  KernelMessage.format_size(usage.bytes_read), KernelMessage.format_size(usage.bytes_written),
+                                  str(usage.commands))
 
                 # Highlight the current process
                 table.highlighted = highlighted_index
@@ -676,6 +930,8 @@ class VirtualProcess:
 
                 # Print control instructions
                 console.print("Use arrow keys to navigate, and press Enter to select a process", justify="left")
+                console.print(f"Sorted by {sort}; sysmon --sort pid|name|uptime|cpu|mem|read|write|io|cmds, "
+                              f"--memory to track allocations", justify="left")
                 console.print("Press CTRL + C to exit", justify="left")
                 # Wait for user input
                 time.sleep(1)
@@ -0,0 +1,121 @@
+# virtuallock.py
+#
+# Reader-writer lock for the virtual file system.
+#
+# One lock guards the whole tree. Any number of threads may hold it for
+# reading; a writer holds it alone. Waiting writers block new readers so a
+# steady stream of reads cannot starve them. Both sides are reentrant for
+# the owning thread, and a writer may read, so VFS methods can call each
+# other freely. Upgrading a read to a write would deadlock two upgraders
+# and is refused.
+
+import functools
+import threading
+
+
+class ReadWriteLock:
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = None  # Ident of the thread holding the write side
+        self.write_depth = 0
+        self.waiting_writers = 0
+        self.local = threading.local()  # Per-thread read depth
+        self.read_side = _Side(self.acquire_read, self.release_read)
+        self.write_side = _Side(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        depth = getattr(self.local, "depth", 0)
+        if depth or self.writer == threading.get_ident():
+            # Nested read, or a read inside this thread's own write
+            self.local.depth = depth + 1
+            return
+        with self.condition:
+            while self.writer is not None or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        self.local.depth = 1
+        self.local.counted = True
+
+    def release_read(self):
+        self.local.depth -= 1
+        if self.local.depth or not getattr(self.local, "counted", False):
+            return
+        self.local.counted = False
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        ident = threading.get_ident()
+        if self.writer == ident:
+            self.write_depth += 1
+            return
+        if getattr(self.local, "counted", False):
+            raise RuntimeError("Cannot upgrade a read lock to a write lock")
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer is not None or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = ident
+            self.write_depth = 1
+
+    def release_write(self):
+        self.write_depth -= 1
+        if self.write_depth:
+            return
+        with self.condition:
+            self.writer = None
+            self.condition.notify_all()
+
+    def reading(self):
+        """
+        Context manager holding the lock for reading.
+        """
+        return self.read_side
+
+    def writing(self):
+        """
+        Context manager holding the lock exclusively.
+        """
+        return self.write_side
+
+
+class _Side:
+    # A plain object is cheaper than contextlib on every VFS call
+    __slots__ = ("acquire", "release")
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def reads(method):
+    """
+    Run a VirtualFileSystem method under the read side of its lock.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.read_side:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def writes(method):
+    """
+    Run a VirtualFileSystem method under the write side of its lock.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.write_side:
+            return method(self, *args, **kwargs)
+    return wrapper
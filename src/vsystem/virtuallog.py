@@ -0,0 +1,543 @@
+# virtuallog.py
+#
+# Buffered, structured kernel log (dmesg).
+#
+# A log call creates a LogRecord (time, level, subsystem, pid, message
+# template and its arguments) and nothing else: records below the log level
+# are discarded before any formatting, and the message is only formatted
+# when it is written or displayed. Records go to an in-memory ring, which
+# the plain dmesg command reads, and to a bounded queue drained by a
+# background writer thread ("dmesgd"). When the queue is full new records
+# are dropped and counted (the default, a log call never blocks the shell)
+# or, with overflow="block", the caller waits for the writer. flush() waits
+# until everything queued is on disk and runs at interpreter exit.
+#
+# The writer appends whole batches to the segment file, one tab separated
+# line per record:
+#
+#   time  level  subsystem  pid  message
+#
+# and for every batch appends (time of its first record, byte offset) to a
+# binary time index next to it, so queries with --since bisect the index
+# and seek straight to the first batch that can match.
+#
+# The active segment is rotated when it reaches max_bytes or max_age: it is
+# renamed to dmesg.<n> and a second thread ("dmesgz") rewrites it as
+# dmesg.<n>.z, a run of independently zlib compressed chunks of about
+# CHUNK_SIZE bytes with the same kind of time index, then drops segments
+# beyond the retention limit. Every segment is thus a list of indexed
+# chunks, so queries, pages and tails only read and decompress the chunks
+# they need, walking from the newest end when they want the latest records.
+#
+# Every VirtualKernel in the process shares the log for its dmesg path, see
+# kernel_log().
+
+import os
+import re
+import zlib
+import time
+import bisect
+import struct
+import atexit
+import threading
+from queue import Queue, Full, Empty
+from collections import deque
+from datetime import datetime
+
+RING_SIZE = 4096
+QUEUE_SIZE = 8192
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.5
+ROTATE_BYTES = 1024 * 1024
+ROTATE_AGE = 24 * 3600
+KEEP_SEGMENTS = 8
+CHUNK_SIZE = 64 * 1024
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warn", ERROR: "error"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+LEVELS["warning"] = WARNING
+
+INDEX_ENTRY = struct.Struct("<dQ")
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def kernel_log(path):
+    """
+    The shared KernelLog for a dmesg file, started on first use.
+    """
+    path = os.path.abspath(path)
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = KernelLog(path)
+        return log
+
+
+def parse_level(name):
+    """
+    Level number for a name such as 'warn', or a number given as text.
+    """
+    name = str(name).lower()
+    if name in LEVELS:
+        return LEVELS[name]
+    if name.isdigit():
+        return int(name)
+    raise ValueError(f"Unknown log level: {name}")
+
+
+class LogRecord:
+    __slots__ = ("time", "level", "subsystem", "pid", "template", "args")
+
+    def __init__(self, time, level, subsystem, pid, template, args):
+        self.time = time
+        self.level = level
+        self.subsystem = subsystem
+        self.pid = pid
+        self.template = template
+        self.args = args
+
+    def message(self):
+        # Callers have passed objects (e.g. a Directory) as the template
+        if not self.args:
+            return str(self.template)
+        try:
+            return str(self.template) % self.args
+        except (TypeError, ValueError):
+            # A bad template must not lose the message
+            return f"{self.template} {self.args!r}"
+
+    def format(self):
+        timestamp = datetime.fromtimestamp(self.time).strftime("%Y-%m-%d %H:%M:%S")
+        level = LEVEL_NAMES.get(self.level, str(self.level))
+        pid = f"[{self.pid}]" if self.pid else ""
+        return f"[{timestamp}] {level:<5} {self.subsystem}{pid}: {self.message()}"
+
+    def to_line(self):
+        message = self.message().replace("\\", "\\\\").replace("\n", "\\n").replace("\t", "\\t")
+        return f"{self.time:.6f}\t{self.level}\t{self.subsystem}\t{self.pid}\t{message}\n"
+
+    @classmethod
+    def from_line(cls, line):
+        """
+        Parse a segment line, None for lines that are not records.
+        """
+        parts = line.rstrip("\n").split("\t", 4)
+        if len(parts) != 5:
+            return None
+        try:
+            message = re.sub(r"\\(.)", lambda match: {"n": "\n", "t": "\t"}.get(match.group(1), match.group(1)), parts[4])
+            return cls(float(parts[0]), int(parts[1]), parts[2], int(parts[3]), message, ())
+        except ValueError:
+            return None
+
+
+def read_index(index_path):
+    """
+    (times, offsets) of the chunks listed in an index file.
+    """
+    times, offsets = [], []
+    try:
+        with open(index_path, "rb") as file:
+            for entry_time, offset in INDEX_ENTRY.iter_unpack(file.read()):
+                times.append(entry_time)
+                offsets.append(offset)
+    except (OSError, struct.error):
+        pass
+    return times, offsets
+
+
+def segment_chunks(path, compressed):
+    """
+    (time, path, compressed, start, end) of every chunk of a segment.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return []
+    times, offsets = read_index(path + ".idx")
+    if (offsets and offsets[0]) or (not offsets and size):
+        # Text from before the log was indexed; it has no parsable records
+        # but keeps the chunks covering the whole file
+        times.insert(0, 0.0)
+        offsets.insert(0, 0)
+    ends = offsets[1:] + [size]
+    return [(entry_time, path, compressed, start, end) for entry_time, start, end in zip(times, offsets, ends) if start < end]
+
+
+def read_chunk(chunk):
+    """
+    The records of one chunk, oldest first.
+    """
+    _, path, compressed, start, end = chunk
+    try:
+        with open(path, "rb") as file:
+            file.seek(start)
+            data = file.read(end - start)
+        if compressed:
+            data = zlib.decompress(data)
+    except (OSError, zlib.error):
+        return []
+    records = []
+    for line in data.split(b"\n"):
+        record = LogRecord.from_line(line.decode("utf-8", errors="replace"))
+        if record is not None:
+            records.append(record)
+    return records
+
+
+class KernelLog:
+    def __init__(self, path, ring_size=RING_SIZE, queue_size=QUEUE_SIZE, overflow="drop", level=INFO,
+                 max_bytes=ROTATE_BYTES, max_age=ROTATE_AGE, keep=KEEP_SEGMENTS):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.level = level
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+        self.segment_size = 0
+        self.segment_start = None  # Time of the first record in the active segment
+        self.ring = deque(maxlen=ring_size)
+        self.queue = Queue(maxsize=queue_size)
+        self.overflow = overflow
+        self.dropped = 0
+        self.failed = 0  # Records lost to an unexpected error while writing
+        self.written = 0
+        self.file = None
+        self.index_file = None
+        self.file_lock = threading.Lock()  # Held by the writer while a batch is on its way to disk
+        self.segments_lock = threading.Lock()  # Held while segment files are renamed or removed
+        self.stop_event = threading.Event()
+        self.writer = threading.Thread(target=self._run, name="dmesgd", daemon=True)
+        self.writer.start()
+        self.compress_queue = Queue()
+        self.compressor = threading.Thread(target=self._run_compressor, name="dmesgz", daemon=True)
+        self.compressor.start()
+        for number, compressed in self.rotated_segments():
+            if not compressed:
+                # Rotated by a session that exited before compressing it
+                self.compress_queue.put(number)
+
+    def log(self, level, subsystem, template, *args, pid=0):
+        """
+        Record a message. template is %-formatted with args, and only when
+        the record is written or displayed.
+        """
+        if level < self.level:
+            return
+        record = LogRecord(time.time(), level, subsystem, pid, template, args)
+        self.ring.append(record)
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def write(self, message, subsystem="kernel"):
+        """
+        Log a preformatted message; a leading [!] marks a warning.
+        """
+        message = str(message)
+        self.log(WARNING if message.startswith("[!") else INFO, subsystem, message)
+
+    def lines(self):
+        """
+        The most recent messages, oldest first. Never touches the disk.
+        """
+        return [record.format() for record in list(self.ring)]
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                first = self.queue.get(timeout=FLUSH_INTERVAL)
+            except Empty:
+                continue
+            batch = [first]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # dmesgd must outlive a bad batch; it is counted and reported with the next one
+                self.failed += len(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_batch(self, batch):
+        with self.file_lock:
+            records = list(batch)
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                records.append(LogRecord(time.time(), WARNING, "dmesgd", 0, "dropped %d message(s), queue full", (dropped,)))
+            if self.failed:
+                failed, self.failed = self.failed, 0
+                records.append(LogRecord(time.time(), ERROR, "dmesgd", 0, "lost %d message(s) to a write error", (failed,)))
+            try:
+                if self.file is None:
+                    self._open_segment()
+                if self.segment_size and (self.segment_size >= self.max_bytes or
+                        self.segment_start is not None and records[0].time - self.segment_start >= self.max_age):
+                    self._rotate()
+                data = "".join(self._line(record) for record in records).encode("utf-8")
+                self.file.write(data)
+                self.file.flush()
+                self.index_file.write(INDEX_ENTRY.pack(records[0].time, self.segment_size))
+                self.index_file.flush()
+                if self.segment_start is None:
+                    self.segment_start = records[0].time
+                self.segment_size += len(data)
+                self.written += len(records)
+            except OSError:
+                # The log must never take the shell down; the ring still has the messages
+                self._close_files()
+
+    @staticmethod
+    def _line(record):
+        try:
+            return record.to_line()
+        except Exception as e:
+            # Keep the record, without the message that could not be formatted
+            return LogRecord(record.time, record.level, record.subsystem, record.pid,
+                             "<unprintable message: %s>", (type(e).__name__,)).to_line()
+
+    def _open_segment(self):
+        self.file = open(self.path, "ab")
+        self.index_file = open(self.index_path, "ab")
+        self.segment_size = self.file.tell()
+        times, _ = read_index(self.index_path)
+        self.segment_start = times[0] if times else None
+
+    def _rotate(self):
+        """
+        Move the active segment aside for the compressor and start a new one.
+        """
+        self._close_files()
+        with self.segments_lock:
+            rotated = self.rotated_segments()
+            number = rotated[-1][0] + 1 if rotated else 1
+            os.replace(self.index_path, f"{self.path}.{number}.idx")
+            os.replace(self.path, f"{self.path}.{number}")
+        self.compress_queue.put(number)
+        self._open_segment()
+
+    def _close_files(self):
+        for file in (self.file, self.index_file):
+            if file is not None:
+                try:
+                    file.close()
+                except OSError:
+                    pass
+        self.file = self.index_file = None
+
+    def _run_compressor(self):
+        while True:
+            number = self.compress_queue.get()
+            try:
+                if number is None:
+                    return
+                self._compress(number)
+                self._apply_retention()
+            except OSError:
+                pass  # Left uncompressed, the next session retries
+            finally:
+                self.compress_queue.task_done()
+
+    def _compress(self, number):
+        """
+        Rewrite rotated segment number as compressed chunks.
+        """
+        raw_path = f"{self.path}.{number}"
+        compressed_path = raw_path + ".z"
+        chunks = segment_chunks(raw_path, False)
+        with open(raw_path, "rb") as file:
+            data = file.read()
+        with open(compressed_path + ".tmp", "wb") as output, open(compressed_path + ".idx.tmp", "wb") as index:
+            group = []
+            for position, chunk in enumerate(chunks):
+                group.append(chunk)
+                if chunk[4] - group[0][3] < CHUNK_SIZE and position < len(chunks) - 1:
+                    continue
+                index.write(INDEX_ENTRY.pack(group[0][0], output.tell()))
+                output.write(zlib.compress(data[group[0][3]:chunk[4]]))
+                group = []
+        with self.segments_lock:
+            os.replace(compressed_path + ".idx.tmp", compressed_path + ".idx")
+            os.replace(compressed_path + ".tmp", compressed_path)
+            for path in (raw_path, raw_path + ".idx"):
+                os.remove(path)
+
+    def _apply_retention(self):
+        with self.segments_lock:
+            rotated = self.rotated_segments()
+            for number, compressed in rotated[:max(0, len(rotated) - self.keep)]:
+                path = f"{self.path}.{number}" + (".z" if compressed else "")
+                for old in (path, path + ".idx"):
+                    if os.path.exists(old):
+                        os.remove(old)
+
+    def rotated_segments(self):
+        """
+        (number, compressed) of every rotated segment, oldest first.
+        """
+        directory, base = os.path.split(self.path)
+        segments = {}
+        try:
+            names = os.listdir(directory or ".")
+        except OSError:
+            return []
+        for name in names:
+            if not name.startswith(base + "."):
+                continue
+            rest = name[len(base) + 1:]
+            if rest.isdigit():
+                segments.setdefault(int(rest), False)
+            elif rest.endswith(".z") and rest[:-2].isdigit():
+                segments[int(rest[:-2])] = True  # Prefer the finished compressed copy
+        return sorted(segments.items())
+
+    def chunks(self):
+        """
+        Every chunk of every segment, oldest first; the chunk times are
+        ascending across segments.
+        """
+        chunks = []
+        for number, compressed in self.rotated_segments():
+            chunks += segment_chunks(f"{self.path}.{number}" + (".z" if compressed else ""), compressed)
+        return chunks + segment_chunks(self.path, False)
+
+    def records_backward(self, chunks):
+        """
+        Records of chunks, newest first, decompressing one chunk at a time.
+        """
+        for chunk in reversed(chunks):
+            yield from reversed(read_chunk(chunk))
+
+    def query(self, since=None, level=None, grep=None, limit=None):
+        """
+        Records from the log files matching every given filter.
+
+        Parameters:
+            since (float): Only records at or after this time.
+            level (int): Only records at or above this level.
+            grep (str): Only records whose message matches this regular expression.
+            limit (int): Only the last limit matches.
+
+        Returns:
+            list: Formatted records, oldest first.
+        """
+        self.flush()
+        pattern = re.compile(grep) if grep else None
+        with self.segments_lock:
+            chunks = self.chunks()
+            if since is not None:
+                # Chunks are in time order; start at the last one beginning before since
+                position = bisect.bisect_left([chunk[0] for chunk in chunks], since) - 1
+                chunks = chunks[max(0, position):]
+            matches = []
+            # Newest first, so a limit stops reading early
+            for record in self.records_backward(chunks):
+                if since is not None and record.time < since:
+                    break
+                if level is not None and record.level < level:
+                    continue
+                if pattern is not None and not pattern.search(record.template):
+                    continue
+                matches.append(record.format())
+                if limit and len(matches) == limit:
+                    break
+        matches.reverse()
+        return matches
+
+    def page(self, number, size=50):
+        """
+        Page number of the log, counting from the newest records (page 1).
+
+        Returns:
+            list: Formatted records, oldest first.
+        """
+        self.flush()
+        skip = (number - 1) * size
+        lines = []
+        with self.segments_lock:
+            for position, record in enumerate(self.records_backward(self.chunks())):
+                if position >= skip + size:
+                    break
+                if position >= skip:
+                    lines.append(record.format())
+        lines.reverse()
+        return lines
+
+    def tail(self, count=10):
+        return self.page(1, count)
+
+    def follow(self, cursor=None):
+        """
+        Records logged after cursor, for tail -f.
+
+        Parameters:
+            cursor: The value returned by the previous call, None to start now.
+
+        Returns:
+            tuple: (new cursor, formatted records oldest first).
+        """
+        ring = list(self.ring)
+        if not ring:
+            return cursor, []
+        if cursor is None:
+            return ring[-1], []
+        new = []
+        for record in reversed(ring):
+            if record is cursor:
+                break
+            new.append(record.format())
+        new.reverse()
+        return ring[-1], new
+
+    def flush(self):
+        """
+        Wait until every queued record is written.
+        """
+        if self.writer.is_alive():
+            self.queue.join()
+
+    def delete(self):
+        """
+        Remove every segment and index and clear the ring.
+        """
+        self.flush()
+        self.compress_queue.join()
+        with self.file_lock, self.segments_lock:
+            self._close_files()
+            self.ring.clear()
+            existed = os.path.exists(self.path)
+            paths = [self.path]
+            for number, compressed in self.rotated_segments():
+                paths += [f"{self.path}.{number}", f"{self.path}.{number}.z"]
+            for path in paths:
+                for old in (path, path + ".idx"):
+                    if os.path.exists(old):
+                        os.remove(old)
+        return existed
+
+    def close(self):
+        self.flush()
+        self.stop_event.set()
+        self.writer.join()
+        with self.file_lock:
+            self._close_files()
+        self.compress_queue.put(None)
+        self.compressor.join()
+
+
+@atexit.register
+def _flush_logs():
+    for log in list(_logs.values()):
+        log.close()
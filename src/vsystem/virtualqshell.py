@@ -0,0 +1,727 @@
+# virtualqshell.py
+#
+# The QShell script language.
+#
+#   # comments run to the end of the line
+#   set name = "world"
+#   echo "hello $name"                 any other line is a shell command
+#   set i = 0
+#   while $i < 10
+#       if $i % 2 == 0 and $i != 4
+#           echo even $i
+#       elif $i == 7
+#           break                      (continue works too)
+#       else
+#           ls /home
+#       end
+#       set i = $i + 1
+#   end
+#   for user in admin guest 1..3; echo $user; end
+#
+# Words are split on whitespace; 'single quotes' are literal, "double
+# quotes" expand $name and ${name}, backslash escapes one character and an
+# unquoted $name is split into several words. Expressions after if, elif,
+# while and set use numbers, strings, $variables, bare words (strings),
+# + - * / %, comparisons, and/or/not and parentheses; comparisons and not
+# give 1 or 0, and "", 0 and false are false. Numeric strings take part in
+# arithmetic and comparisons as numbers. Blocks close with end (or
+# fi/done); statements on one line are separated by ;.
+#
+# A script goes through three stages: the tokenizer splits statements into
+# words or expression tokens, the parser builds an AST of tuples, and the
+# compiler flattens it into a list of (opcode, argument) instructions for a
+# small stack machine. $var op constant and $var op $var compile to a single
+# instruction, which covers most loop conditions and counters. Compiled
+# scripts are cached by the SHA-256 of their source, so running an unchanged
+# script again skips straight to execution.
+
+import re
+import hashlib
+import operator
+from collections import OrderedDict
+
+CACHE_SIZE = 128
+STEP_LIMIT = 10_000_000  # Backward jumps before a script is considered runaway
+MAX_DEPTH = 16  # Nested qscript runs
+END_WORDS = ("end", "fi", "done")
+
+(PUSH, LOAD, INTERP, BINARY, NOT, NEG, STORE, JUMP, JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP,
+ RANGE, WORDS, CALL, ITER, FOR_ITER, POP, BINARY_VAR_CONST, BINARY_VAR_VAR) = range(19)
+
+OPCODE_NAMES = ("PUSH", "LOAD", "INTERP", "BINARY", "NOT", "NEG", "STORE", "JUMP", "JUMP_IF_FALSE",
+                "JUMP_IF_FALSE_OR_POP", "JUMP_IF_TRUE_OR_POP", "RANGE", "WORDS", "CALL", "ITER", "FOR_ITER", "POP",
+                "BINARY_VAR_CONST", "BINARY_VAR_VAR")
+
+
+class QShellError(Exception):
+    def __init__(self, message, line=None):
+        super().__init__(f"line {line}: {message}" if line else message)
+        self.line = line
+
+
+# Values
+
+def number(value):
+    """
+    value as an int or float, None if it is not numeric.
+    """
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+
+def truth(value):
+    if isinstance(value, str):
+        return value not in ("", "0", "false")
+    return bool(value)
+
+
+def text(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def _arithmetic(function, symbol):
+    def apply(left, right):
+        if type(left) is int and type(right) is int:
+            a, b = left, right
+        else:
+            a, b = number(left), number(right)
+            if a is None or b is None:
+                raise QShellError(f"cannot compute '{left}' {symbol} '{right}'")
+        try:
+            return function(a, b)
+        except ZeroDivisionError:
+            raise QShellError("division by zero")
+    return apply
+
+
+def _add(left, right):
+    if type(left) is int and type(right) is int:
+        return left + right
+    a, b = number(left), number(right)
+    if a is None or b is None:
+        return text(left) + text(right)
+    return a + b
+
+
+def _divide(a, b):
+    # Integer division for integers, as in other shells
+    return a // b if isinstance(a, int) and isinstance(b, int) else a / b
+
+
+def _comparison(function):
+    # 1 or 0, as in other shells: a bool would print and interpolate as True/False
+    def apply(left, right):
+        if type(left) is int and type(right) is int:
+            return 1 if function(left, right) else 0
+        a, b = number(left), number(right)
+        if a is None or b is None:
+            return 1 if function(text(left), text(right)) else 0
+        return 1 if function(a, b) else 0
+    return apply
+
+
+BINARY_OPERATORS = {
+    "+": _add, "-": _arithmetic(operator.sub, "-"), "*": _arithmetic(operator.mul, "*"),
+    "/": _arithmetic(_divide, "/"), "%": _arithmetic(operator.mod, "%"),
+    "==": _comparison(operator.eq), "!=": _comparison(operator.ne), "<": _comparison(operator.lt),
+    "<=": _comparison(operator.le), ">": _comparison(operator.gt), ">=": _comparison(operator.ge),
+}
+OPERATOR_SYMBOLS = {function: symbol for symbol, function in BINARY_OPERATORS.items()}
+
+
+# Tokenizer
+
+def split_statements(line):
+    """
+    Statements of a line: split on unquoted ;, without the comment.
+    """
+    statements, current, quote, index = [], [], None, 0
+    while index < len(line):
+        char = line[index]
+        if char == "\\" and quote != "'" and index + 1 < len(line):
+            current.append(line[index:index + 2])
+            index += 2
+            continue
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == ";":
+            statements.append("".join(current).strip())
+            current = []
+            index += 1
+            continue
+        elif char == "#" and (not current or current[-1][-1:].isspace()):
+            break
+        current.append(char)
+        index += 1
+    if quote:
+        raise QShellError("unterminated quote")
+    statements.append("".join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+VARIABLE = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+
+
+def _expand(segment, parts):
+    # Literal and variable parts of a double quoted or unquoted segment
+    position = 0
+    for match in VARIABLE.finditer(segment):
+        if match.start() > position:
+            parts.append(("lit", segment[position:match.start()]))
+        parts.append(("var", match.group(1) or match.group(2)))
+        position = match.end()
+    if position < len(segment):
+        parts.append(("lit", segment[position:]))
+
+
+def split_words(statement):
+    """
+    Words of a command statement.
+
+    Returns:
+        list: ("word", parts, quoted) nodes, parts being ("lit", text) and
+        ("var", name) pairs.
+    """
+    words, index, length = [], 0, len(statement)
+    while index < length:
+        while index < length and statement[index].isspace():
+            index += 1
+        if index >= length:
+            break
+        parts, quoted, literal = [], False, []
+        while index < length and not statement[index].isspace():
+            char = statement[index]
+            if char == "\\" and index + 1 < length:
+                literal.append(("\\", statement[index + 1]))
+                index += 2
+            elif char == "'":
+                end = statement.index("'", index + 1)
+                literal.append(("'", statement[index + 1:end]))
+                quoted, index = True, end + 1
+            elif char == '"':
+                end = index + 1
+                while statement[end] != '"':
+                    end += 2 if statement[end] == "\\" else 1
+                literal.append(('"', statement[index + 1:end]))
+                quoted, index = True, end + 1
+            else:
+                end = index
+                while end < length and not statement[end].isspace() and statement[end] not in "'\"\\":
+                    end += 1
+                literal.append(("", statement[index:end]))
+                index = end
+        for kind, segment in literal:
+            if kind in ("'", "\\"):
+                parts.append(("lit", segment))
+            else:
+                _expand(segment.replace('\\"', '"').replace("\\$", "\0") if kind == '"' else segment, parts)
+        parts = [(kind, value.replace("\0", "$")) if kind == "lit" else (kind, value) for kind, value in parts]
+        words.append(("word", _merge(parts), quoted))
+    return words
+
+
+def _merge(parts):
+    merged = []
+    for part in parts:
+        if merged and part[0] == "lit" and merged[-1][0] == "lit":
+            merged[-1] = ("lit", merged[-1][1] + part[1])
+        else:
+            merged.append(part)
+    return tuple(merged)
+
+
+EXPRESSION_TOKEN = re.compile(r"""
+    \s*(?:
+      (?P<number>\d+\.\d+|\d+)
+    | (?P<string>"(?:[^"\\]|\\.)*"|'[^']*')
+    | (?P<variable>\$\{\w+\}|\$\w+)
+    | (?P<operator>==|!=|<=|>=|&&|\|\||[-+*/%<>()!])
+    | (?P<word>[^\s()<>=!+*/%"']+)
+    )""", re.VERBOSE)
+
+
+def tokenize_expression(source):
+    tokens, position = [], 0
+    source = source.rstrip()
+    while position < len(source):
+        match = EXPRESSION_TOKEN.match(source, position)
+        if match is None or match.end() == position:
+            raise QShellError(f"unexpected '{source[position:].strip()}'")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "word" and value in ("and", "or", "not"):
+            kind = "operator"
+        tokens.append((kind, value))
+    return tokens
+
+
+# Parser
+
+class ExpressionParser:
+    PRECEDENCE = {"or": 1, "||": 1, "and": 2, "&&": 2, "==": 4, "!=": 4, "<": 4, "<=": 4, ">": 4, ">=": 4,
+                  "+": 5, "-": 5, "*": 6, "/": 6, "%": 6}
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise QShellError("missing expression")
+        node = self.expression(1)
+        if self.position < len(self.tokens):
+            raise QShellError(f"unexpected '{self.tokens[self.position][1]}'")
+        return node
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def expression(self, minimum):
+        left = self.unary()
+        while True:
+            kind, value = self.peek()
+            precedence = self.PRECEDENCE.get(value) if kind == "operator" else None
+            if precedence is None or precedence < minimum:
+                return left
+            self.position += 1
+            right = self.expression(precedence + 1)
+            op = {"&&": "and", "||": "or"}.get(value, value)
+            left = ("logic", op, left, right) if op in ("and", "or") else ("binary", op, left, right)
+
+    def unary(self):
+        kind, value = self.peek()
+        if kind == "operator" and value in ("not", "!"):
+            self.position += 1
+            return ("not", self.expression(3))
+        if kind == "operator" and value == "-":
+            self.position += 1
+            return ("neg", self.unary())
+        return self.atom()
+
+    def atom(self):
+        kind, value = self.peek()
+        self.position += 1
+        if kind == "number":
+            return ("const", float(value) if "." in value else int(value))
+        if kind == "string":
+            if value[0] == "'":
+                return ("const", value[1:-1])
+            parts = []
+            _expand(value[1:-1].replace('\\"', '"'), parts)
+            return ("interp", _merge(parts)) if any(part[0] == "var" for part in parts) else \
+                ("const", "".join(part[1] for part in parts))
+        if kind == "variable":
+            return ("var", value.strip("${}"))
+        if kind == "word":
+            return ("const", value)
+        if value == "(":
+            node = self.expression(1)
+            if self.peek()[1] != ")":
+                raise QShellError("missing ')'")
+            self.position += 1
+            return node
+        raise QShellError(f"unexpected '{value}'" if value else "incomplete expression")
+
+
+def parse_expression(source):
+    return ExpressionParser(tokenize_expression(source)).parse()
+
+
+def parse(source):
+    """
+    Parse a script into a list of statement nodes.
+    """
+    statements = []
+    for number_, line in enumerate(source.splitlines(), 1):
+        try:
+            for statement in split_statements(line):
+                statements.append((number_, statement))
+        except QShellError as e:
+            raise QShellError(str(e), number_)
+    body, terminator, position = _parse_block(statements, 0, ())
+    return body
+
+
+def _parse_block(statements, position, terminators):
+    body = []
+    while position < len(statements):
+        line, statement = statements[position]
+        keyword, _, rest = statement.partition(" ")
+        rest = rest.strip()
+        if keyword in terminators:
+            return body, (keyword, rest, line), position + 1
+        position += 1
+        try:
+            if keyword == "if":
+                branches, otherwise = [], []
+                condition = parse_expression(rest)
+                while True:
+                    block, (ending, ending_rest, ending_line), position = _parse_block(
+                        statements, position, ("elif", "else") + END_WORDS)
+                    branches.append((condition, block))
+                    if ending == "elif":
+                        condition = _parse_at(parse_expression, ending_rest, ending_line)
+                    elif ending == "else":
+                        otherwise, _, position = _parse_block(statements, position, END_WORDS)
+                        break
+                    else:
+                        break
+                body.append(("if", branches, otherwise, line))
+            elif keyword == "while":
+                condition = parse_expression(rest)
+                block, _, position = _parse_block(statements, position, END_WORDS)
+                body.append(("while", condition, block, line))
+            elif keyword == "for":
+                name, _, words = rest.partition(" ")
+                if not name.isidentifier() or words.partition(" ")[0] != "in":
+                    raise QShellError("expected 'for name in words'")
+                block, _, position = _parse_block(statements, position, END_WORDS)
+                body.append(("for", name, _range_words(split_words(words[2:])), block, line))
+            elif keyword == "set":
+                name, _, expression = rest.partition("=")
+                name = name.strip()
+                if not name.isidentifier():
+                    raise QShellError(f"invalid variable name '{name}'")
+                body.append(("set", name, parse_expression(expression), line))
+            elif keyword in ("break", "continue"):
+                body.append((keyword, line))
+            elif keyword in ("elif", "else") + END_WORDS:
+                raise QShellError(f"'{keyword}' without a matching block")
+            else:
+                body.append(("command", _range_words(split_words(statement)), line))
+        except QShellError as e:
+            raise e if e.line else QShellError(str(e), line)
+        except (ValueError, IndexError):
+            raise QShellError("unterminated quote", line)
+    if terminators:
+        raise QShellError("missing 'end'", statements[-1][0] if statements else None)
+    return body, None, position
+
+
+def _parse_at(function, source, line):
+    try:
+        return function(source)
+    except QShellError as e:
+        raise QShellError(str(e), line)
+
+
+def _range_words(words):
+    # An unquoted a..b word is an integer range
+    result = []
+    for word in words:
+        _, parts, quoted = word
+        if not quoted and len(parts) == 1 and parts[0][0] == "lit" and re.fullmatch(r"-?\d+\.\.-?\d+", parts[0][1]):
+            start, end = parts[0][1].split("..")
+            result.append(("range", int(start), int(end)))
+        else:
+            result.append(word)
+    return result
+
+
+# Compiler
+
+class Code:
+    __slots__ = ("instructions", "lines", "digest")
+
+    def __init__(self, instructions, lines, digest):
+        self.instructions = instructions  # Tuple of (opcode, argument)
+        self.lines = lines  # Source line of each instruction
+        self.digest = digest
+
+    def disassemble(self):
+        listing = []
+        for index, (op, arg) in enumerate(self.instructions):
+            if op == BINARY:
+                arg = OPERATOR_SYMBOLS[arg]
+            elif op in (BINARY_VAR_CONST, BINARY_VAR_VAR):
+                arg = (arg[0], arg[1], OPERATOR_SYMBOLS[arg[2]])
+            listing.append(f"{index:>4} {self.lines[index]:>4}  {OPCODE_NAMES[op]:<20} {'' if arg is None else arg!r}")
+        return listing
+
+
+class Compiler:
+    def __init__(self):
+        self.instructions = []
+        self.lines = []
+        self.line = 0
+        self.loops = []  # (continue target, break jump indexes) of the enclosing loops
+
+    def emit(self, op, arg=None):
+        self.instructions.append((op, arg))
+        self.lines.append(self.line)
+        return len(self.instructions) - 1
+
+    def patch(self, index, target):
+        self.instructions[index] = (self.instructions[index][0], target)
+
+    def compile(self, body, digest=None):
+        self.block(body)
+        return Code(tuple(self.instructions), tuple(self.lines), digest)
+
+    def block(self, body):
+        for statement in body:
+            self.line = statement[-1]
+            getattr(self, "statement_" + statement[0])(*statement[1:-1])
+
+    def statement_set(self, name, expression):
+        self.expression(expression)
+        self.emit(STORE, name)
+
+    def statement_command(self, words):
+        self.words(words)
+        self.emit(CALL)
+
+    def statement_if(self, branches, otherwise):
+        ends = []
+        for condition, body in branches:
+            self.expression(condition)
+            skip = self.emit(JUMP_IF_FALSE)
+            self.block(body)
+            ends.append(self.emit(JUMP))
+            self.patch(skip, len(self.instructions))
+        self.block(otherwise)
+        for index in ends:
+            self.patch(index, len(self.instructions))
+
+    def statement_while(self, condition, body):
+        top = len(self.instructions)
+        self.expression(condition)
+        exit_jump = self.emit(JUMP_IF_FALSE)
+        self.loops.append((top, []))
+        self.block(body)
+        self.emit(JUMP, top)
+        _, breaks = self.loops.pop()
+        for index in [exit_jump] + breaks:
+            self.patch(index, len(self.instructions))
+
+    def statement_for(self, name, words, body):
+        self.words(words)
+        self.emit(ITER)
+        top = self.emit(FOR_ITER, (name, None))
+        self.loops.append((top, []))
+        self.block(body)
+        self.emit(JUMP, top)
+        _, breaks = self.loops.pop()
+        # break leaves the iterator on the stack, exhaustion has popped it
+        for index in breaks:
+            self.patch(index, len(self.instructions))
+        if breaks:
+            self.emit(POP)
+        self.instructions[top] = (FOR_ITER, (name, len(self.instructions)))
+
+    def statement_break(self):
+        if not self.loops:
+            raise QShellError("'break' outside a loop", self.line)
+        self.loops[-1][1].append(self.emit(JUMP))
+
+    def statement_continue(self):
+        if not self.loops:
+            raise QShellError("'continue' outside a loop", self.line)
+        self.emit(JUMP, self.loops[-1][0])
+
+    def words(self, words):
+        for word in words:
+            if word[0] == "range":
+                self.emit(RANGE, (word[1], word[2]))
+                continue
+            _, parts, quoted = word
+            if all(kind == "lit" for kind, _ in parts):
+                self.emit(PUSH, "".join(value for _, value in parts))
+            else:
+                self.emit(INTERP, (parts, not quoted))
+        self.emit(WORDS, len(words))
+
+    def expression(self, node):
+        kind = node[0]
+        if kind == "const":
+            self.emit(PUSH, node[1])
+        elif kind == "var":
+            self.emit(LOAD, node[1])
+        elif kind == "interp":
+            self.emit(INTERP, (node[1], False))
+        elif kind == "binary" and node[2][0] == "var" and node[3][0] in ("const", "var"):
+            # $i + 1 and $a < $b are the bulk of loop code: one instruction instead of three
+            op = BINARY_VAR_CONST if node[3][0] == "const" else BINARY_VAR_VAR
+            self.emit(op, (node[2][1], node[3][1], BINARY_OPERATORS[node[1]]))
+        elif kind == "binary":
+            self.expression(node[2])
+            self.expression(node[3])
+            self.emit(BINARY, BINARY_OPERATORS[node[1]])
+        elif kind == "logic":
+            self.expression(node[2])
+            jump = self.emit(JUMP_IF_FALSE_OR_POP if node[1] == "and" else JUMP_IF_TRUE_OR_POP)
+            self.expression(node[3])
+            self.patch(jump, len(self.instructions))
+        elif kind == "not":
+            self.expression(node[1])
+            self.emit(NOT)
+        elif kind == "neg":
+            self.expression(node[1])
+            self.emit(NEG)
+
+
+_cache = OrderedDict()  # SHA-256 of the source -> Code
+cache_stats = {"hits": 0, "misses": 0}
+
+
+def compile_script(source):
+    """
+    Compiled form of source, from the cache if the same text was compiled
+    before.
+    """
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    code = _cache.get(digest)
+    if code is not None:
+        _cache.move_to_end(digest)
+        cache_stats["hits"] += 1
+        return code
+    cache_stats["misses"] += 1
+    code = Compiler().compile(parse(source), digest)
+    _cache[digest] = code
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return code
+
+
+# Interpreter
+
+class QShellInterpreter:
+    def __init__(self):
+        self.ext = ".qs"
+        self.variables = {}  # Dictionary to store variables
+        self.depth = 0
+        self.step_limit = STEP_LIMIT
+
+    def compile(self, script):
+        return compile_script(script)
+
+    def execute_script(self, script, runner=None, output=print):
+        """
+        Compile (or fetch from the cache) and run a script.
+
+        Parameters:
+            script (str): Source text of the script.
+            runner: Called with the command line of every command that is not
+                a builtin; without one such commands are an error.
+            output: Called with each line that echo prints.
+
+        Raises:
+            QShellError: On a syntax or runtime error.
+        """
+        return self.run(self.compile(script), runner, output)
+
+    def _interpolate(self, parts):
+        variables = self.variables
+        return "".join(value if kind == "lit" else text(variables.get(value, "")) for kind, value in parts)
+
+    def run(self, code, runner=None, output=print):
+        if self.depth >= MAX_DEPTH:
+            raise QShellError("scripts nested too deeply")
+        self.depth += 1
+        instructions = code.instructions
+        variables = self.variables
+        stack = []
+        push, pop = stack.append, stack.pop
+        pc, end, steps = 0, len(instructions), 0
+        try:
+            while pc < end:
+                op, arg = instructions[pc]
+                pc += 1
+                if op == BINARY_VAR_CONST:
+                    name, constant, function = arg
+                    push(function(variables.get(name, ""), constant))
+                elif op == STORE:
+                    variables[arg] = pop()
+                elif op == LOAD:
+                    push(variables.get(arg, ""))
+                elif op == PUSH:
+                    push(arg)
+                elif op == BINARY:
+                    right = pop()
+                    stack[-1] = arg(stack[-1], right)
+                elif op == JUMP_IF_FALSE:
+                    value = pop()
+                    if not (value if type(value) is int else truth(value)):
+                        pc = arg
+                elif op == JUMP:
+                    if arg < pc:
+                        steps += 1
+                        if steps > self.step_limit:
+                            raise QShellError("step limit exceeded, is there an endless loop?")
+                    pc = arg
+                elif op == BINARY_VAR_VAR:
+                    left, right, function = arg
+                    push(function(variables.get(left, ""), variables.get(right, "")))
+                elif op == FOR_ITER:
+                    name, exit_target = arg
+                    item = next(stack[-1], None)
+                    if item is None:
+                        pop()
+                        pc = exit_target
+                    else:
+                        variables[name] = item
+                elif op == INTERP:
+                    parts, split = arg
+                    value = self._interpolate(parts)
+                    push(value.split() if split else value)
+                elif op == WORDS:
+                    words = []
+                    for item in stack[len(stack) - arg:]:
+                        if isinstance(item, list):
+                            words.extend(item)
+                        else:
+                            words.append(text(item))
+                    del stack[len(stack) - arg:]
+                    push(words)
+                elif op == CALL:
+                    self._call(pop(), runner, output)
+                elif op == ITER:
+                    push(iter(pop()))
+                elif op == RANGE:
+                    start, stop = arg
+                    step = 1 if stop >= start else -1
+                    push([str(value) for value in range(start, stop + step, step)])
+                elif op == NOT:
+                    stack[-1] = 0 if truth(stack[-1]) else 1
+                elif op == NEG:
+                    value = number(stack[-1])
+                    if value is None:
+                        raise QShellError(f"cannot negate '{stack[-1]}'")
+                    stack[-1] = -value
+                elif op == JUMP_IF_FALSE_OR_POP:
+                    if not truth(stack[-1]):
+                        pc = arg
+                    else:
+                        pop()
+                elif op == JUMP_IF_TRUE_OR_POP:
+                    if truth(stack[-1]):
+                        pc = arg
+                    else:
+                        pop()
+                elif op == POP:
+                    pop()
+        except QShellError as e:
+            raise e if e.line else QShellError(str(e), code.lines[pc - 1])
+        finally:
+            self.depth -= 1
+
+    def _call(self, words, runner, output):
+        if not words:
+            return
+        if words[0] == "echo":
+            output(" ".join(words[1:]))
+        elif runner is None:
+            raise QShellError(f"{words[0]}: command not found")
+        else:
+            runner(" ".join(words))
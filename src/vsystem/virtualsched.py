@@ -0,0 +1,303 @@
+# virtualsched.py
+#
+# Cooperative scheduler for virtual processes.
+#
+# A process workload is a coroutine function taking its ScheduledProcess:
+#
+#   async def job(process):
+#       for block in blocks:
+#           work(block)
+#           await process.yield_now()
+#
+# The scheduler runs an asyncio event loop in its own thread ("schedd") and
+# lets exactly one process run at a time. Like CFS it keeps the ready
+# processes in a heap keyed by virtual runtime, the CPU time a process has
+# used divided by the weight of its priority (nice -20..19, 1.25x per
+# step), and always resumes the one with the least. yield_now() only gives
+# up the CPU once the process has used its time slice, so yielding in a
+# tight loop is cheap. sleep() and wait() park the process; when it wakes
+# its virtual runtime is raised to just below the minimum, so a process
+# that slept does not monopolise the CPU afterwards but does get it soon.
+# Shell work submitted at INTERACTIVE priority therefore runs ahead of any
+# number of background jobs.
+#
+# Every VirtualKernel shares one scheduler, see get_scheduler().
+
+import time
+import heapq
+import asyncio
+import threading
+from concurrent.futures import Future
+from vsystem.virtualacct import current_pid, charge_cpu
+
+TIME_SLICE = 0.01
+NICE_0_WEIGHT = 1024
+INTERACTIVE = -10
+
+READY, RUNNING, SLEEPING, BLOCKED, DONE = "ready", "running", "sleeping", "blocked", "done"
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    The shared scheduler, started on first use.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = VirtualScheduler()
+            _scheduler.start()
+        return _scheduler
+
+
+def cancel(pid):
+    """
+    Cancel the scheduled workload of pid, if there is a scheduler at all.
+    """
+    if _scheduler is not None:
+        return _scheduler.cancel(pid)
+    return False
+
+
+def get_process(pid):
+    """
+    The ScheduledProcess of pid, without starting a scheduler.
+    """
+    return _scheduler.get(pid) if _scheduler is not None else None
+
+
+def nice_weight(priority):
+    return NICE_0_WEIGHT / 1.25 ** priority
+
+
+class ScheduledProcess:
+    __slots__ = ("pid", "name", "priority", "weight", "vruntime", "cpu_time", "switches", "state",
+                 "scheduler", "resume", "slice_start", "slice_cpu", "task", "timer", "future", "on_exit")
+
+    def __init__(self, scheduler, pid, name, priority, on_exit):
+        self.scheduler = scheduler
+        self.pid = pid
+        self.name = name
+        self.priority = priority
+        self.weight = nice_weight(priority)
+        self.vruntime = 0.0
+        self.cpu_time = 0.0
+        self.switches = 0
+        self.state = READY
+        self.resume = None  # Future the process waits on until it is dispatched
+        self.slice_start = 0.0
+        self.slice_cpu = 0.0  # Thread CPU time at the start of the slice
+        self.task = None
+        self.timer = None
+        self.future = Future()  # Result of the workload, usable from any thread
+        self.on_exit = on_exit
+
+    async def yield_now(self):
+        """
+        Let another process run if this one has used its time slice.
+        """
+        if time.perf_counter() - self.slice_start < self.scheduler.time_slice:
+            return
+        await self.scheduler.park(self, READY)
+
+    async def sleep(self, seconds):
+        await self.scheduler.park(self, SLEEPING, delay=seconds)
+
+    async def wait(self, awaitable):
+        """
+        Await something outside the scheduler (a queue, a pipe, an executor
+        future) without holding the CPU meanwhile.
+        """
+        return await self.scheduler.park(self, BLOCKED, awaitable=awaitable)
+
+
+class VirtualScheduler:
+    def __init__(self, time_slice=TIME_SLICE):
+        self.time_slice = time_slice
+        self.processes = {}  # pid -> ScheduledProcess
+        self.ready = []  # Heap of (vruntime, sequence, process)
+        self.sequence = 0
+        self.min_vruntime = 0.0
+        self.current = None
+        self.parked = None  # Future the dispatcher waits on while current runs
+        self.switches = 0
+        self.loop = None
+        self.thread = None
+        self.started = threading.Event()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run_loop, name="schedd", daemon=True)
+            self.thread.start()
+            self.started.wait()
+        return self
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.loop.create_task(self._dispatch())
+        self.started.set()
+        self.loop.run_forever()
+        # Stopped: cancel what is left, processes exit through on_exit as usual
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def spawn(self, pid, name, target, priority=0, on_exit=None):
+        """
+        Run target(process) as a scheduled process. Thread-safe.
+
+        Parameters:
+            pid (int): PID from the process table.
+            target: Coroutine function taking the ScheduledProcess.
+            priority (int): Nice value, -20 (most CPU) to 19.
+            on_exit: Called with the process once it has finished.
+
+        Returns:
+            ScheduledProcess: Its future holds the workload's result.
+        """
+        process = ScheduledProcess(self, pid, name, priority, on_exit)
+        self.processes[pid] = process
+        self.loop.call_soon_threadsafe(self._start_process, process, target)
+        return process
+
+    def cancel(self, pid):
+        process = self.processes.get(pid)
+        if process is None:
+            return False
+        self.loop.call_soon_threadsafe(self._cancel_process, process)
+        return True
+
+    def renice(self, pid, priority):
+        process = self.processes.get(pid)
+        if process is None:
+            return False
+        process.priority = priority
+        process.weight = nice_weight(priority)
+        return True
+
+    def get(self, pid):
+        return self.processes.get(pid)
+
+    # Everything below runs on the scheduler thread
+
+    def _start_process(self, process, target):
+        if process.state == DONE:
+            return  # Cancelled before it started
+        process.vruntime = self.min_vruntime
+        process.task = self.loop.create_task(self._run_process(process, target))
+
+    async def _run_process(self, process, target):
+        try:
+            current_pid.set(process.pid)  # Only in this task's context
+            process.resume = self.loop.create_future()
+            self._enqueue(process)
+            await process.resume
+            result = await target(process)
+        except asyncio.CancelledError:
+            process.future.cancel()
+        except BaseException as e:
+            process.future.set_exception(e)
+        else:
+            process.future.set_result(result)
+        finally:
+            if process is self.current:
+                self._account(process)
+                self.current = None
+                self._release()
+            if process.timer is not None:
+                process.timer.cancel()
+            process.state = DONE
+            self.processes.pop(process.pid, None)
+            if process.on_exit is not None:
+                process.on_exit(process)
+
+    def _cancel_process(self, process):
+        if process.state == DONE:
+            return
+        if process.task is None:
+            # Not started yet; _start_process will skip it
+            process.state = DONE
+            self.processes.pop(process.pid, None)
+            process.future.cancel()
+            if process.on_exit is not None:
+                process.on_exit(process)
+            return
+        if process is not self.current:
+            process.state = DONE  # A stale heap entry is skipped by the dispatcher
+        process.task.cancel()
+
+    def _account(self, process):
+        elapsed = time.perf_counter() - process.slice_start
+        process.cpu_time += elapsed
+        process.vruntime += elapsed * NICE_0_WEIGHT / process.weight
+        charge_cpu(process.pid, time.thread_time() - process.slice_cpu)
+
+    def _enqueue(self, process):
+        process.state = READY
+        self.sequence += 1
+        heapq.heappush(self.ready, (process.vruntime, self.sequence, process))
+        self.wakeup.set()
+
+    def _release(self):
+        if self.parked is not None and not self.parked.done():
+            self.parked.set_result(None)
+
+    def _wake(self, process):
+        if process.state in (SLEEPING, BLOCKED):
+            process.timer = None
+            # Sleepers rejoin just behind the queue, not with a huge credit
+            process.vruntime = max(process.vruntime, self.min_vruntime - self.time_slice)
+            self._enqueue(process)
+
+    async def park(self, process, state, delay=None, awaitable=None):
+        """
+        Give up the CPU: back to the ready queue, asleep for delay seconds,
+        or blocked until awaitable completes.
+        """
+        self._account(process)
+        process.switches += 1
+        process.state = state
+        process.resume = self.loop.create_future()
+        self.current = None
+        self._release()
+        if state == READY:
+            self._enqueue(process)
+        elif state == SLEEPING:
+            process.timer = self.loop.call_later(delay, self._wake, process)
+        result = None
+        if awaitable is not None:
+            try:
+                result = await awaitable
+            finally:
+                self._wake(process)
+        await process.resume
+        return result
+
+    async def _dispatch(self):
+        while True:
+            while not self.ready:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            vruntime, _, process = heapq.heappop(self.ready)
+            if process.state != READY:
+                continue
+            self.min_vruntime = max(self.min_vruntime, vruntime)
+            self.current = process
+            process.state = RUNNING
+            self.parked = self.loop.create_future()
+            process.slice_start = time.perf_counter()
+            process.slice_cpu = time.thread_time()
+            process.resume.set_result(None)
+            await self.parked
+            self.switches += 1
@@ -0,0 +1,131 @@
+# virtualsession.py
+#
+# Login sessions.
+#
+# A successful login issues a session: a random token mapped to the user,
+# valid for SESSION_TTL seconds. Privilege checks then look the token up
+# instead of reading passwd and hashing a password again. A successful su
+# elevates the session for SU_TTL seconds, like sudo's timestamp, so su
+# and su_check only prompt again once that has run out.
+#
+# Sessions are kept in expiry order (the TTL is the same for all of them),
+# so expired ones are dropped from the front in amortised O(1) whenever a
+# session is issued; a lookup of an expired token drops it too.
+#
+# vOS has one console; current is the token of whoever is logged in on it.
+# Every PasswordFile shares one store, see session_store().
+
+import time
+import secrets
+import threading
+from collections import OrderedDict
+
+SESSION_TTL = 8 * 60 * 60
+SU_TTL = 5 * 60
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def session_store():
+    """
+    The shared session store, created on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
+
+
+class Session:
+    __slots__ = ("token", "username", "uid", "expires", "su_expires")
+
+    def __init__(self, token, username, uid, expires):
+        self.token = token
+        self.username = username
+        self.uid = uid
+        self.expires = expires
+        self.su_expires = 0.0
+
+    @property
+    def elevated(self):
+        return time.monotonic() < self.su_expires
+
+
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL, su_ttl=SU_TTL):
+        self.ttl = ttl
+        self.su_ttl = su_ttl
+        self.sessions = OrderedDict()  # token -> Session, oldest first
+        self.current = None  # Token of the console session
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def issue(self, username, uid=None):
+        """
+        Start a session for an authenticated user.
+
+        Returns:
+            str: The session token.
+        """
+        now = time.monotonic()
+        token = secrets.token_hex(16)
+        with self.lock:
+            while self.sessions:
+                oldest = next(iter(self.sessions.values()))
+                if oldest.expires > now:
+                    break
+                self.sessions.popitem(last=False)
+            self.sessions[token] = Session(token, username, uid, now + self.ttl)
+        return token
+
+    def validate(self, token):
+        """
+        The live session of token, None if it is unknown or has expired.
+        """
+        session = self.sessions.get(token)
+        if session is None:
+            return None
+        if session.expires <= time.monotonic():
+            self.revoke(token)
+            return None
+        return session
+
+    def elevate(self, token):
+        session = self.validate(token)
+        if session is None:
+            return False
+        session.su_expires = time.monotonic() + self.su_ttl
+        return True
+
+    def drop_privileges(self, token):
+        session = self.validate(token)
+        if session is not None:
+            session.su_expires = 0.0
+
+    def is_elevated(self, token):
+        session = self.validate(token)
+        return session is not None and session.elevated
+
+    def revoke(self, token):
+        with self.lock:
+            self.sessions.pop(token, None)
+            if self.current == token:
+                self.current = None
+
+    def revoke_user(self, username):
+        """
+        End every session of username, e.g. after a password change.
+        """
+        with self.lock:
+            tokens = [token for token, session in self.sessions.items() if session.username == username]
+        for token in tokens:
+            self.revoke(token)
+        return len(tokens)
+
+    def current_user(self):
+        session = self.validate(self.current)
+        return session.username if session is not None else None
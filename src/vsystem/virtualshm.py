@@ -0,0 +1,193 @@
+# virtualshm.py
+#
+# Read-only view of a VFS subtree in multiprocessing shared memory.
+#
+# A process pool cannot see the VFS without pickling the Directory tree, so
+# the tree is flattened once into a single shared memory block that worker
+# processes attach to by name and read in place:
+#
+#   header   MAGIC, version, node count, names offset, data offset
+#   nodes    fixed size records in breadth-first order:
+#            kind, mode, parent, name offset/length, first child,
+#            child count, data offset/length
+#   names    UTF-8 entry names
+#   data     UTF-8 file contents and symlink targets
+#
+# Breadth-first order keeps the children of a directory contiguous and they
+# are written sorted by name, so a path is resolved by bisecting each
+# directory's child range. Files sharing a blob (hard links, reflinks) share
+# their data. The view is a snapshot: later changes to the VFS are not seen.
+
+import struct
+from multiprocessing import shared_memory
+from vsystem.virtualfs import Directory, Symlink
+from vsystem.virtualbackup import permission_mode
+
+MAGIC = b"VOSSHM"
+VERSION = 1
+
+HEADER = struct.Struct("<6sBxIQQ")
+NODE = struct.Struct("<BxHIIIIIQQ")
+
+DIRECTORY, FILE, SYMLINK = 0, 1, 2
+
+
+class SharedTree:
+    """
+    Owner of an exported view. Keep it alive while workers read and call
+    close() when done, which also frees the block.
+    """
+    def __init__(self, fs, path="/"):
+        nodes, names, data = self._flatten(fs, path)
+        names_offset = HEADER.size + NODE.size * len(nodes)
+        data_offset = names_offset + len(names)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, data_offset + len(data)))
+        self.name = self.memory.name
+        self.size = data_offset + len(data)
+        buffer = self.memory.buf
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, len(nodes), names_offset, data_offset)
+        for index, node in enumerate(nodes):
+            NODE.pack_into(buffer, HEADER.size + index * NODE.size, *node)
+        buffer[names_offset:data_offset] = names
+        buffer[data_offset:self.size] = data
+        fs.kernel.log_command(f"Exported {path} to shared memory {self.name}: {len(nodes)} nodes, {self.size} bytes")
+
+    @staticmethod
+    def _flatten(fs, path):
+        nodes = []
+        names = bytearray()
+        data = bytearray()
+        blobs = {}  # id(blob) -> (offset, length), shared content is stored once
+
+        def add_data(key, content):
+            if key is not None and key in blobs:
+                return blobs[key]
+            encoded = content.encode("utf-8")
+            location = (len(data), len(encoded))
+            data.extend(encoded)
+            if key is not None:
+                blobs[key] = location
+            return location
+
+        def add_node(kind, item, name, parent):
+            encoded = name.encode("utf-8")
+            nodes.append([kind, permission_mode(item.permissions), parent, len(names), len(encoded), 0, 0, 0, 0])
+            names.extend(encoded)
+            return len(nodes) - 1
+
+        with fs.lock.reading():
+            start = fs.find_directory(fs.root, path)
+            queue = [(start, add_node(DIRECTORY, start, start.name, 0))]
+            for directory, index in queue:
+                nodes[index][5] = len(nodes)  # Children start at the next free slot
+                # By name only: a file and a subdirectory may share one, and they do not compare
+                entries = sorted(list(directory.subdirectories.items()) + list(directory.files.items()),
+                                 key=lambda entry: entry[0])
+                for name, item in entries:
+                    if isinstance(item, Directory):
+                        queue.append((item, add_node(DIRECTORY, item, name, index)))
+                    elif isinstance(item, Symlink):
+                        child = add_node(SYMLINK, item, name, index)
+                        nodes[child][7:9] = add_data(None, item.target)
+                    else:
+                        child = add_node(FILE, item, name, index)
+                        nodes[child][7:9] = add_data(id(item.blob), item.read())
+                nodes[index][6] = len(entries)
+        return nodes, bytes(names), bytes(data)
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+class SharedTreeReader:
+    """
+    Attach to a view by name, in the exporting process or its workers. Readers are picklable, so one
+    can be handed to Pool workers as an argument or initializer.
+    """
+    def __init__(self, name):
+        self.name = name
+        # Pool workers share their parent's resource tracker, so attaching
+        # does not risk the block being unlinked when a worker exits
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.buffer = self.memory.buf
+        magic, version, self.count, self.names_offset, self.data_offset = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{name} is not a shared VFS view")
+
+    def __reduce__(self):
+        return (SharedTreeReader, (self.name,))
+
+    def node(self, index):
+        return NODE.unpack_from(self.buffer, HEADER.size + index * NODE.size)
+
+    def node_name(self, index):
+        node = self.node(index)
+        start = self.names_offset + node[3]
+        return bytes(self.buffer[start:start + node[4]]).decode("utf-8")
+
+    def lookup(self, path):
+        """
+        Index of the node at path, relative to the exported directory.
+        """
+        index = 0
+        for component in path.split("/"):
+            if not component or component == ".":
+                continue
+            kind, _, _, _, _, first, count, _, _ = self.node(index)
+            if kind != DIRECTORY:
+                raise NotADirectoryError(f"Not a directory: {path}")
+            # Children are sorted by name
+            low, high = first, first + count
+            while low < high:
+                middle = (low + high) // 2
+                if self.node_name(middle) < component:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == first + count or self.node_name(low) != component:
+                raise FileNotFoundError(f"Item '{path}' not found.")
+            index = low
+        return index
+
+    def children(self, index):
+        kind, _, _, _, _, first, count, _, _ = self.node(index)
+        return range(first, first + count) if kind == DIRECTORY else range(0)
+
+    def listdir(self, path="/"):
+        return [self.node_name(child) for child in self.children(self.lookup(path))]
+
+    def content(self, index):
+        """
+        Contents of a file node as a memoryview into the shared block, no
+        copy is made. Release the view before the reader is closed.
+        """
+        _, _, _, _, _, _, _, offset, length = self.node(index)
+        start = self.data_offset + offset
+        return self.buffer[start:start + length]
+
+    def read_bytes(self, path):
+        return self.content(self.lookup(path))
+
+    def read(self, path):
+        with self.read_bytes(path) as view:
+            return str(view, "utf-8")
+
+    def files(self, path="/"):
+        """
+        (path, node index) of every regular file below path.
+        """
+        stack = [(path.rstrip("/"), self.lookup(path))]
+        while stack:
+            directory_path, index = stack.pop()
+            for child in self.children(index):
+                kind = self.node(child)[0]
+                child_path = f"{directory_path}/{self.node_name(child)}"
+                if kind == DIRECTORY:
+                    stack.append((child_path, child))
+                elif kind == FILE:
+                    yield child_path, child
+
+    def close(self):
+        self.buffer.release()
+        self.memory.close()
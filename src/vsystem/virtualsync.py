@@ -0,0 +1,253 @@
+# virtualsync.py
+#
+# Mirroring between a VFS subtree and a host directory.
+#
+# Files are compared by size and sha256, hashed on a thread pool (hashlib
+# releases the GIL for large buffers), and only files that differ are
+# copied. Host files at or above mmap_threshold are memory-mapped for the
+# comparison instead of read.
+#
+# A changed file is copied whole. VFS files hold their whole content, so an
+# import has to replace it anyway, and on the host a changed file is written
+# to a temporary file and swapped in with os.replace so an interrupted export
+# never leaves it half patched.
+#
+# VFS content is text: host files that are not valid UTF-8 are not
+# imported, they are listed in SyncStats.skipped instead.
+
+import os
+import mmap
+import json
+import hashlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from vsystem.virtualfs import File, generations
+
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def same_content(data, other):
+    return len(data) == len(other) and hashlib.sha256(data).digest() == hashlib.sha256(other).digest()
+
+
+class SyncStats:
+    def __init__(self):
+        self.checked = 0
+        self.transferred = 0
+        self.deleted = 0
+        self.bytes_written = 0
+        self.skipped = []  # Host files that are not UTF-8 text
+        self.conflicts = []  # Changed on both sides since the last sync
+
+    def count_transfer(self, size):
+        self.transferred += 1
+        self.bytes_written += size
+
+    def summary(self):
+        summary = (f"{self.checked} file(s) checked, {self.transferred} transferred, {self.deleted} deleted, "
+                   f"{self.bytes_written} bytes written")
+        if self.skipped:
+            summary += f"\n{len(self.skipped)} binary file(s) skipped: {', '.join(sorted(self.skipped))}"
+        return summary
+
+
+class HostSync:
+    def __init__(self, fs, workers=None, mmap_threshold=MMAP_THRESHOLD, state_path=None):
+        self.fs = fs
+        self.workers = workers or os.cpu_count() or 1
+        self.mmap_threshold = mmap_threshold
+        # Host file stats and VFS generation at the last sync of each pair
+        self.state_path = state_path or os.path.abspath("../src/vinit/sync.state")
+
+    @contextmanager
+    def open_host(self, path):
+        """
+        Host file contents as bytes, or as a read-only mapping for big files.
+        """
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < self.mmap_threshold:
+                yield file.read()
+                return
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapping
+        finally:
+            mapping.close()
+
+    def host_files(self, host_dir):
+        """
+        Regular files below host_dir, keyed by path relative to it.
+        """
+        files = {}
+        for directory, subdirectories, names in os.walk(host_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                if os.path.isfile(path) and not os.path.islink(path):
+                    files[os.path.relpath(path, host_dir)] = path
+        return files
+
+    def vfs_files(self, directory, prefix=""):
+        """
+        Regular files below a VFS directory, keyed by relative path.
+        """
+        files = {}
+        for name, file in directory.files.items():
+            if isinstance(file, File):
+                files[os.path.join(prefix, name)] = file
+        for name, subdirectory in directory.subdirectories.items():
+            files.update(self.vfs_files(subdirectory, os.path.join(prefix, name)))
+        return files
+
+    def _vfs_path(self, vfs_root, relative):
+        return os.path.join(vfs_root.get_full_path() or "/", relative)
+
+    def import_tree(self, host_dir, vfs_path, delete=False, only=None, stats=None):
+        """
+        Mirror a host directory into a VFS directory.
+
+        Parameters:
+            host_dir (str): Source directory on the host.
+            vfs_path (str): Destination VFS directory, created if missing.
+            delete (bool): Remove VFS files that are not on the host.
+            only (set): Restrict the transfer to these relative paths.
+
+        Returns:
+            SyncStats: What was checked and transferred.
+        """
+        stats = stats or SyncStats()
+        if not os.path.isdir(host_dir):
+            raise FileNotFoundError(f"Host directory '{host_dir}' not found")
+        self.fs.create_directory(vfs_path)
+        vfs_root = self.fs.find_directory(self.fs.root, vfs_path)
+        sources = self.host_files(host_dir)
+        targets = self.vfs_files(vfs_root)
+        if only is not None:
+            sources = {relative: path for relative, path in sources.items() if relative in only}
+
+        # Read VFS content here, the decompressed cache is not thread safe
+        work = [(relative, path, targets[relative].read().encode("utf-8") if relative in targets else None)
+                for relative, path in sources.items()]
+
+        def plan(item):
+            # (relative, text or None if unchanged, whether the file is binary)
+            relative, path, basis = item
+            with self.open_host(path) as data:
+                if basis is not None and same_content(basis, data):
+                    return relative, None, False
+                try:
+                    return relative, str(data, "utf-8"), False
+                except UnicodeDecodeError:
+                    return relative, None, True
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for relative, content, binary in pool.map(plan, work):
+                stats.checked += 1
+                if binary:
+                    stats.skipped.append(relative)
+                if content is None:
+                    continue
+                path = self._vfs_path(vfs_root, relative)
+                self.fs.create_directory(os.path.dirname(path))
+                self.fs.update_file(path, content)
+                stats.count_transfer(len(content.encode("utf-8")))
+
+        if delete and only is None:
+            for relative in sorted(set(targets) - set(sources)):
+                self.fs.remove_file(self._vfs_path(vfs_root, relative))
+                stats.deleted += 1
+        self.fs.kernel.log_command(f"Imported {host_dir} into {vfs_path}: {stats.summary()}")
+        return stats
+
+    def export_tree(self, vfs_path, host_dir, delete=False, only=None, stats=None):
+        """
+        Mirror a VFS directory into a host directory. Changed host files are
+        written to a temporary file and swapped in with os.replace.
+        """
+        stats = stats or SyncStats()
+        vfs_root = self.fs.find_directory(self.fs.root, vfs_path)
+        os.makedirs(host_dir, exist_ok=True)
+        sources = self.vfs_files(vfs_root)
+        targets = self.host_files(host_dir)
+        if only is not None:
+            sources = {relative: file for relative, file in sources.items() if relative in only}
+        work = [(relative, file.read().encode("utf-8")) for relative, file in sources.items()]
+
+        def transfer(item):
+            relative, data = item
+            path = os.path.join(host_dir, relative)
+            if relative not in targets:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            else:
+                with self.open_host(path) as current:
+                    if same_content(current, data):
+                        return None
+            temp_path = path + ".vos-sync"
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+            return len(data)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for size in pool.map(transfer, work):
+                stats.checked += 1
+                if size is not None:
+                    stats.count_transfer(size)
+
+        if delete and only is None:
+            for relative in sorted(set(targets) - set(sources)):
+                os.remove(targets[relative])
+                stats.deleted += 1
+        self.fs.kernel.log_command(f"Exported {vfs_path} to {host_dir}: {stats.summary()}")
+        return stats
+
+    def sync(self, host_dir, vfs_path):
+        """
+        Two-way sync: files changed on the host since the last sync are
+        imported, files changed in the VFS are exported. When both sides
+        changed a file the host copy wins. Deletions are not propagated.
+        """
+        key = f"{vfs_path}\t{os.path.abspath(host_dir)}"
+        state = self._load_state()
+        previous = state.get(key, {"generation": -1, "host": {}})
+        if previous["generation"] > generations.value:
+            previous = {"generation": -1, "host": {}}
+        self.fs.create_directory(vfs_path)
+        vfs_root = self.fs.find_directory(self.fs.root, vfs_path)
+        base = vfs_root.get_full_path() or "/"
+
+        host_changed = set()
+        for relative, path in self.host_files(host_dir).items():
+            stat = os.stat(path)
+            if previous["host"].get(relative) != [stat.st_size, stat.st_mtime_ns]:
+                host_changed.add(relative)
+        vfs_changed = {os.path.relpath(path, base) for path, item in self.fs.changed_since(previous["generation"], base)
+                       if isinstance(item, File)}
+
+        stats = SyncStats()
+        stats.conflicts = sorted(host_changed & vfs_changed)
+        self.import_tree(host_dir, vfs_path, only=host_changed, stats=stats)
+        # Nodes stamped by the import above are not changes to send back
+        generation = generations.value
+        self.export_tree(vfs_path, host_dir, only=vfs_changed - host_changed, stats=stats)
+
+        host = {}
+        for relative, path in self.host_files(host_dir).items():
+            stat = os.stat(path)
+            host[relative] = [stat.st_size, stat.st_mtime_ns]
+        state[key] = {"generation": generation, "host": host}
+        self._save_state(state)
+        return stats
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(temp_path, self.state_path)
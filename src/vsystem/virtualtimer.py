@@ -0,0 +1,254 @@
+# virtualtimer.py
+#
+# Hierarchical timer wheel.
+#
+# Time is counted in ticks of TICK seconds. A timer due within 256 ticks
+# sits in a slot of the first wheel, indexed by its expiry tick; later
+# timers sit in coarser wheels of 64 slots, each slot covering a whole lap
+# of the wheel below:
+#
+#   level 0  256 slots x 1 tick     2.56 s
+#   level 1   64 slots x 256 ticks  2.7 min
+#   level 2   64 slots x 2^14       2.9 h
+#   level 3   64 slots x 2^20       7.8 days, later timers wait here too
+#
+# Each time the first wheel wraps, the matching slot of the next wheel is
+# cascaded: its timers are re-inserted and land in the level below. Slots
+# are dicts, so inserting and cancelling a timer are both O(1) whatever the
+# number of pending timers.
+#
+# The wheel runs in its own thread ("timerd") that sleeps until the next
+# occupied slot of the first wheel or the next cascade, never tick by tick,
+# so even 10^5 pending timers cost next to nothing while idle. Callbacks
+# run on that thread and must be quick; anything slow should start a
+# process instead.
+#
+# Every VirtualKernel shares one wheel, see get_timer_wheel().
+
+import time
+import threading
+from vsystem.virtuallog import ERROR
+
+TICK = 0.01
+ROOT_BITS = 8
+LEVEL_BITS = 6
+LEVELS = 4
+ROOT_SIZE = 1 << ROOT_BITS
+LEVEL_SIZE = 1 << LEVEL_BITS
+MAX_DELTA = 1 << (ROOT_BITS + LEVEL_BITS * (LEVELS - 1))
+
+_wheel = None
+_wheel_lock = threading.Lock()
+
+
+def get_timer_wheel(log=None):
+    """
+    The shared timer wheel, started on first use.
+
+    Parameters:
+        log: KernelMessage.log style function for failing callbacks.
+    """
+    global _wheel
+    with _wheel_lock:
+        if _wheel is None:
+            _wheel = TimerWheel(log=log)
+            _wheel.start()
+        return _wheel
+
+
+class Timer:
+    __slots__ = ("expires", "interval", "callback", "args", "slot", "outer")
+
+    def __init__(self, expires, interval, callback, args):
+        self.expires = expires  # Tick
+        self.interval = interval  # Ticks between runs of a periodic timer
+        self.callback = callback
+        self.args = args
+        self.slot = None  # Dict holding the timer while it is pending
+        self.outer = False  # In a wheel above level 0
+
+    @property
+    def pending(self):
+        return self.slot is not None
+
+
+class TimerWheel:
+    def __init__(self, tick=TICK, log=None):
+        self.tick = tick
+        self.log = log
+        self.origin = time.monotonic()
+        self.current = 0  # Next tick to process
+        self.wheels = [[{} for _ in range(ROOT_SIZE)]]
+        self.wheels += [[{} for _ in range(LEVEL_SIZE)] for _ in range(LEVELS - 1)]
+        self.pending = 0
+        self.outer = 0  # Pending timers above level 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.wake_tick = None  # Tick timerd sleeps until, None while idle
+        self.running = False
+        self.thread = None
+
+    def __len__(self):
+        return self.pending
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name="timerd", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            with self.lock:
+                self.running = False
+                self.changed.notify()
+            self.thread.join()
+            self.thread = None
+
+    def now(self):
+        return int((time.monotonic() - self.origin) / self.tick)
+
+    def call_later(self, delay, callback, *args):
+        """
+        Call callback(*args) on timerd after delay seconds. Thread-safe.
+
+        Returns:
+            Timer: Pass it to cancel().
+        """
+        return self._add(delay, 0, callback, args)
+
+    def call_every(self, interval, callback, *args):
+        """
+        Call callback(*args) every interval seconds until cancelled.
+        """
+        return self._add(interval, max(1, round(interval / self.tick)), callback, args)
+
+    def _add(self, delay, interval, callback, args):
+        ticks = max(1, -(-delay // self.tick))  # Whole ticks, rounded up
+        with self.lock:
+            timer = Timer(max(self.now(), self.current) + int(ticks), interval, callback, args)
+            self._insert(timer)
+            if self.wake_tick is None or timer.expires < self.wake_tick:
+                self.changed.notify()
+        return timer
+
+    def cancel(self, timer):
+        with self.lock:
+            if timer.slot is None:
+                return False
+            self._unlink(timer)
+            timer.interval = 0  # A periodic timer firing right now is not re-armed
+            return True
+
+    # Everything below is called with the lock held
+
+    def _insert(self, timer):
+        delta = timer.expires - self.current
+        if delta < ROOT_SIZE:
+            slot = self.wheels[0][max(timer.expires, self.current) & (ROOT_SIZE - 1)]
+        else:
+            if delta >= MAX_DELTA:
+                expires = self.current + MAX_DELTA - 1  # Re-inserted when cascaded
+            else:
+                expires = timer.expires
+            level = 1
+            while delta >= 1 << (ROOT_BITS + LEVEL_BITS * level) and level < LEVELS - 1:
+                level += 1
+            shift = ROOT_BITS + LEVEL_BITS * (level - 1)
+            slot = self.wheels[level][(expires >> shift) & (LEVEL_SIZE - 1)]
+            self.outer += 1
+        slot[timer] = None
+        timer.slot = slot
+        timer.outer = delta >= ROOT_SIZE
+        self.pending += 1
+
+    def _unlink(self, timer):
+        del timer.slot[timer]
+        timer.slot = None
+        self.pending -= 1
+        if timer.outer:
+            self.outer -= 1
+
+    def _cascade(self, level):
+        shift = ROOT_BITS + LEVEL_BITS * (level - 1)
+        index = (self.current >> shift) & (LEVEL_SIZE - 1)
+        slot = self.wheels[level][index]
+        if slot:
+            timers = list(slot)
+            slot.clear()
+            self.pending -= len(timers)
+            self.outer -= len(timers)
+            for timer in timers:
+                self._insert(timer)
+        return index
+
+    def _advance(self, until):
+        """
+        Process every tick before until; returns the timers that expired.
+        """
+        expired = []
+        while self.current < until:
+            index = self.current & (ROOT_SIZE - 1)
+            if index == 0 and self.outer:
+                level = 1
+                while level < LEVELS and self._cascade(level) == 0:
+                    level += 1
+            slot = self.wheels[0][index]
+            if slot:
+                for timer in slot:
+                    timer.slot = None
+                expired.extend(slot)
+                self.pending -= len(slot)
+                slot.clear()
+            elif not self.outer and not self.pending:
+                self.current = until  # Nothing left to fire or cascade
+                break
+            self.current += 1
+        return expired
+
+    def _next_tick(self):
+        """
+        First tick at which there may be work, None if there are no timers.
+        """
+        if not self.pending:
+            return None
+        base = self.current & (ROOT_SIZE - 1)
+        root = self.wheels[0]
+        limit = ROOT_SIZE - base if self.outer else ROOT_SIZE
+        for offset in range(limit):
+            if root[(base + offset) & (ROOT_SIZE - 1)]:
+                return self.current + offset
+        # Only outer timers left: wake at the next cascade
+        return self.current + ROOT_SIZE - base
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while self.running:
+                    now = self.now()
+                    if self.current <= now:
+                        expired = self._advance(now + 1)
+                        if expired:
+                            break
+                    self.wake_tick = self._next_tick()
+                    if self.wake_tick is None:
+                        self.changed.wait()
+                    else:
+                        delay = (self.wake_tick * self.tick) - (time.monotonic() - self.origin)
+                        if delay > 0:
+                            self.changed.wait(delay)
+                    self.wake_tick = None
+                else:
+                    return
+            for timer in expired:
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    if self.log is not None:
+                        self.log(ERROR, "timerd", "timer callback %r failed: %s", timer.callback, e)
+                if timer.interval:
+                    with self.lock:
+                        if timer.interval and timer.slot is None:
+                            timer.expires = max(timer.expires + timer.interval, self.current)
+                            self._insert(timer)
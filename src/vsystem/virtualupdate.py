@@ -0,0 +1,187 @@
+# virtualupdate.py
+#
+# Offline delta updates from a local archive or directory.
+#
+# The source is a zip of the repository (a GitHub archive or any zip with
+# a src/ directory) or a directory holding such a tree. Members are
+# streamed one at a time and only changed files are written:
+#
+#   size differs      changed, written without further checks
+#   size is the same  the member is hashed while streaming and compared with
+#                     the local file's digest from the integrity cache, so
+#                     unchanged local files are not even read
+#
+# A changed file is streamed to a temporary file next to its destination
+# and moved into place with os.replace, so an interrupted update never
+# leaves a half-written component. Runtime state (accounts, the VFS image,
+# logs) is never overwritten, and members whose path would leave the tree
+# are refused.
+
+import os
+import time
+import stat
+import hashlib
+import fnmatch
+from zipfile import ZipFile, is_zipfile
+from vsystem.virtualintegrity import SRC_DIR, CHUNK_SIZE
+
+PRESERVE = ["vinit/passwd", "vinit/passwd.*", "vinit/boot.img", "vinit/file_system.json", "vinit/dmesg*",
+            "vinit/export.gen", "vinit/sync.state", "vinit/checksum.cache", "*.tmp", "*/__pycache__/*"]
+
+
+class UpdateReport:
+    __slots__ = ("changed", "unchanged", "preserved", "bytes_written", "bytes_saved", "elapsed")
+
+    def __init__(self):
+        self.changed = []  # Relative paths written
+        self.unchanged = 0
+        self.preserved = 0
+        self.bytes_written = 0
+        self.bytes_saved = 0  # Bytes of unchanged files that were not written
+        self.elapsed = 0.0
+
+
+def _hash_stream(stream):
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk)
+
+
+class ZipSource:
+    """
+    Members of a zip under its src/ directory, or under its single top
+    level directory if it has no src/.
+    """
+    def __init__(self, path):
+        self.archive = ZipFile(path, "r")
+        names = [info.filename for info in self.archive.infolist() if not info.is_dir()]
+        self.prefix = ""
+        for name in names:
+            parts = name.split("/")
+            if "src" in parts[:-1]:
+                self.prefix = "/".join(parts[:parts.index("src") + 1]) + "/"
+                break
+        else:
+            tops = {name.split("/", 1)[0] for name in names}
+            if len(tops) == 1 and all("/" in name for name in names):
+                self.prefix = tops.pop() + "/"
+
+    def entries(self):
+        # (relative path, size, mode or None)
+        for info in self.archive.infolist():
+            if info.is_dir() or not info.filename.startswith(self.prefix):
+                continue
+            mode = (info.external_attr >> 16) & 0o777
+            yield info.filename[len(self.prefix):], info.file_size, mode or None
+
+    def open(self, name):
+        return self.archive.open(self.prefix + name, "r")
+
+    def close(self):
+        self.archive.close()
+
+
+class DirectorySource:
+    """
+    Files below a directory, or below its src/ subdirectory if it has one.
+    """
+    def __init__(self, path):
+        self.root = os.path.join(path, "src") if os.path.isdir(os.path.join(path, "src")) else path
+
+    def entries(self):
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                info = os.stat(path)
+                yield os.path.relpath(path, self.root).replace(os.sep, "/"), info.st_size, stat.S_IMODE(info.st_mode)
+
+    def open(self, name):
+        return open(os.path.join(self.root, name), "rb")
+
+    def close(self):
+        pass
+
+
+def open_source(path):
+    if os.path.isdir(path):
+        return DirectorySource(path)
+    if is_zipfile(path):
+        return ZipSource(path)
+    raise ValueError(f"{path} is neither a directory nor a zip archive")
+
+
+class DeltaUpdater:
+    def __init__(self, integrity, root=SRC_DIR, preserve=PRESERVE):
+        """
+        Parameters:
+            integrity (IntegrityService): Digests of the installed files.
+            root (str): Installation to update.
+        """
+        self.integrity = integrity
+        self.root = os.path.abspath(root)
+        self.preserve = preserve
+
+    def _destination(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError(f"Refusing to write outside the installation: {name}")
+        return path
+
+    def update(self, source_path, dry_run=False):
+        """
+        Apply the files of source_path that differ from the installation.
+
+        Returns:
+            UpdateReport
+        """
+        report = UpdateReport()
+        start = time.perf_counter()
+        source = open_source(source_path)
+        try:
+            for name, size, mode in source.entries():
+                if any(fnmatch.fnmatch(name, pattern) for pattern in self.preserve):
+                    report.preserved += 1
+                    continue
+                path = self._destination(name)
+                if os.path.isfile(path) and os.path.getsize(path) == size:
+                    local = self.integrity.digest(path)
+                    with source.open(name) as stream:
+                        if _hash_stream(stream) == local:
+                            report.unchanged += 1
+                            report.bytes_saved += size
+                            continue
+                report.changed.append(name)
+                report.bytes_written += size
+                if not dry_run:
+                    self._install(source, name, path, mode)
+        finally:
+            source.close()
+            self.integrity.save()
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def _install(self, source, name, path, mode):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        digest = hashlib.sha256()
+        try:
+            with source.open(name) as stream, open(temp_path, "wb") as file:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    file.write(chunk)
+            if mode is not None:
+                os.chmod(temp_path, mode)
+            elif os.path.exists(path):
+                os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.integrity.record(path, digest.hexdigest())
@@ -0,0 +1,208 @@
+# virtualusers.py
+#
+# In-memory user database backed by vinit/passwd.
+#
+# The passwd file has one account per line:
+#
+#   username:password hash:uid:gid:home directory:shell
+#
+# It is read once into dicts indexed by username and by uid. Lookups only
+# stat the file and re-read it if its mtime or size changed, e.g. after it
+# was edited by hand. Changes are written back by replacing the whole file
+# atomically (temporary file, then os.replace), so a crash never leaves a
+# half-written passwd. Inside batch() the write-back is deferred to the end
+# of the block, so importing 10^4 accounts costs one write.
+#
+# Every PasswordFile for the same path shares one database, see
+# user_database().
+
+import os
+import threading
+from contextlib import contextmanager
+from vsystem.virtuallog import WARNING
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def user_database(path, log=None):
+    """
+    The shared database of the passwd file at path, loaded on first use.
+
+    Parameters:
+        log: KernelMessage.log style function for lines that cannot be read.
+    """
+    path = os.path.abspath(path)
+    with _databases_lock:
+        database = _databases.get(path)
+        if database is None:
+            database = _databases[path] = UserDatabase(path, log=log)
+        return database
+
+
+class UserRecord:
+    __slots__ = ("username", "password", "uid", "gid", "home_dir", "shell")
+
+    def __init__(self, username, password, uid, gid, home_dir, shell):
+        self.username = username
+        self.password = password  # Hash, never the password itself
+        self.uid = str(uid)
+        self.gid = str(gid)
+        self.home_dir = home_dir
+        self.shell = shell
+
+    @classmethod
+    def from_line(cls, line):
+        parts = line.rstrip("\n").split(":")
+        if len(parts) != 6:
+            raise ValueError(f"Malformed passwd entry: {line.strip()}")
+        return cls(*parts)
+
+    def to_line(self):
+        return f"{self.username}:{self.password}:{self.uid}:{self.gid}:{self.home_dir}:{self.shell}\n"
+
+    def fields(self):
+        # The list PasswordFile.get_user has always returned
+        return [self.username, self.password, self.uid, self.gid, self.home_dir, self.shell]
+
+
+class UserDatabase:
+    def __init__(self, path, log=None):
+        self.path = path
+        self.log = log
+        self.by_name = {}  # username -> UserRecord, in file order
+        self.by_uid = {}  # uid -> UserRecord
+        self.stamp = None  # (mtime_ns, size) of the file as last read or written
+        self.lock = threading.RLock()
+        self.batching = 0
+        self.dirty = False
+        self.writes = 0
+
+    def __len__(self):
+        with self.lock:
+            self.refresh()
+            return len(self.by_name)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        """
+        Re-read the file if it changed on disk since it was last read or
+        written. Unsaved changes inside a batch are kept.
+        """
+        with self.lock:
+            stamp = self._stat()
+            if stamp == self.stamp or self.dirty:
+                return
+            by_name, by_uid = {}, {}
+            if stamp is not None:
+                with open(self.path, "r") as file:
+                    for number, line in enumerate(file, 1):
+                        if not line.strip():
+                            continue
+                        # One bad line must not lock every account out
+                        try:
+                            record = UserRecord.from_line(line)
+                        except ValueError as e:
+                            if self.log is not None:
+                                self.log(WARNING, "passwd", "%s:%d: %s", self.path, number, e)
+                            continue
+                        by_name[record.username] = record
+                        by_uid[record.uid] = record
+            self.by_name, self.by_uid, self.stamp = by_name, by_uid, stamp
+
+    def get(self, username):
+        with self.lock:
+            self.refresh()
+            return self.by_name.get(username)
+
+    def get_by_uid(self, uid):
+        with self.lock:
+            self.refresh()
+            return self.by_uid.get(str(uid))
+
+    def first(self):
+        """
+        The first account in the file, None if there is none.
+        """
+        with self.lock:
+            self.refresh()
+            return next(iter(self.by_name.values()), None)
+
+    def users(self):
+        with self.lock:
+            self.refresh()
+            return list(self.by_name.values())
+
+    @contextmanager
+    def batch(self):
+        """
+        Defer writing changes back until the outermost batch ends.
+        """
+        with self.lock:
+            self.refresh()
+            self.batching += 1
+            try:
+                yield self
+            finally:
+                self.batching -= 1
+                if not self.batching and self.dirty:
+                    self._write()
+
+    def _changed(self):
+        self.dirty = True
+        if not self.batching:
+            self._write()
+
+    def add(self, record):
+        """
+        Raises:
+            ValueError: If the username is empty, contains ':' or whitespace,
+            or if the username or uid is already taken.
+        """
+        username = record.username
+        if not username or ":" in username or any(c.isspace() for c in username):
+            raise ValueError(f"Invalid username: {username!r}")
+        with self.lock:
+            self.refresh()
+            if record.username in self.by_name:
+                raise ValueError(f"User '{record.username}' already exists")
+            if record.uid in self.by_uid:
+                raise ValueError(f"UID {record.uid} is already taken")
+            self.by_name[record.username] = record
+            self.by_uid[record.uid] = record
+            self._changed()
+
+    def remove(self, username):
+        with self.lock:
+            self.refresh()
+            record = self.by_name.pop(username, None)
+            if record is None:
+                return False
+            self.by_uid.pop(record.uid, None)
+            self._changed()
+            return True
+
+    def set_password(self, username, password):
+        with self.lock:
+            self.refresh()
+            record = self.by_name.get(username)
+            if record is None:
+                return False
+            record.password = password
+            self._changed()
+            return True
+
+    def _write(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            file.write("".join(record.to_line() for record in self.by_name.values()))
+        os.replace(temp_path, self.path)
+        self.stamp = self._stat()
+        self.dirty = False
+        self.writes += 1
@@ -16,8 +16,10 @@ from rich.panel import Panel
 from rich.text import Text
 
 
+from vsystem.virtuallog import DEBUG
+from vsystem.virtualacct import charged_command
+from vsystem.virtualqshell import QShellError
 from vapi.vapi import  (establish_directory,
-                        qshell_instance_sys,
                         vm_addresstools_instance,
                         get_active_user,
                         home_fs_init,
@@ -27,6 +29,7 @@ from vapi.vapi import  (establish_directory,
                         fs_instance,
                         kernel_instance,
                         vproc_instance,
+                        scrubber_instance,
                         passwordtools_instance,
                         vm_wallet_instance,
                         vm_instance)
@@ -67,9 +70,10 @@ class QShell(Screen[str]):
     global home_init
     home_init = False
     kernel = kernel_instance()
+    shell_pid = kernel.create_process("qshell", True)  # Commands are accounted to this process
     addrtools = vm_addresstools_instance()
-    qshell = qshell_instance_sys
     fs = fs_instance()
+    scrubber = scrubber_instance(fs)
     vproc_instance = vproc_instance()
     active_user_init = get_active_user()
     home_fs = home_fs_init(active_user_init)
@@ -83,6 +87,7 @@ class QShell(Screen[str]):
             yield TerminalWidget
 
     @on(Input.Submitted)
+    @charged_command
     def execute_command(self):
         self.history = []
         self.passwordtools_instance = passwordtools_instance
@@ -122,17 +127,17 @@ class QShell(Screen[str]):
                     self.notify("QShell already running", title="vOS App Manager", severity="warning", timeout=1.5)
             elif command.startswith("shutdown"):
                 vproc_instance.shutdown_vproc(self)
-                self.fs.save_file_system("file_system.json")  # Save filesystem
+                self.fs.save_file_system("file_system.json").result()  # Save filesystem, and wait for it
                 parts = command.split(" ", 1)
                 if len(parts) > 1 and parts[1] == "--debug":
-                    pass
+                    self.kernel.flush_dmesg()  # Keep the log, with everything still queued
                 else:
                     self.kernel.delete_dmesg()  # Delete dmesg file on exit
                 self.display = False
                 self.notify("VirtualOS Shutdown Completed!")
                 exit()
             elif command.startswith("su"):
-                auth = self.passwordtools_instance.su_prompt()
+                auth = self.kernel.password_file.su_prompt()
                 if auth:
                         parts = command.split(" ", 1)
                         permissions = parts[1] if len(parts) > 1 else "rwxrwxrwx"
@@ -141,6 +146,22 @@ class QShell(Screen[str]):
             elif command.startswith(f"whoami"):
                 self.append_output(f"{self.active_user}\n")
 
+            elif command.startswith("history "):
+                parts = command.split(" ")
+                enable = True if "--enable" in parts else False if "--disable" in parts else None
+                keep = None
+                if "--keep" in parts:
+                    index = parts.index("--keep")
+                    keep = int(parts[index + 1])
+                    del parts[index:index + 2]
+                _, path = [part for part in parts if part not in ("--enable", "--disable")]
+                for line in VCommands.history(self.fs, self.current_directory, path, enable, keep):
+                    self.append_output(line + "\n")
+
+            elif command.startswith("restore"):
+                _, path, version = command.split(" ", 2)
+                self.append_output(VCommands.restore(self.fs, self.current_directory, path, version) + "\n")
+
             elif command.startswith("history"):
                 if not self.history:
                     self.append_output("Command history is empty.")
@@ -169,8 +190,58 @@ class QShell(Screen[str]):
             elif command.startswith("fstree"):
                 self.dismiss("fstree")
 
+            elif command == "jobs":
+                for line in VCommands.jobs(self.kernel):
+                    self.append_output(line + "\n")
+
+            elif command.startswith("renice"):
+                parts = command.split(" ")
+                self.append_output(VCommands.renice(self.kernel, *parts[1:3]) + "\n")
+
+            elif command.startswith("verify"):
+                parts = command.split(" ")
+                # Recording new checksums would accept tampered components
+                if "--update" not in parts[1:2] or self.su_check(command):
+                    for line in VCommands.verify(self.kernel, *parts[1:2]):
+                        self.append_output(line + "\n")
+
+            elif command.startswith("crontab"):
+                parts = command.split(" ")
+                for line in VCommands.crontab(self.kernel, *parts[1:2]):
+                    self.append_output(line + "\n")
+
+            elif command.startswith("ipcmk"):
+                parts = command.split(" ")
+                self.append_output(VCommands.ipcmk(self.kernel, *parts[1:4]) + "\n")
+
+            elif command == "ipcs":
+                for line in VCommands.ipcs():
+                    self.append_output(line + "\n")
+
+            elif command.startswith("ipcrm"):
+                parts = command.split(" ")
+                self.append_output(VCommands.ipcrm(self.kernel, *parts[1:2]) + "\n")
+
+            elif command.startswith("ipcsend"):
+                parts = command.split(" ", 2)
+                self.append_output(VCommands.ipcsend(*parts[1:3]) + "\n")
+
+            elif command.startswith("ipcrecv"):
+                parts = command.split(" ")
+                self.append_output(VCommands.ipcrecv(*parts[1:3]) + "\n")
+
             elif command.startswith("sysmon"):
-                self.vproc_instance.monitor_processes(self)
+                parts = command.split()
+                position = parts.index("--sort") + 1 if "--sort" in parts else None
+                memory = True if "--memory" in parts else False if "--no-memory" in parts else None
+                if position is not None and (position >= len(parts) or parts[position].startswith("--")):
+                    self.append_output("Usage: sysmon [--sort key] [--memory|--no-memory]\n")
+                else:
+                    sort = parts[position] if position is not None else "pid"
+                    try:
+                        self.vproc_instance.monitor_processes(self, sort, memory)
+                    except ValueError as e:
+                        self.append_output(f"Error: {e}\n")
 
             elif command.startswith("diff"):
                 _, path1, path2 = command.split(" ", 2)
@@ -183,24 +254,35 @@ class QShell(Screen[str]):
 
             elif command.startswith("qscript"):
                 _, path = command.split(" ", 1)
-                filepath = self.current_directory.get_full_path() + "/" + path
+                filepath = path if path.startswith("/") else self.current_directory.get_full_path() + "/" + path
                 self.kernel.log_command(f"qshell: {filepath}")
                 if self.fs.file_exists(filepath):
-                    qshell_commands = self.qshell.execute_script(path)
-                    for qshell_command in qshell_commands:
-                        if qshell_command:
-                            # Execute the parsed qShell command using the appropriate method from vcommands
-                            self.execute_vcommand(qshell_command)
+                    script = self.fs.read_file(filepath)
+                    if isinstance(script, bytes):
+                        script = script.decode("utf-8", errors="replace")
+                    try:
+                        self.kernel.execute_qshell_script(script, self.run_scheduled_command,
+                                                          lambda line: self.append_output(line + "\n"))
+                    except QShellError as e:
+                        self.append_output(f"qscript: {path}: {e}\n")
                 else:
-                    print(f"{path} not found")
+                    self.append_output(f"{path} not found\n")
             elif command.startswith("ls"):
                 parts = command.split(" ")
+                options = {"--offset": 0, "--limit": None, "--prefix": None}
+                for option in options:
+                    if option in parts:
+                        index = parts.index(option)
+                        options[option] = parts[index + 1]
+                        del parts[index:index + 2]
                 if len(parts) > 1:
                     _, path = parts
                 else:
                     path = self.home_dir
-                self.kernel.log_command(f"ls debug: {self.current_directory} and {path}")
-                ls_list = VCommands.ls(self.fs, self.current_directory, path)
+                self.kernel.log(DEBUG, "qshell", "ls debug: %s and %s", self.current_directory, path)
+                limit = options["--limit"]
+                ls_list = VCommands.ls(self.fs, self.current_directory, path, int(options["--offset"]),
+                                       int(limit) if limit is not None else None, options["--prefix"])
                 for i in ls_list:
                     self.append_output(i + "\n")
 
@@ -239,12 +321,40 @@ class QShell(Screen[str]):
             elif command == "run_vm":  # Command to run the virtual machine
                 self.vm.run()
 
-            elif command == "dmesg":  # Command to print virtual dmesg
+            elif command.startswith("dmesg"):  # Command to print virtual dmesg
                 #if self.su_check(command):
-                dmesg_array = self.kernel.print_dmesg()
+                parts = command.split(" ")
+                options = {"--since": None, "--level": None, "--grep": None, "--set-level": None,
+                           "--page": None, "--tail": None}
+                for option in options:
+                    if option in parts:
+                        index = parts.index(option)
+                        options[option] = parts[index + 1]
+                        del parts[index:index + 2]
+                dmesg_array = VCommands.dmesg(self.kernel, options["--since"], options["--level"],
+                                              options["--grep"], options["--set-level"],
+                                              options["--page"], options["--tail"])
                 for i in dmesg_array:
                     self.append_output(i + "\n")
 
+            elif command.startswith("tail"):
+                parts = command.split(" ")
+                if "--stop" in parts:
+                    self.stop_follow()
+                else:
+                    count = 10
+                    if "-n" in parts:
+                        index = parts.index("-n")
+                        count = int(parts[index + 1])
+                        del parts[index:index + 2]
+                    follow = "-f" in parts
+                    parts = [part for part in parts if part != "-f"]
+                    path = parts[1] if len(parts) > 1 else None
+                    for line in VCommands.tail(self.fs, self.current_directory, path, count):
+                        self.append_output(line + "\n")
+                    if follow and path == "dmesg":
+                        self.start_follow()
+
             elif command == "uptime":
                 uptime = self.kernel.get_uptime()
                 self.append_output(f"vOS uptime: {uptime}\n")
@@ -254,6 +364,12 @@ class QShell(Screen[str]):
                 if self.su_check(command):
                     self.kernel.update_vos()
 
+            elif command.startswith("update --from"):
+                if self.su_check(command):
+                    parts = command.split(" ")
+                    for line in VCommands.update(self.kernel, *parts[2:4]):
+                        self.append_output(line + "\n")
+
             elif command == "reset_fs":
                 if self.su_check(command):
                     self.fs.reset_fs()
@@ -286,15 +402,63 @@ class QShell(Screen[str]):
                 _, old_path, new_path = command.split(" ", 2)
                 VCommands.mv(self.fs, self.current_directory, old_path, new_path)
 
+            elif command.startswith("fsck"):
+                parts = command.split(" ")
+                repair = "--repair" in parts
+                parts = [part for part in parts if part != "--repair"]
+                path = parts[1] if len(parts) > 1 else None
+                for line in VCommands.fsck(self.fs, self.current_directory, path, repair):
+                    self.append_output(line + "\n")
+
+            elif command == "scrub":
+                self.append_output(self.scrubber.status() + "\n")
+
+            elif command.startswith("compress"):
+                _, codec, path = command.split(" ", 2)
+                self.append_output(VCommands.compress(self.fs, self.current_directory, codec, path) + "\n")
+
             elif command.startswith("cp"):
-                _, src_path, dest_path = command.split(" ", 2)
-                VCommands.cp(self.fs, self.current_directory, src_path, dest_path)
+                parts = command.split(" ")
+                reflink = "--reflink" in parts
+                _, src_path, dest_path = [part for part in parts if part != "--reflink"]
+                VCommands.cp(self.fs, self.current_directory, src_path, dest_path, reflink)
+
+            elif command.startswith("ln"):
+                parts = command.split(" ")
+                symbolic = "-s" in parts
+                _, target, link_path = [part for part in parts if part != "-s"]
+                result = VCommands.ln(self.fs, self.current_directory, target, link_path, symbolic)
+                if result:
+                    self.append_output(result + "\n")
+
+            elif command.startswith("export"):
+                parts = command.split(" ")
+                incremental = "--incremental" in parts
+                delete = "--delete" in parts
+                parts = [part for part in parts if part not in ("--incremental", "--delete")]
+                since = None
+                if "--since" in parts:
+                    index = parts.index("--since")
+                    since = int(parts[index + 1])
+                    del parts[index:index + 2]
+                _, path, destination = parts
+                self.append_output(VCommands.export(self.fs, self.current_directory, path, destination, incremental, since, delete) + "\n")
+
+            elif command.startswith("import"):
+                parts = command.split(" ")
+                delete = "--delete" in parts
+                _, host_dir, path = [part for part in parts if part != "--delete"]
+                self.append_output(VCommands.import_dir(self.fs, self.current_directory, host_dir, path, delete) + "\n")
+
+            elif command.startswith("sync"):
+                _, path, host_dir = command.split(" ", 2)
+                self.append_output(VCommands.sync(self.fs, self.current_directory, path, host_dir) + "\n")
 
             elif command.startswith("echo"):
                 parts = command.split(" ")
                 args = parts[1:-1]  # Extract arguments
                 file = parts[-1]  # Extract filename
-                self.kernel.log_command(f"Parts: {parts} Args: {args} File: {file}")
+                self.kernel.log(DEBUG, "qshell", "Parts: %s Args: %s File: %s", parts, args, file)
                 if ">>" not in command and ">" not in command:
                     file = None
                     args = parts[1:]
@@ -303,29 +467,31 @@ class QShell(Screen[str]):
                     VCommands.echo(self.fs, self.current_directory, *args, file=file)
 
             elif command.startswith("logout"):
+                self.kernel.password_file.logout()
                 text_area.clear()
                 self.dismiss("logout")
 
             elif command.startswith("adduser"):
                 if self.su_check(command):
-                     _, username, password = command.split(" ", 2)
-                     passwordtools_instance.add_user(self.fs, username, password)
-                     path = "/home/" + username
-                     VCommands.mkdir(self.fs, path)
+                    parts = command.split(" ")
+                    self.append_output(VCommands.adduser(self.kernel, self.fs, self.current_directory,
+                                                         *parts[1:3]) + "\n")
 
             elif command.startswith("deluser"):
                 if self.su_check(command):
                      _, username = command.split(" ", 1)
-                     passwordtools_instance.delete_user(self.fs, username)
+                     if not self.kernel.password_file.remove_user(username):
+                         self.append_output(f"User '{username}' not found.\n")
 
             elif command.startswith("updateuser"):
                 if self.su_check(command):
                     _, username, new_password = command.split(" ", 2)
-                    passwdtools_instance.update_user(self.fs, username, new_password)
+                    if not self.kernel.password_file.update_user_password(username, new_password):
+                        self.append_output(f"User '{username}' not found.\n")
 
             elif command.startswith("readuser"):
                 _, username = command.split(" ", 1)
-                passwdtools_instance.read_user(self.fs, username)
+                self.append_output(VCommands.readuser(self.kernel, username) + "\n")
 
             elif command.startswith("wallet"):
                 if self.fs.file_exists("/usr/addr"):
@@ -366,6 +532,46 @@ class QShell(Screen[str]):
         output = self.query_one("#output", TextArea)
         output.insert(text)
 
+    def su_check(self, command):
+        # A session lookup: no passwd read and no hashing
+        sessions = self.kernel.password_file.sessions
+        if sessions.is_elevated(sessions.current):
+            return True
+        self.append_output(f"{command} requires su permission\n")
+        self.kernel.log_command(f"[!!]su_check: {self.active_user} invalid permissions for {command}")
+        return False
+
+    def on_mount(self):
+        self.kernel.start_cron(self.fs, self.run_cron_command)
+
+    def run_cron_command(self, command):
+        # Called from the cron job's pool thread; the shell runs on the UI thread
+        self.app.call_from_thread(self.run_scheduled_command, command)
+
+    def run_scheduled_command(self, command):
+        # Run command as if typed, keeping whatever the user is typing
+        command_input = self.query_one("#input", Input)
+        typed = command_input.value
+        command_input.value = command
+        self.execute_command()
+        command_input.value = typed
+
+    def start_follow(self):
+        # tail -f dmesg: poll the in-memory ring, the shell stays usable meanwhile
+        self.stop_follow()
+        self.follow_cursor, _ = self.kernel.follow_dmesg()
+        self.follow_timer = self.set_interval(1.0, self.follow_dmesg)
+
+    def follow_dmesg(self):
+        self.follow_cursor, lines = self.kernel.follow_dmesg(self.follow_cursor)
+        for line in lines:
+            self.append_output(line + "\n")
+
+    def stop_follow(self):
+        if getattr(self, "follow_timer", None) is not None:
+            self.follow_timer.stop()
+            self.follow_timer = None
+
 
 #    def on_key(self, event: events.Key) -> None:
 #        keypress = self.query_one(event)